@@ -0,0 +1,52 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from beanie import PydanticObjectId
+from py_nyc.web.core.driver_trips_logic import TripUploadFormatError, upload_format
+from py_nyc.web.core.models import DriverBenchmark, DriverHourlyEarning, TripUploadSummary
+from py_nyc.web.data_access.store.local_trip_store import TripDataNotIngestedError
+from py_nyc.web.dependencies import DriverBenchmarkLogicDep, DriverTripsLogicDep
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+from py_nyc.web.utils.auth import TokenData, get_user_info
+
+drivers_router = APIRouter(prefix='/drivers')
+
+
+@drivers_router.post('/me/trips', status_code=status.HTTP_201_CREATED)
+async def upload_trips(driver_trips_logic: DriverTripsLogicDep, file: UploadFile = File(...),
+                       user: TokenData = Depends(get_user_info)) -> TripUploadSummary:
+    """
+    Upload the signed in driver's trip history as CSV (with a header of TripSchema columns),
+    a {"trips": [...]} JSON document, a JSON array or JSON Lines. Trips already uploaded are skipped,
+    so a log can be uploaded again after fixing rejected rows.
+    """
+    try:
+        return await driver_trips_logic.upload_trips(
+            PydanticObjectId(user.id), file.file, upload_format(file.filename, file.content_type))
+    except TripUploadFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Trip logs must be UTF-8 encoded")
+
+
+@drivers_router.get('/me/earnings/hourly')
+async def get_hourly_earnings(startDate: datetime, endDate: datetime, driver_trips_logic: DriverTripsLogicDep,
+                              user: TokenData = Depends(get_user_info)) -> list[DriverHourlyEarning]:
+    """The signed in driver's uploaded trips totalled per hour, for hours from startDate up to endDate."""
+    return await driver_trips_logic.get_hourly_earnings(PydanticObjectId(user.id), startDate, endDate)
+
+
+@drivers_router.get('/me/benchmark')
+async def get_benchmark(startDate: datetime, endDate: datetime, driver_benchmark_logic: DriverBenchmarkLogicDep,
+                        dataset: str = DEFAULT_DATASET,
+                        top: int = Query(10, ge=1, le=100, description="Number of missed opportunity windows"),
+                        user: TokenData = Depends(get_user_info)) -> DriverBenchmark:
+    """
+    The signed in driver's uploaded trips against the market in the zones and hours they worked:
+    percentile ranks of pay per mile and per minute, hourly pay and missed opportunity windows.
+    """
+    if startDate >= endDate:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="startDate must be before endDate")
+    try:
+        return await driver_benchmark_logic.get_benchmark(PydanticObjectId(user.id), startDate, endDate, dataset, top)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
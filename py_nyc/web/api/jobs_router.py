@@ -0,0 +1,58 @@
+from typing import Any
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from pydantic import BaseModel, ValidationError
+from py_nyc.web.core.analytics_jobs import FAILED, JobNotFoundError, JobQueueFullError, UnknownJobKindError
+from py_nyc.web.core.models import AnalyticsJobStatus
+from py_nyc.web.dependencies import AnalyticsJobsDep
+from py_nyc.web.external.tlc_datasets import UnknownDatasetError
+
+jobs_router = APIRouter(prefix='/jobs')
+
+
+class SubmitJobRequest(BaseModel):
+    kind: str  # density, density_compare or earnings
+    params: dict  # the query parameters of the matching /trips endpoint
+
+
+@jobs_router.post('', status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(request: SubmitJobRequest, jobs: AnalyticsJobsDep, response: Response) -> AnalyticsJobStatus:
+    """
+    Run a long trip query in the background. Poll the returned job (or its Location) for progress;
+    submitting the same query again (to any API worker) returns the running job, or the finished one while its result is kept.
+    """
+    try:
+        job = await jobs.submit(request.kind, request.params)
+    except (UnknownJobKindError, UnknownDatasetError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.errors(include_url=False, include_context=False))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    response.headers["Location"] = f"{jobs_router.prefix}/{job.id}"
+    return job.describe()
+
+
+@jobs_router.get('/{job_id}')
+async def get_job(job_id: str, jobs: AnalyticsJobsDep,
+                  wait: float = Query(0, ge=0, le=60, description="Seconds to wait for the job to finish before answering")) -> AnalyticsJobStatus:
+    try:
+        job = await jobs.wait(job_id, wait)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return job.describe()
+
+
+@jobs_router.get('/{job_id}/result')
+async def get_job_result(job_id: str, jobs: AnalyticsJobsDep) -> Any:
+    """The result of a finished job, shaped like the response of the matching /trips endpoint."""
+    try:
+        job = await jobs.get(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    if job.status == FAILED:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=job.error)
+    if not job.finished:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job {job.id} is {job.status}")
+    return job.result
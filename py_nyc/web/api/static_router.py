@@ -0,0 +1,15 @@
+from typing import Optional
+from fastapi import APIRouter, Query, Request
+from py_nyc.web.data_access.store.taxi_zones import get_taxi_zones_file
+
+static_router = APIRouter(prefix='/static')
+
+
+@static_router.get('/nyc-taxi-zones.geojson')
+async def get_taxi_zones_geojson(request: Request, v: Optional[str] = Query(None, description="Content version from Content-Location")):
+    """
+    The full detail taxi zone GeoJSON, brotli or gzip compressed ahead of time as the client accepts.
+    Requested with the version in Content-Location it is cached for good; without it, it is revalidated
+    against its ETag on every use.
+    """
+    return get_taxi_zones_file().response(request, v)
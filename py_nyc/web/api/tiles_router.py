@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Path, Query, Request, status
+from py_nyc.web.core.snapshot_logic import UnknownPresetError
+from py_nyc.web.core.tiles_logic import DEFAULT_TILE_PRESET
+from py_nyc.web.data_access.store.local_trip_store import TripDataNotIngestedError
+from py_nyc.web.data_access.store.vector_tiles import InvalidTileError
+from py_nyc.web.dependencies import TilesLogicDep
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+from py_nyc.web.utils.precompressed import gzip_response
+
+tiles_router = APIRouter(prefix='/tiles')
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+@tiles_router.get('/{z}/{x}/{y}.mvt')
+async def get_zone_tile(request: Request, tiles_logic: TilesLogicDep, z: int = Path(ge=0, le=22), x: int = Path(ge=0), y: int = Path(ge=0),
+                        preset: str = DEFAULT_TILE_PRESET, startTime: int = Query(0, ge=0, le=23), endTime: int = Query(23, ge=0, le=23),
+                        dataset: str = DEFAULT_DATASET):
+    """
+    Mapbox vector tile of the taxi zones (layer "zones") with location_id, zone, borough and, over the
+    preset between startTime and endTime inclusive, density (average trip requests per hour) and earnings
+    (average driver pay per trip) as feature properties. Zones without trips have no density or earnings.
+    """
+    if startTime > endTime:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="startTime must not be after endTime")
+    try:
+        content, etag = await tiles_logic.get_tile(z, x, y, preset, startTime, endTime, dataset)
+    except InvalidTileError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except (UnknownPresetError, TripDataNotIngestedError) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return gzip_response(request, content, etag, MVT_MEDIA_TYPE, max_age=3600)
@@ -1,13 +1,239 @@
 from datetime import datetime
-from fastapi import APIRouter, Request
-from py_nyc.web.core.trips_logic import TripsLogic
+from typing import Annotated, Literal, Optional
+import pyarrow as pa
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response, status
+from py_nyc.web.core.models import DensityComparison, DensityHotspots, DensityPreset, OdHourStats, TaxiZoneGeoJSON, TopZone, TripEarning, TripFilters, ZoneAnomaly, ZoneHourStats, ZonePayDistribution
+from py_nyc.web.core.snapshot_logic import UnknownPresetError, density_path, earnings_path, zone_stats_path
+from py_nyc.web.core.trips_logic import InvalidWindowError
 from py_nyc.web.data_access.services.trip_service import TripDensity
-from py_nyc.web.dependencies import TripsLogicDep
+from py_nyc.web.data_access.store.anomalies import ANOMALY_SCORE
+from py_nyc.web.data_access.store.taxi_zones import UnknownBoroughError
+from py_nyc.web.data_access.store.local_trip_store import TripDataNotIngestedError
+from py_nyc.web.data_access.store.zone_adjacency import HOTSPOT_SCORE
+from py_nyc.web.dependencies import EarningsLogicDep, SnapshotLogicDep, TripsLogicDep, ZonesLogicDep
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET, DatasetColumnError, UnknownDatasetError
+from py_nyc.web.utils.arrow_stream import arrow_response, single_batch
+from py_nyc.web.utils.precompressed import gzip_json_response
 
 trips_router = APIRouter(prefix="/trips")
 
+DENSITY_SCHEMA = pa.schema([("location_id", pa.int32()), ("density", pa.int64())])
+EARNINGS_SCHEMA = pa.schema([("pickup_date", pa.date32()), ("pickup_hour", pa.int8()),
+                             ("total_driver_pay", pa.float64()), ("trip_count", pa.int64())])
+ExportFormat = Literal["json", "arrow", "parquet"]
+FORMAT_DESCRIPTION = "json, or arrow (Arrow IPC stream) / parquet, streamed from the aggregate arrays"
+# Hour of day bounding a density window, inclusive
+Hour = Annotated[int, Query(ge=0, le=23)]
+
 
 @trips_router.get("/density")
-def get_density(startDate: datetime, endDate: datetime, startTime: int, endTime: int, trips_logic: TripsLogicDep) -> list[TripDensity]:
-    res = trips_logic.get_density(startDate, endDate, startTime, endTime)
+async def get_density(startDate: datetime, endDate: datetime, startTime: Hour, endTime: Hour, trips_logic: TripsLogicDep, response: Response,
+                      datasets: list[str] = Query([DEFAULT_DATASET], description="TLC datasets to aggregate, e.g. hvfhv, yellow, green, fhv"),
+                      shared: Optional[bool] = Query(None, description="true: only shared ride requests, false: exclude them"),
+                      wav: Optional[bool] = Query(None, description="true: only wheelchair accessible vehicle requests, false: exclude them"),
+                      airport: Optional[bool] = Query(None, description="true: only trips charged an airport fee, false: exclude them"),
+                      format: ExportFormat = Query("json", description=FORMAT_DESCRIPTION),
+                      x_debug_query_plan: bool = Header(False, description="Return the backends chosen per segment in X-Query-Plan")) -> list[TripDensity]:
+    filters = TripFilters(shared=shared, wav=wav, airport=airport)
+    try:
+        if format != "json":
+            columns = await trips_logic.get_density_columns(startDate, endDate, startTime, endTime, datasets, filters)
+            return arrow_response(single_batch(columns), DENSITY_SCHEMA, format,
+                                  f"density-{startDate:%Y%m%d}-{endDate:%Y%m%d}")
+        res = await trips_logic.get_density(startDate, endDate, startTime, endTime, datasets, filters)
+    except (InvalidWindowError, UnknownDatasetError, DatasetColumnError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if x_debug_query_plan:
+        response.headers["X-Query-Plan"] = trips_logic.describe_query_plans()
     return res
+
+
+@trips_router.get("/density/geojson", response_model=TaxiZoneGeoJSON)
+async def get_density_geojson(startDate: datetime, endDate: datetime, startTime: Hour, endTime: Hour, trips_logic: TripsLogicDep,
+                              zones_logic: ZonesLogicDep, datasets: list[str] = Query([DEFAULT_DATASET]),
+                              zoom: Optional[int] = Query(None, ge=0, le=22, description="Simplify the geometry for this map zoom, full detail if not given")):
+    """
+    The taxi zones as GeoJSON with each feature's density (as in /trips/density, 0 for zones without
+    requests) in its properties, so clients no longer join density onto the geometry themselves.
+    """
+    try:
+        density = await trips_logic.get_density_by_zone(startDate, endDate, startTime, endTime, datasets)
+    except (InvalidWindowError, UnknownDatasetError, DatasetColumnError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(zones_logic.get_density_geojson(density, zoom), media_type="application/json")
+
+
+@trips_router.get("/density/hotspots")
+async def get_density_hotspots(startDate: datetime, endDate: datetime, startTime: Hour, endTime: Hour, trips_logic: TripsLogicDep,
+                               minScore: float = Query(HOTSPOT_SCORE, ge=0, description="Minimum Getis-Ord Gi* z-score of a hotspot"),
+                               datasets: list[str] = Query([DEFAULT_DATASET]), shared: Optional[bool] = None,
+                               wav: Optional[bool] = None, airport: Optional[bool] = None) -> DensityHotspots:
+    """
+    Density of every zone averaged with the zones sharing a border with it, which steadies small zones,
+    and the clusters of contiguous zones whose neighbourhood is significantly busier than the city.
+    """
+    try:
+        return await trips_logic.get_density_hotspots(startDate, endDate, startTime, endTime, minScore, datasets,
+                                                      TripFilters(shared=shared, wav=wav, airport=airport))
+    except (InvalidWindowError, UnknownDatasetError, DatasetColumnError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@trips_router.get("/earnings")
+async def get_earnings(startDate: datetime, endDate: datetime, earnings_logic: EarningsLogicDep,
+                       datasets: list[str] = Query([DEFAULT_DATASET]),
+                       format: ExportFormat = Query("json", description=FORMAT_DESCRIPTION)) -> list[TripEarning]:
+    """
+    Hourly driver pay and trip counts from startDate up to endDate. Arrow and Parquet exports
+    are streamed a month at a time, so any range can be exported.
+    """
+    try:
+        if format != "json":
+            return arrow_response(earnings_logic.get_earnings_batches(startDate, endDate, datasets), EARNINGS_SCHEMA, format,
+                                  f"earnings-{startDate:%Y%m%d}-{endDate:%Y%m%d}")
+        return await earnings_logic.get_earnings(startDate, endDate, datasets)
+    except (UnknownDatasetError, DatasetColumnError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@trips_router.get("/density/top")
+async def get_top_zones(startDate: datetime, endDate: datetime, startTime: Hour, endTime: Hour, trips_logic: TripsLogicDep,
+                        k: int = Query(10, ge=1, le=265, description="Number of zones"),
+                        boroughs: list[str] = Query([], description="Only zones in these boroughs, e.g. Manhattan"),
+                        datasets: list[str] = Query([DEFAULT_DATASET])) -> list[TopZone]:
+    """The k busiest zones of a window, with their names, without sending every zone's density."""
+    try:
+        return await trips_logic.get_top_zones(startDate, endDate, startTime, endTime, k, boroughs, datasets)
+    except (InvalidWindowError, UnknownDatasetError, DatasetColumnError, UnknownBoroughError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@trips_router.get("/density/compare")
+async def compare_density(startDate: datetime, endDate: datetime, startTime: Hour, endTime: Hour, trips_logic: TripsLogicDep, response: Response,
+                          offsetDays: list[int] = Query([7], description="Days to shift the base window back by, e.g. 7 and 364"),
+                          datasets: list[str] = Query([DEFAULT_DATASET]),
+                          top: int = Query(10, ge=1, le=265, description="Number of top movers per comparison"),
+                          x_debug_query_plan: bool = Header(False)) -> list[DensityComparison]:
+    """
+    Per-zone density of the base window compared with each offset window,
+    with absolute and percentage deltas and the top movers.
+    """
+    try:
+        res = await trips_logic.compare_density(startDate, endDate, startTime, endTime, offsetDays, datasets, top)
+    except (InvalidWindowError, UnknownDatasetError, DatasetColumnError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if x_debug_query_plan:
+        response.headers["X-Query-Plan"] = trips_logic.describe_query_plans()
+    return res
+
+
+@trips_router.get("/anomalies")
+async def get_anomalies(trips_logic: TripsLogicDep, startDate: Optional[datetime] = None, endDate: Optional[datetime] = None,
+                        locationIds: list[int] = Query([], description="Pickup zones, all zones when empty"),
+                        direction: Literal["both", "spike", "drop"] = "both",
+                        minScore: float = Query(ANOMALY_SCORE, ge=ANOMALY_SCORE, description="Minimum absolute modified z-score"),
+                        limit: int = Query(100, ge=1, le=1000), dataset: str = DEFAULT_DATASET) -> list[ZoneAnomaly]:
+    """
+    Zone hours whose trip requests deviated strongly from the zone's median at that hour of week,
+    strongest first, from startDate up to endDate (default: the last week of ingested data).
+    Served from the index built by the detect_anomalies job.
+    """
+    try:
+        return await trips_logic.get_anomalies(startDate, endDate, locationIds, direction, minScore, limit, dataset)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@trips_router.get("/density/presets")
+async def get_density_presets(snapshot_logic: SnapshotLogicDep, dataset: str = DEFAULT_DATASET) -> list[DensityPreset]:
+    """Preset windows relative to the latest ingested month: last week, last month and typical weekdays."""
+    try:
+        presets = snapshot_logic.presets(dataset)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return [DensityPreset(name=preset.name, start_date=preset.start_date, end_date=preset.end_date, days=preset.days)
+            for preset in presets.values()]
+
+
+@trips_router.get("/density/presets/{preset}")
+async def get_preset_density(preset: str, request: Request, snapshot_logic: SnapshotLogicDep,
+                             startTime: int = Query(0, ge=0, le=23), endTime: int = Query(23, ge=0, le=23),
+                             dataset: str = DEFAULT_DATASET) -> list[TripDensity]:
+    """
+    Average trip requests per hour of each zone over a preset, between startTime and endTime inclusive.
+    Served from the published snapshot, computed live when it is missing or out of date.
+    """
+    if startTime > endTime:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="startTime must not be after endTime")
+
+    snapshot = snapshot_logic.snapshot(density_path(preset, startTime, endTime), dataset)
+    if snapshot is not None:
+        return gzip_json_response(request, *snapshot)
+    try:
+        return await snapshot_logic.get_preset_density(preset, startTime, endTime, dataset)
+    except (UnknownPresetError, TripDataNotIngestedError) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@trips_router.get("/earnings/presets/{preset}")
+async def get_preset_earnings(preset: str, request: Request, snapshot_logic: SnapshotLogicDep,
+                              dataset: str = DEFAULT_DATASET) -> list[TripEarning]:
+    """Hourly driver pay and trip counts over the last-week or last-month preset."""
+    snapshot = snapshot_logic.snapshot(earnings_path(preset), dataset)
+    if snapshot is not None:
+        return gzip_json_response(request, *snapshot)
+    try:
+        return await snapshot_logic.get_preset_earnings(preset, dataset)
+    except (UnknownPresetError, TripDataNotIngestedError) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@trips_router.get("/stats/zones/{location_id}")
+async def get_zone_stats(trips_logic: TripsLogicDep, snapshot_logic: SnapshotLogicDep, request: Request,
+                         location_id: int = Path(ge=1, le=265), dataset: str = DEFAULT_DATASET) -> list[ZoneHourStats]:
+    """
+    Median pickup wait, trip duration and speed of trips picked up in a zone, per hour of week
+    (0 = Monday 00:00). Served from statistics aggregated at ingestion.
+    """
+    snapshot = snapshot_logic.snapshot(zone_stats_path(location_id), dataset)
+    if snapshot is not None:
+        return gzip_json_response(request, *snapshot)
+    try:
+        return await trips_logic.get_zone_stats(location_id, dataset)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@trips_router.get("/stats/od/{pulocationid}/{dolocationid}")
+async def get_od_stats(trips_logic: TripsLogicDep, pulocationid: int = Path(ge=1, le=265),
+                       dolocationid: int = Path(ge=1, le=265), dataset: str = DEFAULT_DATASET) -> list[OdHourStats]:
+    """
+    Mean pickup wait, trip duration and average speed between two zones, per hour of week.
+    """
+    try:
+        return await trips_logic.get_od_stats(pulocationid, dolocationid, dataset)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@trips_router.get("/pay/distribution")
+async def get_pay_distribution(startDate: datetime, endDate: datetime, trips_logic: TripsLogicDep,
+                               startTime: int = Query(0, ge=0, le=23), endTime: int = Query(23, ge=0, le=23),
+                               locationIds: list[int] = Query([], description="Pickup zones, all zones together when empty"),
+                               weekdays: list[int] = Query([0, 1, 2, 3, 4, 5, 6], description="Days of week, 0 = Monday"),
+                               dataset: str = DEFAULT_DATASET) -> list[ZonePayDistribution]:
+    """
+    Histograms and percentiles of driver pay per mile and per minute per pickup zone, over the
+    months overlapping startDate - endDate and the hours startTime - endTime of the selected weekdays.
+    """
+    if any(not 1 <= location_id <= 265 for location_id in locationIds) or any(not 0 <= day <= 6 for day in weekdays):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="locationIds must be between 1 and 265 and weekdays between 0 and 6")
+    try:
+        return await trips_logic.get_pay_distribution(startDate, endDate, locationIds, startTime, endTime, weekdays, dataset)
+    except TripDataNotIngestedError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -0,0 +1,38 @@
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from pydantic import BaseModel, Field
+from py_nyc.web.core.models import ZoneLookup
+from py_nyc.web.dependencies import ZonesLogicDep
+from py_nyc.web.utils.precompressed import gzip_json_response
+
+zones_router = APIRouter(prefix='/zones')
+
+MAX_LOOKUP_POINTS = 50000
+
+
+class ZoneLookupRequest(BaseModel):
+    longitudes: List[float] = Field(max_length=MAX_LOOKUP_POINTS)
+    latitudes: List[float] = Field(max_length=MAX_LOOKUP_POINTS)
+
+
+@zones_router.get('/geometry')
+async def get_zone_geometry(request: Request, zones_logic: ZonesLogicDep,
+                            zoom: int = Query(11, ge=0, le=22, description="Map zoom level the geometry is drawn at")):
+    """
+    Taxi zone boundaries as GeoJSON, simplified to about a pixel at the given zoom with neighbouring
+    zones still sharing their borders exactly. Coarser zooms get much smaller payloads.
+    """
+    return gzip_json_response(request, *zones_logic.get_geometry(zoom), max_age=86400)
+
+
+@zones_router.post('/lookup')
+async def lookup_zones(request: ZoneLookupRequest, zones_logic: ZonesLogicDep) -> ZoneLookup:
+    """
+    Taxi zone (location id) of each GPS point, given as parallel longitude and latitude arrays.
+    Points outside every zone get 0, the id missing zones are stored as.
+    """
+    if len(request.longitudes) != len(request.latitudes):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="longitudes and latitudes must have the same length")
+    # Up to MAX_LOOKUP_POINTS ray casts, kept off the event loop
+    return await asyncio.to_thread(zones_logic.lookup_points, request.longitudes, request.latitudes)
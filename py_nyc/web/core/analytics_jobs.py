@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import traceback
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
+from py_nyc.web.core.earnings_logic import EarningsLogic
+from py_nyc.web.core.models import AnalyticsJobStatus, TripFilters
+from py_nyc.web.core.trips_logic import InvalidWindowError, TripsLogic
+from py_nyc.web.data_access.services.analytics_job_service import FAILED, QUEUED, RUNNING, SUCCEEDED, AnalyticsJobService
+from py_nyc.web.data_access.store.local_trip_store import TripDataNotIngestedError
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET, DatasetColumnError, UnknownDatasetError, get_datasets
+
+# Processes refresh their jobs this often, and jobs not refreshed for STALE_SECONDS are taken as lost
+HEARTBEAT_SECONDS = 2.0
+STALE_SECONDS = 30.0
+# How often waiting on a job run by another process checks on it
+POLL_SECONDS = 0.5
+
+
+class DensityJobParams(BaseModel):
+    startDate: datetime
+    endDate: datetime
+    startTime: int = Field(ge=0, le=23)
+    endTime: int = Field(ge=0, le=23)
+    datasets: List[str] = [DEFAULT_DATASET]
+    shared: Optional[bool] = None
+    wav: Optional[bool] = None
+    airport: Optional[bool] = None
+
+
+class DensityCompareJobParams(BaseModel):
+    startDate: datetime
+    endDate: datetime
+    startTime: int = Field(ge=0, le=23)
+    endTime: int = Field(ge=0, le=23)
+    offsetDays: List[int] = [7]
+    datasets: List[str] = [DEFAULT_DATASET]
+    top: int = 10
+
+
+class EarningsJobParams(BaseModel):
+    startDate: datetime
+    endDate: datetime
+    datasets: List[str] = [DEFAULT_DATASET]
+
+
+JOB_PARAMS: Dict[str, type[BaseModel]] = {
+    "density": DensityJobParams,
+    "density_compare": DensityCompareJobParams,
+    "earnings": EarningsJobParams,
+}
+
+# Errors caused by the query itself, reported to the client as they are
+QUERY_ERRORS = (InvalidWindowError, UnknownDatasetError, DatasetColumnError, TripDataNotIngestedError)
+
+
+class UnknownJobKindError(Exception):
+    """Raised when a job is submitted with a kind that is not in JOB_PARAMS."""
+    pass
+
+
+class JobNotFoundError(Exception):
+    """Raised for job ids that were never submitted or whose results expired."""
+    pass
+
+
+class JobQueueFullError(Exception):
+    """Raised when more jobs are queued than the workers are allowed to fall behind by."""
+    pass
+
+
+@dataclass
+class AnalyticsJob:
+    id: str
+    kind: str
+    params: BaseModel
+    status: str = QUEUED
+    progress: float = 0.0
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None
+    error: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def set_progress(self, progress: float) -> None:
+        self.progress = round(progress, 3)
+
+    def describe(self) -> AnalyticsJobStatus:
+        return AnalyticsJobStatus(id=self.id, kind=self.kind, status=self.status, progress=self.progress,
+                                  created_at=self.created_at, started_at=self.started_at,
+                                  finished_at=self.finished_at, error=self.error)
+
+    def to_document(self, owner: str) -> dict:
+        return {"_id": self.id, "kind": self.kind, "params": self.params.model_dump(mode="json"), "status": self.status,
+                "progress": self.progress, "created_at": self.created_at, "started_at": self.started_at,
+                "finished_at": self.finished_at, "result": None, "error": self.error, "owner": owner,
+                "heartbeat_at": datetime.now(timezone.utc), "expires_at": None}
+
+    @classmethod
+    def from_document(cls, document: dict) -> "AnalyticsJob":
+        job = cls(id=document["_id"], kind=document["kind"], params=JOB_PARAMS[document["kind"]].model_validate(document["params"]),
+                  status=document["status"], progress=document["progress"], created_at=document["created_at"],
+                  started_at=document["started_at"], finished_at=document["finished_at"],
+                  result=document["result"], error=document["error"])
+        if not job.finished and document["heartbeat_at"] < datetime.now(timezone.utc) - timedelta(seconds=STALE_SECONDS):
+            job.status, job.error = FAILED, "Lost when the server running it stopped, submit the job again"
+        if job.finished:
+            job.done.set()
+        return job
+
+
+def job_id(kind: str, params: BaseModel) -> str:
+    """Hash of a query, so resubmitting it joins the running job or gets the cached result."""
+    query = json.dumps({"kind": kind, "params": params.model_dump(mode="json")}, sort_keys=True)
+    return hashlib.sha1(query.encode()).hexdigest()[:20]
+
+
+class AnalyticsJobs:
+    """
+    Runs long trip queries in the background on a pool of worker tasks, so a request only
+    submits the query and clients poll (or long-poll) for its progress and result.
+    A job runs in the process that accepted it, but its state and result are kept in MongoDB,
+    so any API worker answers for it and identical queries share one job across workers.
+    Finished jobs are kept for `result_ttl_seconds`; jobs of a process that died are failed
+    once it stops heartbeating them.
+    """
+
+    def __init__(self, service: AnalyticsJobService, logic_factory: Callable[[], Awaitable[Tuple[TripsLogic, EarningsLogic]]],
+                 workers: int = 2, max_queued: int = 100, result_ttl_seconds: float = 3600):
+        self.service = service
+        self.logic_factory = logic_factory
+        self.n_workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = timedelta(seconds=result_ttl_seconds)
+        # Jobs this process queued or is running
+        self._active: Dict[str, AnalyticsJob] = {}
+        self._owner = _owner_id()
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def submit(self, kind: str, params: dict) -> AnalyticsJob:
+        if kind not in JOB_PARAMS:
+            raise UnknownJobKindError(f"Unknown job kind '{kind}', expected one of: {', '.join(JOB_PARAMS)}")
+        parsed = JOB_PARAMS[kind].model_validate(params)
+        get_datasets(parsed.datasets)  # Fail before queueing
+
+        self.start()
+        id = job_id(kind, parsed)
+        job = await self._find(id)
+        if job is not None and job.status != FAILED:
+            return job
+        if self._queue.full():
+            raise JobQueueFullError(f"{self.max_queued} analytics jobs are already queued, try again later")
+
+        job = AnalyticsJob(id=id, kind=kind, params=parsed)
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=STALE_SECONDS)
+        if not await self.service.create_job(job.to_document(self._owner), stale_before):
+            # Submitted to another process meanwhile
+            return await self.get(id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            await self.service.delete_job(id, self._owner)
+            raise JobQueueFullError(f"{self.max_queued} analytics jobs are already queued, try again later")
+        self._active[id] = job
+        return job
+
+    async def get(self, id: str) -> AnalyticsJob:
+        job = await self._find(id)
+        if job is None:
+            raise JobNotFoundError(f"No analytics job '{id}', it may have expired")
+        return job
+
+    async def wait(self, id: str, timeout: float) -> AnalyticsJob:
+        """The job once it finished, or as it is after `timeout` seconds."""
+        job = await self.get(id)
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not job.finished:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            local = self._active.get(id)
+            try:
+                # Run here, or checked on in MongoDB while another process runs it
+                await asyncio.wait_for(local.done.wait() if local else asyncio.sleep(POLL_SECONDS), remaining)
+            except asyncio.TimeoutError:
+                pass
+            job = await self.get(id)
+        return job
+
+    async def _find(self, id: str) -> Optional[AnalyticsJob]:
+        if id in self._active:
+            return self._active[id]
+        document = await self.service.get_job(id)
+        if document is None or (document["expires_at"] and document["expires_at"] <= datetime.now(timezone.utc)):
+            return None
+        return AnalyticsJob.from_document(document)
+
+    def start(self) -> None:
+        """Start the workers on the running loop, from the app lifespan (or the first job without one)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First start, or the previous loop was closed (e.g. between test clients) and its jobs with it
+        if self._active:
+            loop.create_task(self._fail_unfinished("Interrupted when the server restarted, submit the job again"))
+        self._loop = loop
+        self._queue = asyncio.Queue(self.max_queued)
+        self._workers = [loop.create_task(self._work()) for _ in range(self.n_workers)]
+        self._workers.append(loop.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        """Cancel the workers on app shutdown, failing the jobs they were running or had queued."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self._fail_unfinished("Cancelled")
+        self._loop, self._queue = None, None
+
+    async def _fail_unfinished(self, error: str) -> None:
+        """Fail the jobs no worker will ever finish, so identical queries are run again instead of waiting on them."""
+        active, self._active = self._active, {}
+        for job in active.values():
+            job.status, job.error = FAILED, error
+            job.finished_at = datetime.now(timezone.utc)
+            # The job's event may belong to a closed loop, whose waiters can no longer be woken
+            job.done = asyncio.Event()
+            job.done.set()
+        try:
+            await self.service.fail_unfinished(self._owner, error, datetime.now(timezone.utc) + self.result_ttl)
+        except Exception:
+            # Left to expire as stale
+            traceback.print_exc()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                await self.service.heartbeat(self._owner, {id: job.progress for id, job in self._active.items()})
+            except Exception:
+                traceback.print_exc()
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status, job.started_at = RUNNING, datetime.now(timezone.utc)
+            try:
+                await self.service.update_job(job.id, self._owner, {"status": RUNNING, "started_at": job.started_at})
+                job.result = await self._run(job)
+                job.status, job.progress = SUCCEEDED, 1.0
+            except QUERY_ERRORS as e:
+                job.status, job.error = FAILED, str(e)
+            except Exception as e:
+                traceback.print_exc()
+                job.status, job.error = FAILED, f"Internal error: {e}"
+            finally:
+                if job.status == RUNNING:
+                    # The worker was cancelled, e.g. on shutdown
+                    job.status, job.error = FAILED, "Cancelled"
+                job.finished_at = datetime.now(timezone.utc)
+                try:
+                    await self.service.update_job(job.id, self._owner, {
+                        "status": job.status, "progress": job.progress, "finished_at": job.finished_at,
+                        "result": jsonable_encoder(job.result), "error": job.error,
+                        "expires_at": job.finished_at + self.result_ttl})
+                except Exception:
+                    # Failed by its lapsing heartbeat instead
+                    traceback.print_exc()
+                self._active.pop(job.id, None)
+                job.done.set()
+                self._queue.task_done()
+                print(f"[Jobs] {job.kind} {job.id} {job.status} in {(job.finished_at - job.started_at).total_seconds():.1f}s")
+
+    async def _run(self, job: AnalyticsJob) -> Any:
+        trips_logic, earnings_logic = await self.logic_factory()
+        params = job.params
+
+        if job.kind == "density":
+            filters = TripFilters(shared=params.shared, wav=params.wav, airport=params.airport)
+            return await trips_logic.get_density(params.startDate, params.endDate, params.startTime, params.endTime,
+                                                 params.datasets, filters, progress=job.set_progress)
+        if job.kind == "density_compare":
+            return await trips_logic.compare_density(params.startDate, params.endDate, params.startTime, params.endTime,
+                                                     params.offsetDays, params.datasets, params.top)
+        return await earnings_logic.get_earnings(params.startDate, params.endDate, params.datasets, progress=job.set_progress)
+
+
+def _owner_id() -> str:
+    """Identifies this API process among the others sharing the jobs collection."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
@@ -1,6 +1,7 @@
 import os
 from functools import lru_cache
 from pathlib import Path
+from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -18,6 +19,11 @@ def _get_env_file() -> str:
     return env_file
 
 
+def load_env_file() -> None:
+    """Load the .env file of the current ENV, for scripts that do not start through server.py."""
+    load_dotenv(_get_env_file(), override=True)
+
+
 class Settings(BaseSettings):
     """
     Application settings loaded from environment variables.
@@ -42,6 +48,37 @@ class Settings(BaseSettings):
 
     # NYC Open Data
     nyc_open_data_app_token: str
+    # Base URL of the SODA API, point at the local stand-in (py_nyc.web.dev.soda_standin) for load tests
+    nyc_open_data_base_url: str = "https://data.cityofnewyork.us"
+    # Dataset id overrides (comma-separated key=id pairs, e.g. "fhv=abcd-1234")
+    nyc_open_data_dataset_ids: str = ""
+
+    # Trip query result cache (one cache per dataset)
+    trip_query_cache_size: int = 128
+    trip_query_cache_ttl_seconds: int = 3600
+
+    # Background analytics jobs (workers per API process, job state and results kept in MongoDB)
+    analytics_job_workers: int = 2
+    analytics_job_queue_size: int = 100
+    analytics_job_result_ttl_seconds: int = 3600
+
+    # Local trip store (ingested trips and their aggregates)
+    trip_store_dir: str = "data/trip_store"
+    # Memory mapped aggregates shared by all workers, defaults to a directory under /dev/shm
+    shared_array_dir: str | None = None
+    # Size bound of that directory, least recently used aggregates are evicted first (defaults to half its file system)
+    shared_array_max_mb: int | None = None
+    # Answer density and earnings from hourly aggregates loaded into MongoDB (ingest --mongo)
+    trip_aggregates_in_mongo: bool = False
+    # Precomputed preset responses (see jobs/build_snapshots.py)
+    snapshot_dir: str = "data/snapshots"
+    # Simplified taxi zone geometries per zoom level (see jobs/build_zone_geometries.py)
+    zone_geometry_dir: str = "data/zone_geometries"
+    # Zone vector tiles rendered ahead (see jobs/prerender_tiles.py) and tiles kept in memory per API process
+    tile_dir: str = "data/tiles"
+    tile_cache_size: int = 4096
+    # Gzip and brotli variants of the static files (see jobs/precompress_static.py)
+    static_build_dir: str = "data/static"
 
     # JWT Authentication
     secret_key: str
@@ -78,6 +115,15 @@ class Settings(BaseSettings):
         """Parse comma-separated CORS origins into a list."""
         return [origin.strip() for origin in self.cors_origins.split(",") if origin.strip()]
 
+    def get_dataset_id_overrides(self) -> dict[str, str]:
+        """Parse comma-separated key=id pairs into a dataset key to dataset id map."""
+        overrides = {}
+        for pair in self.nyc_open_data_dataset_ids.split(","):
+            key, _, dataset_id = pair.partition("=")
+            if key.strip() and dataset_id.strip():
+                overrides[key.strip()] = dataset_id.strip()
+        return overrides
+
 
 @lru_cache()
 def get_settings() -> Settings:
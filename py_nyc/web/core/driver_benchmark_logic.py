@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from beanie import PydanticObjectId
+from py_nyc.web.core.models import BenchmarkCell, DriverBenchmark, MissedOpportunity
+from py_nyc.web.data_access.services.driver_trip_service import DriverTripService
+from py_nyc.web.data_access.services.trip_service import TripService
+from py_nyc.web.data_access.store.histograms import histogram_quantile, histogram_rank
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import N_ZONES, ONE_HOUR, TripCube, zone_index
+from py_nyc.web.data_access.store.trip_stats import HOURS_PER_WEEK, hour_of_week
+from py_nyc.web.data_access.store.unit_pay import UNIT_PAY_BINS, unit_pay
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+
+TRIP_FIELDS = ["request_datetime", "pulocationid", "driver_pay", "trip_miles", "trip_time"]
+
+# The driver's most frequent pickup zones, searched for missed opportunities
+OPPORTUNITY_ZONES = 5
+
+# Market hours of a zone with fewer trips are too noisy to compare against
+MIN_MARKET_TRIPS = 10
+
+
+class DriverBenchmarkLogic:
+    def __init__(self, driver_trip_service: DriverTripService, trip_service: TripService):
+        self.driver_trip_service = driver_trip_service
+        self.trip_service = trip_service
+
+    async def get_benchmark(self, user_id: PydanticObjectId, start_date: datetime, end_date: datetime,
+                            dataset: str = DEFAULT_DATASET, top: int = 10) -> DriverBenchmark:
+        """
+        A driver's uploaded trips in [start_date, end_date) against the market in the same
+        (pickup zone, hour): percentile ranks of their pay per mile and per minute within the
+        market distributions, their hourly pay against the market's, and the top windows of
+        hours they did not work while their usual zones paid more than they typically make.
+        """
+        docs = await self.driver_trip_service.get_trips(user_id, start_date, end_date, TRIP_FIELDS)
+        trips = TripColumns.from_records(docs, TRIP_FIELDS)
+        cube = await self.trip_service.get_cube(start_date, end_date, dataset)
+
+        zones = zone_index(trips["pulocationid"])
+        hows = hour_of_week(trips["request_datetime"])
+        cell_keys, cell_of_trip = np.unique(zones * HOURS_PER_WEEK + hows, return_inverse=True)
+        market = await self.trip_service.get_unit_pay_cells(
+            start_date, end_date, cell_keys // HOURS_PER_WEEK, cell_keys % HOURS_PER_WEEK, dataset)
+
+        # Join every trip to the market histograms of its (zone, hour of week) cell
+        values = unit_pay(trips)
+        ranks = {metric: histogram_rank(market[metric][cell_of_trip], UNIT_PAY_BINS[metric], values[metric])
+                 for metric in UNIT_PAY_BINS}
+
+        driver_rate = _hourly_pay(trips["driver_pay"], trips["trip_time"])
+        hour_of_trip = ((trips["request_datetime"].astype("datetime64[h]") - cube.start) / ONE_HOUR).astype(np.int64)
+        worked = np.unique(hour_of_trip * N_ZONES + zones)
+
+        return DriverBenchmark(
+            start_date=start_date,
+            end_date=end_date,
+            trip_count=len(trips),
+            hourly_pay=_round(driver_rate),
+            market_hourly_pay=_round(_hourly_pay(cube["driver_pay"].ravel()[worked], cube["trip_time"].ravel()[worked])),
+            pay_per_mile_rank=_round(_nanmean(ranks["pay_per_mile"]), 1),
+            pay_per_minute_rank=_round(_nanmean(ranks["pay_per_minute"]), 1),
+            cells=_cells(cell_keys, cell_of_trip, values, ranks, market),
+            missed_opportunities=_missed_opportunities(
+                cube, start_date, end_date, zones, hows, hour_of_trip, driver_rate, top) if driver_rate is not None else []
+        )
+
+
+def _cells(cell_keys: np.ndarray, cell_of_trip: np.ndarray, values: Dict[str, np.ndarray], ranks: Dict[str, np.ndarray],
+           market: Dict[str, np.ndarray]) -> List[BenchmarkCell]:
+    n_cells = len(cell_keys)
+    trip_counts = np.bincount(cell_of_trip, minlength=n_cells)
+    stats = {}
+    for metric, spec in UNIT_PAY_BINS.items():
+        stats[metric] = _group_mean(cell_of_trip, values[metric], n_cells)
+        stats[f"market_{metric}"] = histogram_quantile(market[metric], spec, 0.5)
+        stats[f"{metric}_rank"] = _group_mean(cell_of_trip, ranks[metric], n_cells)
+
+    rounded = {name: [None if value != value else value for value in np.round(column, 1 if name.endswith("rank") else 2).tolist()]
+               for name, column in stats.items()}
+    return [BenchmarkCell(
+        location_id=int(key // HOURS_PER_WEEK),
+        hour_of_week=int(key % HOURS_PER_WEEK),
+        trip_count=int(trip_counts[i]),
+        **{name: column[i] for name, column in rounded.items()}
+    ) for i, key in enumerate(cell_keys)]
+
+
+def _missed_opportunities(cube: TripCube, start_date: datetime, end_date: datetime, zones: np.ndarray, hows: np.ndarray,
+                          hour_of_trip: np.ndarray, driver_rate: float, top: int) -> List[MissedOpportunity]:
+    """
+    Runs of consecutive hours, on hours of the week the driver works, with no trips of theirs while
+    the market in one of their most frequent zones paid more per engaged hour than they do.
+    """
+    zone_counts = np.bincount(zones, minlength=N_ZONES)
+    zone_counts[0] = 0
+    usual = np.argsort(-zone_counts, kind="stable")[:OPPORTUNITY_ZONES]
+    usual = usual[zone_counts[usual] > 0]
+    if not len(usual):
+        return []
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = cube["driver_pay"][:, usual] / cube["trip_time"][:, usual] * 3600
+    rates = np.where(cube["pickups"][:, usual] >= MIN_MARKET_TRIPS, np.nan_to_num(rates), 0.0)
+    best = rates.max(axis=1)
+
+    hours = cube.start + np.arange(cube.n_hours) * ONE_HOUR
+    active = np.bincount(hour_of_trip, minlength=cube.n_hours) > 0
+    missed = cube.hour_mask(start_date, end_date) & ~active & np.isin(hour_of_week(hours), hows) & (best > driver_rate)
+
+    edges = np.diff(np.concatenate([[0], missed.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(starts):
+        return []
+
+    def run_sums(values: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate([np.zeros((1, *values.shape[1:])), np.cumsum(values, axis=0)])
+        return cumulative[ends] - cumulative[starts]
+
+    excess = run_sums(np.where(missed, best - driver_rate, 0.0))
+    market_rate = run_sums(best) / (ends - starts)
+    run_zones = usual[run_sums(rates).argmax(axis=1)]
+
+    return [MissedOpportunity(
+        start=hours[starts[i]].astype(datetime),
+        end=hours[ends[i]].astype(datetime),
+        location_id=int(run_zones[i]),
+        market_hourly_pay=round(float(market_rate[i]), 2),
+        excess_pay=round(float(excess[i]), 2)
+    ) for i in np.argsort(-excess, kind="stable")[:top]]
+
+
+def _hourly_pay(pay: np.ndarray, trip_seconds: np.ndarray) -> Optional[float]:
+    """Driver pay per engaged hour."""
+    known = np.isfinite(pay) & np.isfinite(trip_seconds)
+    seconds = trip_seconds[known].sum(dtype=np.float64)
+    return float(pay[known].sum(dtype=np.float64) / seconds * 3600) if seconds > 0 else None
+
+
+def _group_mean(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    known = np.isfinite(values)
+    counts = np.bincount(groups[known], minlength=n_groups)
+    sums = np.bincount(groups[known], weights=values[known], minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _nanmean(values: np.ndarray) -> Optional[float]:
+    known = values[np.isfinite(values)]
+    return float(known.mean()) if len(known) else None
+
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return None if value is None else round(value, digits)
@@ -0,0 +1,221 @@
+import asyncio
+import csv
+import io
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, List, Optional
+from zoneinfo import ZoneInfo
+from beanie import PydanticObjectId
+from pydantic import ValidationError
+from py_nyc.web.api.schemas import TripSchema
+from py_nyc.web.core.models import DriverHourlyEarning, TripUploadError, TripUploadSummary
+from py_nyc.web.data_access.services.driver_trip_service import DriverTripService
+
+# Rows validated, deduplicated and written per bulk insert
+UPLOAD_BATCH_ROWS = 1000
+READ_CHUNK_CHARS = 64 * 1024
+MAX_REPORTED_ERRORS = 20
+
+# Trip timestamps are NYC wall clock time, like the TLC trip records
+NYC_TZ = ZoneInfo("America/New_York")
+
+CSV_FORMAT = "csv"
+JSON_FORMAT = "json"
+
+_TRIPS_DOCUMENT = re.compile(r'\s*\{\s*"trips"\s*:\s*\[')
+_JSON_SEPARATORS = " \t\r\n,[]"
+
+
+class TripUploadFormatError(Exception):
+    """Raised when an upload is not a CSV or JSON trip log this service can read."""
+    pass
+
+
+def upload_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if name.endswith(".csv") or content_type in ("text/csv", "application/csv"):
+        return CSV_FORMAT
+    if name.endswith((".json", ".jsonl", ".ndjson")) or content_type in ("application/json", "application/x-ndjson", "application/jsonl"):
+        return JSON_FORMAT
+    raise TripUploadFormatError("Trip logs must be uploaded as .csv, .json or .jsonl files")
+
+
+def csv_rows(file: BinaryIO) -> Iterator[dict]:
+    """Rows of a CSV trip log with a header line, read incrementally."""
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    missing = set(TripSchema.model_fields) - set(reader.fieldnames or [])
+    if missing:
+        raise TripUploadFormatError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+    yield from reader
+
+
+def json_rows(file: BinaryIO) -> Iterator[dict]:
+    """
+    Trip objects of a JSON trip log, decoded one at a time: a {"trips": [...]} document
+    (ListTripSchema), a JSON array of trips or JSON Lines.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig")
+    decoder = json.JSONDecoder()
+    buffer = text.read(READ_CHUNK_CHARS)
+    separators = _JSON_SEPARATORS
+
+    wrapper = _TRIPS_DOCUMENT.match(buffer)
+    if wrapper:
+        buffer = buffer[wrapper.end():]
+        separators += "}"
+
+    eof = False
+    while True:
+        buffer = buffer.lstrip(separators)
+        if not buffer:
+            if eof:
+                return
+            chunk = text.read(READ_CHUNK_CHARS)
+            eof = not chunk
+            buffer = chunk
+            continue
+
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # Most likely an object cut off at the end of the chunk
+            chunk = "" if eof else text.read(READ_CHUNK_CHARS)
+            if not chunk:
+                raise TripUploadFormatError(f"Invalid JSON near: {buffer[:40]!r}")
+            eof = False
+            buffer += chunk
+            continue
+
+        if not isinstance(row, dict):
+            raise TripUploadFormatError("JSON trip logs must contain trip objects")
+        buffer = buffer[end:]
+        yield row
+
+
+def read_batch(rows: Iterator[dict], summary: TripUploadSummary) -> List[TripSchema]:
+    """
+    The next UPLOAD_BATCH_ROWS valid trips of an upload (fewer at its end), counting the rows
+    read into `summary` and reporting the first few rejected ones. Blocking, run it in a thread.
+    When the file turns out unreadable, the trips read before are returned and summary.aborted set.
+    """
+    batch: List[TripSchema] = []
+    try:
+        for row in rows:
+            summary.rows += 1
+            try:
+                trip = TripSchema.model_validate(row)
+            except ValidationError as e:
+                summary.rejected += 1
+                if len(summary.errors) < MAX_REPORTED_ERRORS:
+                    summary.errors.append(TripUploadError(row=summary.rows, message=_validation_message(e)))
+                continue
+
+            trip.request_datetime = _local_time(trip.request_datetime)
+            batch.append(trip)
+            if len(batch) >= UPLOAD_BATCH_ROWS:
+                break
+    except UnicodeDecodeError:
+        summary.aborted = "Trip logs must be UTF-8 encoded"
+    except TripUploadFormatError as e:
+        summary.aborted = str(e)
+    return batch
+
+
+def _local_time(value: datetime) -> datetime:
+    """Naive NYC time, truncated to milliseconds like Mongo stores it."""
+    if value.tzinfo is not None:
+        value = value.astimezone(NYC_TZ).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+class DriverTripsLogic:
+    def __init__(self, driver_trip_service: DriverTripService):
+        self.driver_trip_service = driver_trip_service
+
+    async def upload_trips(self, user_id: PydanticObjectId, file: BinaryIO, format: str) -> TripUploadSummary:
+        """
+        Parse a driver's trip log row by row and bulk insert it in batches, skipping trips
+        already uploaded, while adding each batch to the driver's hourly earnings.
+        Rows that fail validation are counted and the first few reported; the rest still load.
+        Batches are parsed in a worker thread, so large uploads do not block the event loop.
+        A file that turns out unreadable part way returns what was loaded before, marked aborted.
+        """
+        rows = csv_rows(file) if format == CSV_FORMAT else json_rows(file)
+        summary = TripUploadSummary(rows=0, inserted=0, duplicates=0, rejected=0, hours_updated=0, errors=[])
+        hours = set()
+
+        while True:
+            batch = await asyncio.to_thread(read_batch, rows, summary)
+            await self._insert_batch(user_id, batch, summary, hours)
+            if summary.aborted and not summary.inserted:
+                # Nothing was loaded, reject the file as a whole
+                raise TripUploadFormatError(summary.aborted)
+            if summary.aborted or len(batch) < UPLOAD_BATCH_ROWS:
+                break
+
+        summary.hours_updated = len(hours)
+        print(f"[DriverTrips] {user_id}: {summary.inserted} inserted, {summary.duplicates} duplicates, {summary.rejected} rejected")
+        return summary
+
+    async def _insert_batch(self, user_id: PydanticObjectId, batch: List[TripSchema], summary: TripUploadSummary, hours: set) -> None:
+        if not batch:
+            return
+
+        # Trips uploaded before their keys were recorded are only found among the trips themselves
+        seen = await self.driver_trip_service.get_trip_keys(
+            user_id, min(trip.request_datetime for trip in batch), max(trip.request_datetime for trip in batch))
+        candidates = {}
+        for trip in batch:
+            key = (trip.request_datetime, trip.pulocationid, trip.dolocationid)
+            if key in seen or key in candidates:
+                summary.duplicates += 1
+                continue
+            candidates[key] = trip
+
+        # Concurrent uploads of the same trips each insert and count only the ones they claimed
+        claimed = await self.driver_trip_service.claim_trip_keys(user_id, list(candidates))
+        summary.duplicates += len(candidates) - len(claimed)
+        uploaded_at = datetime.now(timezone.utc)
+        documents = []
+        totals = defaultdict(lambda: {"trip_count": 0, "driver_pay": 0.0, "base_passenger_fare": 0.0, "trip_miles": 0.0, "trip_seconds": 0})
+
+        for key, trip in candidates.items():
+            if key not in claimed:
+                continue
+            documents.append({"user_id": user_id, **trip.model_dump(), "uploaded_at": uploaded_at})
+            hour = totals[trip.request_datetime.replace(minute=0, second=0, microsecond=0)]
+            hour["trip_count"] += 1
+            hour["driver_pay"] += trip.driver_pay
+            hour["base_passenger_fare"] += trip.base_passenger_fare
+            hour["trip_miles"] += trip.trip_miles
+            hour["trip_seconds"] += trip.trip_time
+
+        try:
+            inserted = await self.driver_trip_service.insert_trips(documents)
+            await self.driver_trip_service.increment_hourly_earnings(user_id, totals)
+        except Exception:
+            # Leave nothing of the batch behind, so uploading it again inserts and counts it once
+            await self.driver_trip_service.delete_trips(user_id, list(claimed))
+            await self.driver_trip_service.release_trip_keys(user_id, list(claimed))
+            raise
+        summary.inserted += inserted
+        hours.update(totals)
+
+    async def get_hourly_earnings(self, user_id: PydanticObjectId, start_date: datetime, end_date: datetime) -> list[DriverHourlyEarning]:
+        """The driver's uploaded trips totalled per hour, from the rollups maintained at upload."""
+        rollups = await self.driver_trip_service.get_hourly_earnings(user_id, start_date, end_date)
+        return [DriverHourlyEarning(
+            hour=rollup.hour,
+            trip_count=rollup.trip_count,
+            driver_pay=round(rollup.driver_pay, 2),
+            base_passenger_fare=round(rollup.base_passenger_fare, 2),
+            trip_miles=round(rollup.trip_miles, 2),
+            trip_seconds=rollup.trip_seconds
+        ) for rollup in rollups]
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors())
@@ -1,12 +1,27 @@
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
+import numpy as np
 from py_nyc.web.core.models import TripEarning
-from py_nyc.web.external.nyc_open_data_api import get_earnings_data
+from py_nyc.web.data_access.services.query_planner import split_by_month
+from py_nyc.web.data_access.services.trip_service import TripService
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET, get_datasets
 
 
 class EarningsLogic:
-    def get_earnings(self, start_date: datetime, end_date: datetime) -> List[TripEarning]:
-        earnings_data = get_earnings_data(start_date, end_date)
+    def __init__(self, trip_service: TripService):
+        self.trip_service = trip_service
+
+    async def get_earnings(self, start_date: datetime, end_date: datetime, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                           progress: Optional[Callable[[float], None]] = None) -> List[TripEarning]:
+        """With `progress`, the range is queried a month at a time and the fraction done reported after each."""
+        if progress is None:
+            earnings_data = await self.trip_service.get_earnings_data(start_date, end_date, datasets)
+        else:
+            earnings_data = []
+            windows = split_by_month(start_date, end_date)
+            for done, (from_date, to_date) in enumerate(windows, 1):
+                earnings_data += await self.trip_service.get_earnings_data(from_date, to_date, datasets)
+                progress(done / len(windows))
 
         resp: List[TripEarning] = []
         for data in earnings_data:
@@ -19,3 +34,21 @@ class EarningsLogic:
             ))
 
         return resp
+
+    def get_earnings_batches(self, start_date: datetime, end_date: datetime,
+                             datasets: Sequence[str] = (DEFAULT_DATASET,)) -> AsyncIterator[Dict[str, np.ndarray]]:
+        """
+        get_earnings as column arrays (pickup_date, pickup_hour, total_driver_pay, trip_count), one batch
+        per month so exports of long ranges never hold more than a month. Datasets are checked up front.
+        """
+        for dataset in get_datasets(list(datasets)):
+            dataset.column("driver_pay")
+        return self._earnings_batches(start_date, end_date, datasets)
+
+    async def _earnings_batches(self, start_date: datetime, end_date: datetime, datasets: Sequence[str]) -> AsyncIterator[Dict[str, np.ndarray]]:
+        for from_date, to_date in split_by_month(start_date, end_date):
+            columns = await self.trip_service.get_earnings_columns(from_date, to_date, datasets)
+            yield {"pickup_date": columns["hour"].astype("datetime64[D]"),
+                   "pickup_hour": (columns["hour"] - columns["hour"].astype("datetime64[D]")).astype(np.int8),
+                   "total_driver_pay": columns["total_driver_pay"],
+                   "trip_count": columns["trip_count"]}
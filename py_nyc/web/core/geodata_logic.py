@@ -1,13 +1,15 @@
 from datetime import datetime
-import json
-from starlette import status
-from typing import List, Dict
+from typing import List, Sequence
 from py_nyc.web.core.models import TripDensity
-from py_nyc.web.external.nyc_open_data_api import get_density_data
+from py_nyc.web.data_access.services.trip_service import TripService
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
 
 
 class GeoDataLogic:
-    def get_density_within(self, start_date: datetime, end_date: datetime) -> List[TripDensity]:
+    def __init__(self, trip_service: TripService):
+        self.trip_service = trip_service
+
+    async def get_density_within(self, start_date: datetime, end_date: datetime, datasets: Sequence[str] = (DEFAULT_DATASET,)) -> List[TripDensity]:
         """
         Returns the number of trips between given start_date and end_date datetimes.
 
@@ -17,6 +19,8 @@ class GeoDataLogic:
 
         end_date : datetime
 
+        datasets : keys of the TLC datasets to count trips from
+
         Returns
         -------
         List[TripDensity]
@@ -33,11 +37,11 @@ class GeoDataLogic:
 
         """
 
-        trip_list = get_density_data(start_date, end_date)
+        trip_list = await self.trip_service.get_density_between(start_date, end_date, 0, 23, datasets)
         resp: List[TripDensity] = []
 
         for trip in trip_list:
             resp.append(TripDensity(
-                location_id=trip['pulocationid'], density=int(trip['count_pulocationid']) / len(trip_list)))
+                location_id=trip['location_id'], density=int(trip['density']) / len(trip_list)))
 
         return resp
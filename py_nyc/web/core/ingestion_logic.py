@@ -0,0 +1,86 @@
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, next_month
+from py_nyc.web.data_access.store.trip_bitmaps import TripBitmaps
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import TripCube
+from py_nyc.web.data_access.store.trip_stats import TripStats
+from py_nyc.web.data_access.store.trip_validation import validate_trips
+from py_nyc.web.data_access.store.unit_pay import UnitPayHistograms
+from py_nyc.web.data_access.store.zone_index import with_location_ids
+from py_nyc.web.external.nyc_open_data_api import iter_trip_records
+from py_nyc.web.external.tlc_datasets import LOGICAL_COLUMNS, TlcDataset
+
+
+class IngestionLogic:
+    """
+    Pulls a month of raw trips from NYC Open Data into the local trip store
+    and builds the aggregates queries are answered from. Trips with coordinates
+    but no zone ids are mapped to zones first. Rows failing validation are
+    quarantined next to the partition instead of stored.
+    """
+
+    def __init__(self, store: LocalTripStore):
+        self.store = store
+
+    def ingest_month(self, dataset: TlcDataset, month: date, page_size: int = 50000) -> dict:
+        start, end = _month_range(month)
+        names = [name for name in LOGICAL_COLUMNS if dataset.has_column(name)]
+
+        batches: List[TripColumns] = []
+        for records in iter_trip_records(dataset, start, end, names, page_size):
+            batches.append(TripColumns.from_records(records, names))
+            print(f"[Ingest] {dataset.key} {month:%Y-%m}: {sum(len(b) for b in batches)} rows fetched")
+
+        columns = TripColumns.concat(batches) if batches else TripColumns.empty(names)
+        return self.ingest_columns(dataset, month, columns)
+
+    def ingest_columns(self, dataset: TlcDataset, month: date, columns: TripColumns) -> dict:
+        """Validate and store a month of already fetched trips and build its aggregates."""
+        columns = with_location_ids(columns)
+        validation = validate_trips(columns.sorted_by("pickup_datetime"), *_month_range(month))
+        report = validation.report()
+        if report["rows_quarantined"]:
+            counts = ", ".join(f"{rule}: {count}" for rule, count in report["violations"].items() if count)
+            print(f"[Ingest] {dataset.key} {month:%Y-%m}: {report['rows_quarantined']} rows quarantined ({counts})")
+
+        meta = self._meta(dataset, month, validation.clean, report)
+        self.store.write_partition(dataset.key, month, validation.clean, self.build_aggregates(validation.clean, month),
+                                   meta, validation.quarantine_arrays())
+        return meta
+
+    def rebuild_month(self, dataset: TlcDataset, month: date) -> dict:
+        """Rebuild the aggregates of an ingested month from its stored columns."""
+        columns = self.store.read_columns(dataset.key, month)
+        if len(validate_trips(columns, *_month_range(month)).quarantined):
+            # Ingested before validation, store it again without the bad rows
+            return self.ingest_columns(dataset, month, columns)
+
+        meta = self._meta(dataset, month, columns, self.store.read_meta(dataset.key, month).get("validation"))
+        self.store.write_aggregates(dataset.key, month, self.build_aggregates(columns, month), meta)
+        return meta
+
+    def build_aggregates(self, columns: TripColumns, month: date) -> Dict[str, Dict[str, np.ndarray]]:
+        start, end = _month_range(month)
+        return {
+            "cube": TripCube.build(columns, start, end).to_npz(),
+            "stats": TripStats.build(columns).to_npz(),
+            "bitmaps": TripBitmaps.build(columns, start, end).to_npz(),
+            "unit_pay": UnitPayHistograms.build(columns).to_npz(),
+        }
+
+    def _meta(self, dataset: TlcDataset, month: date, columns: TripColumns, validation: Optional[dict]) -> dict:
+        return {
+            "dataset": dataset.key,
+            "dataset_id": dataset.dataset_id,
+            "month": month.strftime("%Y-%m"),
+            "rows": len(columns),
+            "validation": validation,
+            "ingested_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+
+def _month_range(month: date) -> tuple[datetime, datetime]:
+    end = next_month(month)
+    return datetime(month.year, month.month, 1), datetime(end.year, end.month, 1)
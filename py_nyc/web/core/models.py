@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from pydantic import conint
 from pydantic.dataclasses import dataclass as pydantic_dataclass
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 
 @dataclass
@@ -55,3 +55,196 @@ class TripEarningSoQL:
     total_driver_pay: str
     pickup_date: str
     pickup_hour: str
+
+
+@pydantic_dataclass
+class ZoneHourStats:
+    hour_of_week: conint(ge=0, le=167)  # type: ignore
+    trip_count: int
+    median_wait_seconds: Optional[float]
+    median_trip_seconds: Optional[float]
+    median_speed_mph: Optional[float]
+
+
+@pydantic_dataclass
+class OdHourStats:
+    hour_of_week: conint(ge=0, le=167)  # type: ignore
+    trip_count: int
+    mean_wait_seconds: Optional[float]
+    mean_trip_seconds: Optional[float]
+    avg_speed_mph: Optional[float]
+
+
+@pydantic_dataclass
+class TopZone:
+    location_id: int
+    zone: str
+    borough: str
+    density: float  # average trip requests per hour, like TripDensity
+
+
+@pydantic_dataclass
+class ZoneHotspot:
+    location_id: int
+    density: float  # average trip requests per hour, like TripDensity
+    smoothed_density: float  # mean density of the zone and the zones sharing a border with it
+    score: Optional[float]  # Getis-Ord Gi* z-score, None when every zone has the same density
+    cluster: Optional[int]  # cluster of contiguous hotspots the zone belongs to, if any
+
+
+@pydantic_dataclass
+class HotspotCluster:
+    cluster: int  # smallest location id of the cluster
+    location_ids: List[int]
+    density: float  # summed over the cluster's zones
+    peak_location_id: int
+
+
+@pydantic_dataclass
+class DensityHotspots:
+    zones: List[ZoneHotspot]
+    clusters: List[HotspotCluster]  # densest first
+
+
+@pydantic_dataclass
+class ZoneLookup:
+    location_ids: List[int]  # per point in request order, 0 for points outside every zone
+
+
+@pydantic_dataclass
+class ZoneDensityDelta:
+    location_id: int
+    density: float
+    compare_density: float
+    abs_delta: float
+    pct_delta: Optional[float]  # None when the compared window had no trips
+
+
+@pydantic_dataclass
+class DensityComparison:
+    offset_days: int
+    start_date: datetime
+    end_date: datetime
+    zones: List[ZoneDensityDelta]
+    top_movers: List[ZoneDensityDelta]
+
+
+@dataclass(frozen=True)
+class TripFilters:
+    """Trip type filters: True keeps only flagged trips, False excludes them, None keeps both."""
+    shared: Optional[bool] = None
+    wav: Optional[bool] = None
+    airport: Optional[bool] = None
+
+    def selected(self) -> Dict[str, bool]:
+        return {name: value for name, value in vars(self).items() if value is not None}
+
+
+@pydantic_dataclass
+class PayDistribution:
+    trip_count: int
+    bin_width: float
+    counts: List[int]  # counts[i] covers [i * bin_width, (i + 1) * bin_width), the last bin everything above
+    percentiles: Dict[str, Optional[float]]  # p10, p25, p50, p75, p90
+
+
+@pydantic_dataclass
+class ZonePayDistribution:
+    location_id: Optional[int]  # None for all zones together
+    pay_per_mile: PayDistribution
+    pay_per_minute: PayDistribution
+
+
+@pydantic_dataclass
+class DensityPreset:
+    name: str
+    start_date: datetime
+    end_date: datetime
+    days: float
+
+
+@pydantic_dataclass
+class TripUploadError:
+    row: int  # 1-based data row, not counting a CSV header
+    message: str
+
+
+@pydantic_dataclass
+class TripUploadSummary:
+    rows: int
+    inserted: int
+    duplicates: int  # already uploaded before, or repeated within the file
+    rejected: int
+    hours_updated: int
+    errors: List[TripUploadError]  # the first few rejected rows
+    aborted: Optional[str] = None  # why reading the file stopped part way, the rows before were loaded
+
+
+@pydantic_dataclass
+class DriverHourlyEarning:
+    hour: datetime
+    trip_count: int
+    driver_pay: float
+    base_passenger_fare: float
+    trip_miles: float
+    trip_seconds: int
+
+
+@pydantic_dataclass
+class BenchmarkCell:
+    """A driver's trips in one (pickup zone, hour of week) against the market's trips in it."""
+    location_id: int
+    hour_of_week: conint(ge=0, le=167)  # type: ignore
+    trip_count: int
+    pay_per_mile: Optional[float]
+    market_pay_per_mile: Optional[float]  # market median
+    pay_per_mile_rank: Optional[float]  # mean percentile rank of the driver's trips in the market, 0-100
+    pay_per_minute: Optional[float]
+    market_pay_per_minute: Optional[float]
+    pay_per_minute_rank: Optional[float]
+
+
+@pydantic_dataclass
+class MissedOpportunity:
+    """Consecutive hours the driver did not work while the market paid more than the driver's own rate."""
+    start: datetime
+    end: datetime
+    location_id: int  # the best paying of the driver's zones in the window
+    market_hourly_pay: float  # driver pay per engaged hour
+    excess_pay: float  # market minus the driver's hourly pay, summed over the window
+
+
+@pydantic_dataclass
+class DriverBenchmark:
+    start_date: datetime
+    end_date: datetime
+    trip_count: int
+    hourly_pay: Optional[float]  # driver pay per engaged hour
+    market_hourly_pay: Optional[float]  # in the hours and zones the driver worked
+    pay_per_mile_rank: Optional[float]
+    pay_per_minute_rank: Optional[float]
+    cells: List[BenchmarkCell]
+    missed_opportunities: List[MissedOpportunity]
+
+
+@pydantic_dataclass
+class ZoneAnomaly:
+    location_id: int
+    hour: datetime
+    hour_of_week: conint(ge=0, le=167)  # type: ignore
+    requests: int
+    baseline: float  # median requests of the zone at this hour of week
+    mad: float  # median absolute deviation around the baseline
+    score: float  # modified z-score, positive for a spike and negative for a drop in demand
+
+
+@pydantic_dataclass
+class AnalyticsJobStatus:
+    id: str  # hash of the job kind and parameters, the same query always gets the same id
+    kind: str
+    status: str  # queued, running, succeeded or failed
+    progress: float  # 0 - 1
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    error: Optional[str]
@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+from py_nyc.web.data_access.store.local_trip_store import next_month
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Typical weekday presets average this many of the latest occurrences of the weekday
+TYPICAL_WEEKS = 4
+
+
+@dataclass(frozen=True)
+class Preset:
+    """A named set of date windows the UI asks for over and over, relative to the latest ingested data."""
+    name: str
+    windows: Tuple[Tuple[datetime, datetime], ...]
+    has_earnings: bool = True
+
+    @property
+    def start_date(self) -> datetime:
+        return min(from_date for from_date, _ in self.windows)
+
+    @property
+    def end_date(self) -> datetime:
+        return max(to_date for _, to_date in self.windows)
+
+    @property
+    def days(self) -> float:
+        return sum((to_date - from_date for from_date, to_date in self.windows), timedelta()) / timedelta(days=1)
+
+
+def build_presets(last_month: date) -> Dict[str, Preset]:
+    """Presets of a dataset whose latest ingested month is `last_month`."""
+    data_end = datetime(next_month(last_month).year, next_month(last_month).month, 1)
+    presets: List[Preset] = [
+        Preset("last-week", ((data_end - timedelta(days=7), data_end),)),
+        Preset("last-month", ((datetime(last_month.year, last_month.month, 1), data_end),)),
+    ]
+
+    for weekday, name in enumerate(WEEKDAYS):
+        last_day = data_end - timedelta(days=(data_end.weekday() - weekday - 1) % 7 + 1)
+        days = [last_day - timedelta(weeks=week) for week in range(TYPICAL_WEEKS)]
+        presets.append(Preset(f"typical-{name}", tuple((day, day + timedelta(days=1)) for day in reversed(days)),
+                              has_earnings=False))
+
+    return {preset.name: preset for preset in presets}
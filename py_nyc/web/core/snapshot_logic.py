@@ -0,0 +1,118 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from pydantic import TypeAdapter
+from py_nyc.web.core.earnings_logic import EarningsLogic
+from py_nyc.web.core.models import TripDensity, TripEarning, ZoneHourStats
+from py_nyc.web.core.presets import Preset, build_presets
+from py_nyc.web.core.trips_logic import TripsLogic, preset_density_rows
+from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, TripDataNotIngestedError
+from py_nyc.web.data_access.store.snapshot_store import SnapshotStore
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+
+
+class UnknownPresetError(Exception):
+    """Raised when a preset name is not one of the presets of the dataset."""
+    pass
+
+
+def density_path(preset: str, start_hr: int, end_hr: int) -> str:
+    return f"density/{preset}/{start_hr:02d}-{end_hr:02d}"
+
+
+def earnings_path(preset: str) -> str:
+    return f"earnings/{preset}"
+
+
+def zone_stats_path(location_id: int) -> str:
+    return f"zones/{location_id}"
+
+
+class SnapshotLogic:
+    """
+    Preset density, earnings and zone profile responses, precomputed by the snapshot build
+    and served as stored bytes. A snapshot is only served while the trip store holds the same
+    data it was built from; otherwise callers fall back to computing the response live.
+    """
+
+    def __init__(self, trips_logic: TripsLogic, earnings_logic: EarningsLogic, trip_store: LocalTripStore, snapshot_store: SnapshotStore):
+        self.trips_logic = trips_logic
+        self.earnings_logic = earnings_logic
+        self.trip_store = trip_store
+        self.snapshot_store = snapshot_store
+
+    def presets(self, dataset: str = DEFAULT_DATASET) -> Dict[str, Preset]:
+        months = self.trip_store.months(dataset)
+        if not months:
+            raise TripDataNotIngestedError(f"No trip data has been ingested for dataset '{dataset}'")
+        return build_presets(months[-1])
+
+    def preset(self, name: str, dataset: str = DEFAULT_DATASET) -> Preset:
+        presets = self.presets(dataset)
+        if name not in presets:
+            raise UnknownPresetError(f"Unknown preset '{name}', expected one of: {', '.join(presets)}")
+        return presets[name]
+
+    def data_version(self, dataset: str = DEFAULT_DATASET) -> str:
+        """Changes whenever a month of the dataset is ingested or rebuilt."""
+        return hashlib.sha1(repr(self.trip_store.version(dataset)).encode()).hexdigest()[:12]
+
+    def snapshot(self, path: str, dataset: str = DEFAULT_DATASET) -> Optional[tuple[bytes, str]]:
+        """Compressed response and ETag of `path` in the published snapshot, None if there is no up to date one."""
+        manifest = self.snapshot_store.current_manifest()
+        if manifest is None or manifest["dataset"] != dataset or manifest["data_version"] != self.data_version(dataset):
+            return None
+
+        content = self.snapshot_store.read(manifest["version"], path)
+        return (content, f"{manifest['version']}/{path}") if content is not None else None
+
+    async def get_preset_density(self, name: str, start_hr: int, end_hr: int, dataset: str = DEFAULT_DATASET) -> List[TripDensity]:
+        return await self.trips_logic.get_preset_density(self.preset(name, dataset), start_hr, end_hr, dataset)
+
+    async def get_preset_earnings(self, name: str, dataset: str = DEFAULT_DATASET) -> List[TripEarning]:
+        preset = self.preset(name, dataset)
+        if not preset.has_earnings:
+            raise UnknownPresetError(f"Preset '{name}' has no earnings")
+        return await self.earnings_logic.get_earnings(preset.start_date, preset.end_date, [dataset])
+
+    async def build(self, dataset: str = DEFAULT_DATASET, location_ids: Sequence[int] = range(1, 266)) -> dict:
+        """Precompute every preset response of a dataset into a new snapshot version and publish it."""
+        data_version = self.data_version(dataset)
+        version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{data_version}"
+        presets = self.presets(dataset)
+        density_adapter = TypeAdapter(List[TripDensity])
+
+        for preset in presets.values():
+            # Requests per hour of day, so every start/end hour window is a sum of rows
+            hourly = np.stack([
+                (await self.trips_logic.trip_service.get_density_windows(list(preset.windows), hour, hour, [dataset])).sum(axis=0)
+                for hour in range(24)
+            ])
+            for start_hr in range(24):
+                for end_hr in range(start_hr, 24):
+                    rows = preset_density_rows(hourly[start_hr:end_hr + 1].sum(axis=0), preset, start_hr, end_hr)
+                    self.snapshot_store.write(version, density_path(preset.name, start_hr, end_hr), density_adapter.dump_json(rows))
+
+            if preset.has_earnings:
+                earnings = await self.earnings_logic.get_earnings(preset.start_date, preset.end_date, [dataset])
+                self.snapshot_store.write(version, earnings_path(preset.name), TypeAdapter(List[TripEarning]).dump_json(earnings))
+            print(f"[Snapshot] {dataset} {preset.name} written")
+
+        stats_adapter = TypeAdapter(List[ZoneHourStats])
+        for location_id in location_ids:
+            stats = await self.trips_logic.get_zone_stats(location_id, dataset)
+            self.snapshot_store.write(version, zone_stats_path(location_id), stats_adapter.dump_json(stats))
+
+        manifest = {
+            "version": version,
+            "dataset": dataset,
+            "data_version": data_version,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "presets": {
+                preset.name: {"windows": [[from_date.isoformat(), to_date.isoformat()] for from_date, to_date in preset.windows]}
+                for preset in presets.values()
+            },
+        }
+        self.snapshot_store.publish(version, manifest)
+        return manifest
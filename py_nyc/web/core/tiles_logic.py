@@ -0,0 +1,93 @@
+import asyncio
+from functools import lru_cache
+from typing import Dict, Iterable
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.core.snapshot_logic import SnapshotLogic
+from py_nyc.web.data_access.store.vector_tiles import TileStore, check_tile, compress_tile, get_zone_tiles
+from py_nyc.web.data_access.store.zone_geometry import level_for_zoom
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+from py_nyc.web.utils.ttl_cache import TTLCache
+
+# Zooms the map shows zones at, rendered ahead by the prerender_tiles job; others are rendered on request
+TILE_ZOOMS = range(9, 15)
+DEFAULT_TILE_PRESET = "last-month"
+
+
+def tile_key(preset: str, start_hr: int, end_hr: int) -> str:
+    return f"{preset}/{start_hr:02d}-{end_hr:02d}"
+
+
+@lru_cache()
+def get_tile_cache() -> TTLCache:
+    """Rendered tiles of this process, keyed by tile and data version so new data never serves stale tiles."""
+    return TTLCache(get_settings().tile_cache_size)
+
+
+@lru_cache()
+def get_zone_values_cache() -> TTLCache:
+    return TTLCache(32)
+
+
+class TilesLogic:
+    """
+    Mapbox vector tiles of the taxi zones with the density and earnings of a preset as feature
+    properties. Tiles are looked up in memory, then in the tiles pre-rendered for the current
+    data version, and only rendered when neither has them.
+    """
+
+    def __init__(self, snapshot_logic: SnapshotLogic, tile_store: TileStore, cache: TTLCache, zone_values_cache: TTLCache):
+        self.snapshot_logic = snapshot_logic
+        self.tile_store = tile_store
+        self.cache = cache
+        self.zone_values_cache = zone_values_cache
+
+    async def get_tile(self, z: int, x: int, y: int, preset: str = DEFAULT_TILE_PRESET, start_hr: int = 0, end_hr: int = 23,
+                       dataset: str = DEFAULT_DATASET) -> tuple[bytes, str]:
+        """Gzip compressed tile and its ETag."""
+        check_tile(z, x, y)
+        version = self.snapshot_logic.data_version(dataset)
+        key = tile_key(preset, start_hr, end_hr)
+        cache_key = (dataset, version, key, z, x, y)
+
+        content = self.cache.get(cache_key)
+        if content is None:
+            content = await asyncio.to_thread(self.tile_store.read, dataset, version, key, z, x, y)
+            if content is None:
+                content = await self.render_tile(z, x, y, preset, start_hr, end_hr, dataset)
+            self.cache.set(cache_key, content)
+        return content, f"{version}/{key}/{z}/{x}/{y}"
+
+    async def render_tile(self, z: int, x: int, y: int, preset: str, start_hr: int, end_hr: int, dataset: str = DEFAULT_DATASET) -> bytes:
+        values = await self.get_zone_values(preset, start_hr, end_hr, dataset)
+        zone_tiles = get_zone_tiles(level_for_zoom(z))
+        return compress_tile(await asyncio.to_thread(zone_tiles.render, z, x, y, values))
+
+    async def get_zone_values(self, preset: str, start_hr: int, end_hr: int, dataset: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """Density and earnings per zone, computed once per preset, hours and data version."""
+        cache_key = (dataset, self.snapshot_logic.data_version(dataset), tile_key(preset, start_hr, end_hr))
+        values = self.zone_values_cache.get(cache_key)
+        if values is None:
+            values = await self.snapshot_logic.trips_logic.get_preset_zone_values(
+                self.snapshot_logic.preset(preset, dataset), start_hr, end_hr, dataset)
+            self.zone_values_cache.set(cache_key, values)
+        return values
+
+    async def prerender(self, zooms: Iterable[int] = TILE_ZOOMS, preset: str = DEFAULT_TILE_PRESET, start_hr: int = 0, end_hr: int = 23,
+                        dataset: str = DEFAULT_DATASET) -> int:
+        """
+        Render every tile of the zones at the given zooms into the tile store for the current data version,
+        then drop the tiles of older versions. Returns the number of tiles written.
+        """
+        version = self.snapshot_logic.data_version(dataset)
+        key = tile_key(preset, start_hr, end_hr)
+        written = 0
+        for z in zooms:
+            for x, y in get_zone_tiles(level_for_zoom(z)).tiles(z):
+                content = await self.render_tile(z, x, y, preset, start_hr, end_hr, dataset)
+                await asyncio.to_thread(self.tile_store.write, dataset, version, key, z, x, y, content)
+                written += 1
+            print(f"[Tiles] {dataset} {key}: zoom {z} rendered, {written} tiles so far")
+
+        self.tile_store.prune(dataset, version)
+        return written
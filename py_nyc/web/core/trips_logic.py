@@ -1,18 +1,66 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Sequence
+import numpy as np
+from py_nyc.web.core.models import DensityComparison, DensityHotspots, HotspotCluster, OdHourStats, ZoneHotspot, TopZone, ZoneAnomaly, PayDistribution, TripFilters, ZoneDensityDelta, ZoneHourStats, ZonePayDistribution
+from py_nyc.web.core.presets import Preset
+from py_nyc.web.data_access.services.query_planner import split_by_month
 from py_nyc.web.data_access.services.trip_service import TripDensity, TripService
+from py_nyc.web.data_access.store.anomalies import ANOMALY_SCORE
+from py_nyc.web.data_access.store.taxi_zones import get_zone_table
+from py_nyc.web.data_access.store.histograms import BinSpec, histogram_quantile
+from py_nyc.web.data_access.store.trip_cube import N_ZONES
+from py_nyc.web.data_access.store.trip_stats import hour_of_week
+from py_nyc.web.data_access.store.unit_pay import UNIT_PAY_BINS, hour_of_week_mask
+from py_nyc.web.data_access.store.zone_adjacency import HOTSPOT_SCORE, get_zone_adjacency, getis_ord
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET
+
+
+class InvalidWindowError(Exception):
+    """Raised for a density window covering no hours, whose average per hour is undefined."""
+    pass
+
+
+def hourly_divisor(start_date: datetime, end_date: datetime, start_hr: int, end_hr: int) -> float:
+    """
+    Hours of [start_date, end_date) between start_hr and end_hr inclusive, as every backend filters them:
+    what request counts over the window are divided by for average requests per hour.
+    """
+    if start_hr > end_hr:
+        raise InvalidWindowError("startTime must not be after endTime")
+    if end_date <= start_date:
+        raise InvalidWindowError("endDate must be after startDate")
+    return (end_date - start_date) / timedelta(days=1) * (end_hr - start_hr + 1)
+
+
+def preset_divisor(preset: Preset, start_hr: int, end_hr: int) -> float:
+    """hourly_divisor summed over the windows of a preset."""
+    return sum(hourly_divisor(from_date, to_date, start_hr, end_hr) for from_date, to_date in preset.windows)
 
 
 class TripsLogic:
     def __init__(self, trip_service: TripService):
         self.trip_service = trip_service
 
-    def get_density(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int) -> list[TripDensity]:
+    def describe_query_plans(self) -> str:
+        """Backends chosen for each segment of the queries run so far, for the X-Query-Plan debug header."""
+        return " | ".join(plan.describe() for plan in self.trip_service.plans)
+
+    async def get_density(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                          filters: Optional[TripFilters] = None, progress: Optional[Callable[[float], None]] = None) -> list[TripDensity]:
+        """With `progress`, the range is queried a month at a time and the fraction done reported after each."""
         current_date = start_date
         res = {}
-        divisor = ((end_date - start_date).days + 1) * (end_hr - start_hr)
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
 
-        density = self.trip_service.get_density_between(
-            current_date, end_date, start_hr, end_hr)
+        if progress is None:
+            density = await self.trip_service.get_density_between(
+                current_date, end_date, start_hr, end_hr, datasets, filters)
+        else:
+            density = []
+            windows = split_by_month(start_date, end_date)
+            for done, (from_date, to_date) in enumerate(windows, 1):
+                density += await self.trip_service.get_density_between(from_date, to_date, start_hr, end_hr, datasets, filters)
+                progress(done / len(windows))
 
         for trip_density in density:
             if trip_density['location_id'] in res:
@@ -23,3 +71,242 @@ class TripsLogic:
                     trip_density['density']) / divisor
 
         return [TripDensity(location_id=location_id, density=round(density)) for location_id, density in res.items()]
+
+    async def get_density_columns(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                                  filters: Optional[TripFilters] = None) -> Dict[str, np.ndarray]:
+        """get_density as location_id and density arrays, computed on the density vector without per-zone rows."""
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
+        vector = await self.trip_service.get_density_vector(start_date, end_date, start_hr, end_hr, datasets, filters)
+        location_ids = np.flatnonzero(vector[1:]) + 1
+        return {"location_id": location_ids.astype(np.int32),
+                "density": np.round(np.round(vector[location_ids]) / divisor).astype(np.int64)}
+
+    async def get_density_by_zone(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int,
+                                  datasets: Sequence[str] = (DEFAULT_DATASET,), filters: Optional[TripFilters] = None) -> np.ndarray:
+        """get_density as a vector indexed by location id, 0 for zones without requests."""
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
+        vector = await self.trip_service.get_density_vector(start_date, end_date, start_hr, end_hr, datasets, filters)
+        return np.round(np.round(vector) / divisor)
+
+    async def get_top_zones(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int, k: int = 10,
+                            boroughs: Sequence[str] = (), datasets: Sequence[str] = (DEFAULT_DATASET,),
+                            filters: Optional[TripFilters] = None) -> list[TopZone]:
+        """The k zones (of `boroughs`, all when empty) with the highest density, busiest first."""
+        zone_table = get_zone_table()
+        zones = zone_table.zones_in(boroughs)
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
+        vector = await self.trip_service.get_density_vector(start_date, end_date, start_hr, end_hr, datasets, filters)
+
+        zones = zones[vector[zones] > 0]
+        k = min(k, len(zones))
+        top = zones[np.argpartition(-vector[zones], k - 1)[:k]] if k else zones
+        top = top[np.argsort(-vector[top], kind="stable")]
+
+        return [TopZone(location_id=location_id, zone=name, borough=borough, density=density)
+                for location_id, name, borough, density in zip(
+                    top.tolist(), zone_table.names[top], zone_table.boroughs[top], np.round(vector[top] / divisor, 2).tolist())]
+
+    async def get_density_hotspots(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int,
+                                   min_score: float = HOTSPOT_SCORE, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                                   filters: Optional[TripFilters] = None) -> DensityHotspots:
+        """
+        Density of every zone on the map smoothed over its neighbours, and its Getis-Ord Gi* score.
+        Zones scoring at least `min_score` are hotspots, grouped into clusters of zones sharing borders.
+        """
+        adjacency = get_zone_adjacency()
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
+        vector = await self.trip_service.get_density_vector(start_date, end_date, start_hr, end_hr, datasets, filters)
+        density = vector / divisor
+        smoothed, score = getis_ord(adjacency, density)
+        with np.errstate(invalid="ignore"):
+            clusters = adjacency.components(score >= min_score)
+
+        zones = np.flatnonzero(adjacency.mapped)
+        cluster_ids = np.unique(clusters[clusters >= 0])
+        members = [np.flatnonzero(clusters == cluster) for cluster in cluster_ids]
+        cluster_rows = sorted((HotspotCluster(
+            cluster=int(cluster),
+            location_ids=zone_ids.tolist(),
+            density=round(float(density[zone_ids].sum()), 2),
+            peak_location_id=int(zone_ids[np.argmax(density[zone_ids])])
+        ) for cluster, zone_ids in zip(cluster_ids, members)), key=lambda row: -row.density)
+
+        return DensityHotspots(
+            zones=[ZoneHotspot(
+                location_id=location_id,
+                density=round(zone_density, 2),
+                smoothed_density=round(zone_smoothed, 2),
+                score=round(zone_score, 2) if np.isfinite(zone_score) else None,
+                cluster=cluster if cluster >= 0 else None
+            ) for location_id, zone_density, zone_smoothed, zone_score, cluster in zip(
+                zones.tolist(), density[zones].tolist(), smoothed[zones].tolist(), score[zones].tolist(), clusters[zones].tolist())],
+            clusters=cluster_rows
+        )
+
+    async def get_preset_density(self, preset: Preset, start_hr: int, end_hr: int, dataset: str = DEFAULT_DATASET) -> list[TripDensity]:
+        """Average trip requests per hour of each zone over the windows of a preset, between start_hr and end_hr inclusive."""
+        density = await self.trip_service.get_density_windows(list(preset.windows), start_hr, end_hr, [dataset])
+        return preset_density_rows(density.sum(axis=0), preset, start_hr, end_hr)
+
+    async def get_preset_zone_values(self, preset: Preset, start_hr: int, end_hr: int, dataset: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """
+        Per-zone arrays indexed by location id over the windows of a preset: `density` as in
+        get_preset_density and `earnings`, the average driver pay per trip picked up in the zone.
+        NaN for zones without requests or pickups.
+        """
+        divisor = preset_divisor(preset, start_hr, end_hr)
+        totals = await self.trip_service.get_zone_totals(list(preset.windows), start_hr, end_hr,
+                                                         ["requests", "pickups", "driver_pay"], dataset)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "density": np.where(totals["requests"] > 0, np.round(totals["requests"] / divisor), np.nan),
+                "earnings": np.where(totals["pickups"] > 0, np.round(totals["driver_pay"] / totals["pickups"], 2), np.nan),
+            }
+
+    async def compare_density(self, start_date: datetime, end_date: datetime, start_hr: int, end_hr: int, offset_days: Sequence[int],
+                              datasets: Sequence[str] = (DEFAULT_DATASET,), top: int = 10) -> list[DensityComparison]:
+        """
+        Compare the density of a base window with the same window shifted back by each offset
+        (e.g. 7 for week-over-week, 364 for year-over-year). All windows are computed together;
+        deltas are base minus the shifted window, top movers are ranked by absolute delta.
+        """
+        windows = [(start_date, end_date)] + [
+            (start_date - timedelta(days=days), end_date - timedelta(days=days)) for days in offset_days]
+        divisor = hourly_divisor(start_date, end_date, start_hr, end_hr)
+
+        densities = await self.trip_service.get_density_windows(windows, start_hr, end_hr, datasets) / divisor
+        base = densities[0]
+
+        comparisons = []
+        for days, (from_date, to_date), compared in zip(offset_days, windows[1:], densities[1:]):
+            delta = base - compared
+            with np.errstate(invalid="ignore", divide="ignore"):
+                pct = np.where(compared > 0, delta / compared * 100, np.nan)
+
+            zones = np.flatnonzero((base > 0) | (compared > 0))
+            zones = zones[zones > 0]
+            k = min(top, len(zones))
+            movers = zones[np.argpartition(-np.abs(delta[zones]), k - 1)[:k]] if k else zones
+            movers = movers[np.argsort(-np.abs(delta[movers]), kind="stable")]
+
+            comparisons.append(DensityComparison(
+                offset_days=days,
+                start_date=from_date,
+                end_date=to_date,
+                zones=_zone_deltas(zones, base, compared, delta, pct),
+                top_movers=_zone_deltas(movers, base, compared, delta, pct)
+            ))
+
+        return comparisons
+
+    async def get_zone_stats(self, location_id: int, dataset: str = DEFAULT_DATASET) -> list[ZoneHourStats]:
+        """Median pickup wait, trip duration and speed of a pickup zone for every hour of the week."""
+        profile = await self.trip_service.get_zone_profile(dataset)
+        rows = _rows_by_hour({name: values[location_id] for name, values in profile.items()})
+
+        return [ZoneHourStats(
+            hour_of_week=hour,
+            trip_count=int(row["trips"]),
+            median_wait_seconds=row["median_wait_seconds"],
+            median_trip_seconds=row["median_trip_seconds"],
+            median_speed_mph=row["median_speed_mph"]
+        ) for hour, row in enumerate(rows)]
+
+    async def get_od_stats(self, pulocationid: int, dolocationid: int, dataset: str = DEFAULT_DATASET) -> list[OdHourStats]:
+        """Mean pickup wait, trip duration and speed between two zones for every hour of the week."""
+        profile = await self.trip_service.get_od_profile(pulocationid, dolocationid, dataset)
+        rows = _rows_by_hour(profile)
+
+        return [OdHourStats(
+            hour_of_week=hour,
+            trip_count=int(row["trips"]),
+            mean_wait_seconds=row["mean_wait_seconds"],
+            mean_trip_seconds=row["mean_trip_seconds"],
+            avg_speed_mph=row["avg_speed_mph"]
+        ) for hour, row in enumerate(rows)]
+
+    async def get_anomalies(self, start_date: Optional[datetime], end_date: Optional[datetime], location_ids: Sequence[int] = (),
+                            direction: str = "both", min_score: float = ANOMALY_SCORE, limit: int = 100,
+                            dataset: str = DEFAULT_DATASET) -> list[ZoneAnomaly]:
+        """
+        Zone hours whose demand deviated strongly from the zone's hour of week baseline, strongest first.
+        Without dates, the last week of ingested data.
+        """
+        index = await self.trip_service.get_anomaly_index(dataset)
+        if index.data_end is not None and (start_date is None or end_date is None):
+            end_date = end_date or index.data_end.astype(datetime)
+            start_date = start_date or end_date - timedelta(days=7)
+        if start_date is None or end_date is None:
+            return []
+
+        positions = index.query(start_date, end_date, location_ids, direction, min_score, limit)
+        hours = index["hour"][positions]
+        return [ZoneAnomaly(
+            location_id=int(location_id),
+            hour=hour,
+            hour_of_week=int(week_hour),
+            requests=int(requests),
+            baseline=float(baseline),
+            mad=float(mad),
+            score=round(float(score), 2)
+        ) for location_id, hour, week_hour, requests, baseline, mad, score in zip(
+            index["location_id"][positions], hours.astype(datetime), hour_of_week(hours), index["requests"][positions],
+            index["baseline"][positions], index["mad"][positions], index["score"][positions])]
+
+    async def get_pay_distribution(self, start_date: datetime, end_date: datetime, location_ids: Sequence[int], start_hr: int = 0, end_hr: int = 23,
+                                   weekdays: Sequence[int] = range(7), dataset: str = DEFAULT_DATASET) -> list[ZonePayDistribution]:
+        """
+        Histograms and percentiles of driver pay per mile and per minute of trips picked up in each zone
+        (or all zones together when none are given) between start_hr and end_hr on the given weekdays.
+        Summed from histograms binned at ingestion over the months overlapping the date range.
+        """
+        zones = np.array(location_ids if location_ids else range(1, N_ZONES))
+        hist = await self.trip_service.get_unit_pay_histograms(
+            start_date, end_date, zones, hour_of_week_mask(start_hr, end_hr, weekdays), dataset)
+        if not location_ids:
+            hist = {metric: counts.sum(axis=0, keepdims=True) for metric, counts in hist.items()}
+
+        return [ZonePayDistribution(
+            location_id=location_id,
+            pay_per_mile=_pay_distribution(hist["pay_per_mile"][i], UNIT_PAY_BINS["pay_per_mile"]),
+            pay_per_minute=_pay_distribution(hist["pay_per_minute"][i], UNIT_PAY_BINS["pay_per_minute"])
+        ) for i, location_id in enumerate(list(location_ids) or [None])]
+
+
+def preset_density_rows(counts: np.ndarray, preset: Preset, start_hr: int, end_hr: int) -> list[TripDensity]:
+    """Per-zone request counts over a preset as hourly averages, zones without requests left out."""
+    divisor = preset_divisor(preset, start_hr, end_hr)
+    return [TripDensity(location_id=int(location_id), density=round(counts[location_id] / divisor))
+            for location_id in np.flatnonzero(counts[1:]) + 1]
+
+
+PAY_PERCENTILES = {"p10": 0.1, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p90": 0.9}
+
+
+def _pay_distribution(counts: np.ndarray, spec: BinSpec) -> PayDistribution:
+    percentiles = {name: histogram_quantile(counts, spec, q) for name, q in PAY_PERCENTILES.items()}
+    return PayDistribution(
+        trip_count=int(counts.sum()),
+        bin_width=spec.step,
+        counts=counts.tolist(),
+        percentiles={name: None if np.isnan(value) else round(float(value), 2) for name, value in percentiles.items()}
+    )
+
+
+def _rows_by_hour(columns: Dict[str, np.ndarray]) -> list[dict]:
+    """Transpose per hour arrays into rows, turning NaN into None."""
+    lists = {name: np.round(values.astype(np.float64), 2).tolist() for name, values in columns.items()}
+    return [
+        {name: (None if value != value else value) for name, value in zip(lists, row)}
+        for row in zip(*lists.values())
+    ]
+
+
+def _zone_deltas(zones: np.ndarray, base: np.ndarray, compared: np.ndarray, delta: np.ndarray, pct: np.ndarray) -> list[ZoneDensityDelta]:
+    rows = zip(zones.tolist(), np.round(base[zones], 2).tolist(), np.round(compared[zones], 2).tolist(),
+               np.round(delta[zones], 2).tolist(), np.round(pct[zones], 1).tolist())
+    return [
+        ZoneDensityDelta(location_id=location_id, density=density, compare_density=compare_density,
+                         abs_delta=abs_delta, pct_delta=None if pct_delta != pct_delta else pct_delta)
+        for location_id, density, compare_density, abs_delta, pct_delta in rows
+    ]
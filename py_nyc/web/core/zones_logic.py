@@ -0,0 +1,61 @@
+import gzip
+import hashlib
+import json
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from py_nyc.web.core.models import ZoneLookup
+from py_nyc.web.data_access.store.taxi_zones import TAXI_ZONES_GEOJSON
+from py_nyc.web.data_access.store.zone_geometry import (GeometryLevel, ZoneFeatureTemplate, ZoneGeometryStore, compress_geojson,
+                                                        get_zone_geometry_store, get_zone_topology, level_for_zoom)
+from py_nyc.web.data_access.store.zone_index import ZoneIndex
+
+
+@lru_cache()
+def _simplified_geometry(level: GeometryLevel) -> bytes:
+    return compress_geojson(get_zone_topology().simplified(level))
+
+
+# Level -> (file version, compressed GeoJSON, ETag) served by get_geometry
+_geometry_cache: Dict[GeometryLevel, Tuple[Optional[int], bytes, str]] = {}
+
+
+@lru_cache()
+def _feature_template(level: Optional[GeometryLevel]) -> ZoneFeatureTemplate:
+    """Density template of a level, or of the source file at full detail without one."""
+    if level is None:
+        with open(TAXI_ZONES_GEOJSON) as file:
+            return ZoneFeatureTemplate(json.load(file))
+    content = get_zone_geometry_store().read(level) or _simplified_geometry(level)
+    return ZoneFeatureTemplate(json.loads(gzip.decompress(content)))
+
+
+class ZonesLogic:
+    def __init__(self, geometry_store: ZoneGeometryStore, zone_index: ZoneIndex):
+        self.geometry_store = geometry_store
+        self.zone_index = zone_index
+
+    def get_geometry(self, zoom: int) -> tuple[bytes, str]:
+        """
+        Gzip compressed zone GeoJSON at the level of detail of a map zoom, and its ETag.
+        Levels not written by the build_zone_geometries job are simplified here, once per process.
+        """
+        level = level_for_zoom(zoom)
+        version = self.geometry_store.version(level)
+        cached = _geometry_cache.get(level)
+        if cached is None or cached[0] != version:
+            # Read and hashed again only when the job rewrites the level
+            content = (self.geometry_store.read(level) if version is not None else None) or _simplified_geometry(level)
+            cached = _geometry_cache[level] = (version, content, f"{level.name}-{hashlib.sha1(content).hexdigest()[:12]}")
+        return cached[1], cached[2]
+
+    def get_density_geojson(self, density: np.ndarray, zoom: Optional[int] = None) -> bytes:
+        """
+        Zone GeoJSON (at the level of detail of `zoom`, full detail without one) with every feature's
+        density filled in from `density`, a per-zone vector indexed by location id.
+        """
+        return _feature_template(level_for_zoom(zoom) if zoom is not None else None).render(density)
+
+    def lookup_points(self, longitudes: Sequence[float], latitudes: Sequence[float]) -> ZoneLookup:
+        """Taxi zone of every point, resolved in one vectorized pass over the zone index."""
+        return ZoneLookup(location_ids=self.zone_index.lookup(np.asarray(longitudes), np.asarray(latitudes)).tolist())
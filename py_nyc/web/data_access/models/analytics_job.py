@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import Any, Optional
+from beanie import Document
+from pymongo import ASCENDING, IndexModel
+
+
+class AnalyticsJobRecord(Document):
+    """
+    State and result of a background analytics job, shared by every API process. The id is the
+    hash of the query, so identical queries submitted to any process find the same job.
+    """
+    id: str
+    kind: str
+    params: dict
+    status: str
+    progress: float = 0.0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None  # JSON encoded response of the matching /trips endpoint
+    error: Optional[str] = None
+    owner: str  # the API process running the job
+    heartbeat_at: datetime  # refreshed by the owner while the job is queued or running
+    expires_at: Optional[datetime] = None  # set once finished
+
+    class Settings:
+        name = "analytics_jobs"
+        indexes = [
+            "owner",
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        ]
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from beanie import Document, Granularity, PydanticObjectId, TimeSeriesConfig
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class DriverTrip(Document):
+    """
+    A trip from a driver's own trip history upload. Stored in a time series
+    collection bucketed per driver (user_id is the meta field).
+    """
+    user_id: PydanticObjectId
+    request_datetime: datetime
+    driver_pay: float
+    base_passenger_fare: float
+    trip_miles: float
+    trip_time: int  # seconds
+    pulocationid: int
+    dolocationid: int
+    uploaded_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "driver_trips"
+        timeseries = TimeSeriesConfig(
+            time_field="request_datetime",
+            meta_field="user_id",
+            granularity=Granularity.hours
+        )
+
+
+class DriverTripKey(Document):
+    """
+    Identity of an uploaded trip. Time series collections cannot have unique indexes,
+    so uploads claim their trips here first and only insert and count the ones they claimed.
+    """
+    user_id: PydanticObjectId
+    request_datetime: datetime
+    pulocationid: int
+    dolocationid: int
+
+    class Settings:
+        name = "driver_trip_keys"
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("request_datetime", ASCENDING),
+                        ("pulocationid", ASCENDING), ("dolocationid", ASCENDING)], unique=True)
+        ]
+
+
+class DriverHourlyEarnings(Document):
+    """
+    Running totals of a driver's uploaded trips per hour, incremented as trips
+    are inserted so dashboards never aggregate the raw trips.
+    """
+    user_id: PydanticObjectId
+    hour: datetime  # request hour, truncated
+    trip_count: int = 0
+    driver_pay: float = 0
+    base_passenger_fare: float = 0
+    trip_miles: float = 0
+    trip_seconds: int = 0
+
+    class Settings:
+        name = "driver_hourly_earnings"
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("hour", ASCENDING)], unique=True)
+        ]
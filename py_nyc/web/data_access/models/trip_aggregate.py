@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from beanie import Document, Granularity, TimeSeriesConfig
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
+
+
+class ZoneHourMeta(BaseModel):
+    dataset: str
+    month: str  # YYYY-MM, so a re-ingested month is replaced with a meta field delete
+    location_id: int
+
+
+class ZoneHourAggregate(Document):
+    """
+    Trip aggregates of one pickup zone and hour, the cells of a local TripCube,
+    in a time series collection every API node can query.
+    """
+    hour: datetime
+    meta: ZoneHourMeta
+    requests: float
+    pickups: float
+    driver_pay: float
+    trip_time: float
+    trip_miles: float
+
+    class Settings:
+        name = "zone_hour_aggregates"
+        timeseries = TimeSeriesConfig(
+            time_field="hour",
+            meta_field="meta",
+            granularity=Granularity.hours
+        )
+
+
+class TripAggregateMonth(Document):
+    """A month whose aggregates are completely loaded, written after its cells."""
+    dataset: str
+    month: str
+    rows: int
+    ingested_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "trip_aggregate_months"
+        indexes = [
+            IndexModel([("dataset", ASCENDING), ("month", ASCENDING)], unique=True)
+        ]
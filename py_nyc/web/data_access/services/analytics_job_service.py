@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from bson.codec_options import CodecOptions
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class AnalyticsJobService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        # Timezone aware, like the job timestamps reported to clients
+        self.collection = db.get_collection('analytics_jobs', codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc))
+
+    async def get_job(self, id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": id})
+
+    async def create_job(self, job: dict, stale_before: datetime) -> bool:
+        """
+        Insert a job, replacing one with the same id that failed, expired or whose owner stopped
+        heartbeating before `stale_before`. False if another process already has the job.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one({"_id": job["_id"], "$or": [
+                {"status": FAILED},
+                {"expires_at": {"$lte": now}},
+                {"status": {"$in": [QUEUED, RUNNING]}, "heartbeat_at": {"$lt": stale_before}},
+            ]}, {"$set": {name: value for name, value in job.items() if name != "_id"}}, upsert=True)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def update_job(self, id: str, owner: str, fields: dict) -> None:
+        """Update a job, unless another process took it over meanwhile."""
+        await self.collection.update_one({"_id": id, "owner": owner}, {"$set": fields})
+
+    async def delete_job(self, id: str, owner: str) -> None:
+        await self.collection.delete_one({"_id": id, "owner": owner})
+
+    async def heartbeat(self, owner: str, progress: Dict[str, float]) -> None:
+        """Mark the owner's unfinished jobs as alive, with the progress of each."""
+        if not progress:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.bulk_write([
+            UpdateOne({"_id": id, "owner": owner, "status": {"$in": [QUEUED, RUNNING]}},
+                      {"$set": {"progress": job_progress, "heartbeat_at": now}})
+            for id, job_progress in progress.items()
+        ], ordered=False)
+
+    async def fail_unfinished(self, owner: str, error: str, expires_at: datetime) -> None:
+        """Fail the owner's queued and running jobs, e.g. when it shuts down."""
+        await self.collection.update_many({"owner": owner, "status": {"$in": [QUEUED, RUNNING]}}, {"$set": {
+            "status": FAILED, "error": error, "finished_at": datetime.now(timezone.utc), "expires_at": expires_at}})
@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from beanie import PydanticObjectId
+from py_nyc.web.data_access.models.driver_trip import DriverHourlyEarnings
+
+DUPLICATE_KEY = 11000
+
+
+class DriverTripService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.trip_collection = db.get_collection('driver_trips')
+        self.earnings_collection = db.get_collection('driver_hourly_earnings')
+        self.key_collection = db.get_collection('driver_trip_keys')
+
+    async def get_trip_keys(self, user_id: PydanticObjectId, from_date: datetime, to_date: datetime) -> set[tuple]:
+        """(request_datetime, pulocationid, dolocationid) of the driver's trips requested between from_date and to_date inclusive."""
+        cursor = self.trip_collection.find(
+            {"user_id": user_id, "request_datetime": {"$gte": from_date, "$lte": to_date}},
+            {"_id": 0, "request_datetime": 1, "pulocationid": 1, "dolocationid": 1}
+        )
+        return {(doc["request_datetime"], doc["pulocationid"], doc["dolocationid"]) async for doc in cursor}
+
+    async def claim_trip_keys(self, user_id: PydanticObjectId, keys: List[tuple]) -> set[tuple]:
+        """
+        Record the (request_datetime, pulocationid, dolocationid) keys of trips about to be inserted and
+        return those no upload had recorded yet. The unique index lets only one concurrent upload claim a trip.
+        """
+        if not keys:
+            return set()
+        try:
+            await self.key_collection.insert_many([
+                {"user_id": user_id, "request_datetime": request_datetime, "pulocationid": pulocationid, "dolocationid": dolocationid}
+                for request_datetime, pulocationid, dolocationid in keys
+            ], ordered=False)
+            return set(keys)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            taken = {error["index"] for error in errors}
+            return {key for i, key in enumerate(keys) if i not in taken}
+
+    async def release_trip_keys(self, user_id: PydanticObjectId, keys: List[tuple]) -> None:
+        """Forget claimed keys whose trips were not inserted, so uploading them again loads them."""
+        if not keys:
+            return
+        await self.key_collection.delete_many({"user_id": user_id, "$or": [
+            {"request_datetime": request_datetime, "pulocationid": pulocationid, "dolocationid": dolocationid}
+            for request_datetime, pulocationid, dolocationid in keys
+        ]})
+
+    async def delete_trips(self, user_id: PydanticObjectId, keys: List[tuple]) -> None:
+        """Delete the driver's trips with the given keys, e.g. a batch whose rollups could not be updated."""
+        if not keys:
+            return
+        await self.trip_collection.delete_many({"user_id": user_id, "$or": [
+            {"request_datetime": request_datetime, "pulocationid": pulocationid, "dolocationid": dolocationid}
+            for request_datetime, pulocationid, dolocationid in keys
+        ]})
+
+    async def get_trips(self, user_id: PydanticObjectId, from_date: datetime, to_date: datetime, fields: List[str]) -> List[dict]:
+        """The given fields of the driver's trips requested in [from_date, to_date)."""
+        cursor = self.trip_collection.find(
+            {"user_id": user_id, "request_datetime": {"$gte": from_date, "$lt": to_date}},
+            {"_id": 0, **{field: 1 for field in fields}}
+        )
+        return await cursor.to_list(length=None)
+
+    async def insert_trips(self, trips: List[dict]) -> int:
+        """Bulk insert trip documents, returns the number inserted."""
+        if not trips:
+            return 0
+        result = await self.trip_collection.insert_many(trips, ordered=False)
+        return len(result.inserted_ids)
+
+    async def increment_hourly_earnings(self, user_id: PydanticObjectId, totals: Dict[datetime, dict]) -> None:
+        """Add per hour totals to the driver's rollups, creating missing hours. All hours are added or none."""
+        if not totals:
+            return
+        try:
+            await self.earnings_collection.bulk_write([
+                UpdateOne({"user_id": user_id, "hour": hour}, {"$inc": increments}, upsert=True)
+                for hour, increments in totals.items()
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Take the hours that were added off again
+            failed = {error["index"] for error in e.details["writeErrors"]}
+            applied = [UpdateOne({"user_id": user_id, "hour": hour}, {"$inc": {name: -value for name, value in increments.items()}})
+                       for i, (hour, increments) in enumerate(totals.items()) if i not in failed]
+            if applied:
+                await self.earnings_collection.bulk_write(applied, ordered=False)
+            raise
+
+    async def get_hourly_earnings(self, user_id: PydanticObjectId, from_date: datetime, to_date: datetime) -> list[DriverHourlyEarnings]:
+        return await DriverHourlyEarnings.find(
+            DriverHourlyEarnings.user_id == user_id,
+            DriverHourlyEarnings.hour >= from_date,
+            DriverHourlyEarnings.hour < to_date
+        ).sort("+hour").to_list()
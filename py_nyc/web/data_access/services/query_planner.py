@@ -0,0 +1,97 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, months_between, next_month
+from py_nyc.web.external.tlc_datasets import TlcDataset
+from py_nyc.web.utils.ttl_cache import TTLCache
+
+CACHE = "cache"
+LOCAL = "local"
+MONGO = "mongo"
+SODA = "soda"
+
+
+@dataclass
+class PlanSegment:
+    """A slice of a query and the backend chosen to answer it."""
+    dataset: TlcDataset
+    backend: str
+    from_date: datetime
+    to_date: datetime
+    # Local: when the partition was ingested. Cache: seconds until the entry expires. Mongo: months loaded.
+    freshness: Optional[str] = None
+
+    def describe(self) -> str:
+        span = f"{self.from_date:%Y-%m-%dT%H:%M}..{self.to_date:%Y-%m-%dT%H:%M}"
+        return f"{self.dataset.key} {self.backend} {span}" + (f" ({self.freshness})" if self.freshness else "")
+
+
+@dataclass
+class QueryPlan:
+    query: str
+    segments: List[PlanSegment] = field(default_factory=list)
+
+    def describe(self) -> str:
+        return f"{self.query}: " + ", ".join(segment.describe() for segment in self.segments)
+
+
+def split_by_month(from_date: datetime, to_date: datetime) -> List[tuple]:
+    """[from_date, to_date) cut at month boundaries."""
+    bounds = [from_date] + [datetime(month.year, month.month, 1) for month in months_between(from_date, to_date)[1:]] + [to_date]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def is_hour_aligned(value: datetime) -> bool:
+    return value.minute == 0 and value.second == 0 and value.microsecond == 0
+
+
+class QueryPlanner:
+    """
+    Splits a trip query into month segments and picks the cheapest backend able to answer each:
+
+      local  the month is ingested into the local store, after the month ended
+             (a partition ingested mid-month or before TLC published the month is incomplete)
+      cache  the exact segment is in the dataset's SODA result cache and not expired
+      soda   anything else
+
+    The local cubes are hourly, so segments not starting and ending on a full hour skip them.
+    """
+
+    def __init__(self, store: LocalTripStore):
+        self.store = store
+
+    def local_freshness(self, dataset_key: str, from_date: datetime, to_date: datetime, aggregate: str = "cube") -> Optional[str]:
+        """When the month of the segment was ingested, or None if the store cannot answer it from `aggregate`."""
+        if not (is_hour_aligned(from_date) and is_hour_aligned(to_date)):
+            return None
+
+        month = months_between(from_date, to_date)[0]
+        if not self.store.has_months(dataset_key, [month]) or not self.store.has_aggregate(dataset_key, month, aggregate):
+            return None
+
+        meta = self.store.read_meta(dataset_key, month)
+        ingested_at = datetime.fromisoformat(meta["ingested_at"])
+        month_end = datetime(next_month(month).year, next_month(month).month, 1, tzinfo=timezone.utc)
+        if meta["rows"] == 0 or ingested_at < month_end:
+            return None
+        return meta["ingested_at"]
+
+    def plan(self, query: str, datasets: List[TlcDataset], from_date: datetime, to_date: datetime,
+             cache_for: Callable[[TlcDataset], TTLCache], cache_key: Callable[[TlcDataset, datetime, datetime], tuple],
+             aggregate: str = "cube") -> QueryPlan:
+        """
+        `cache_key(dataset, from_date, to_date)` is the key the SODA result of a segment is cached under,
+        `aggregate` the store aggregate local segments are answered from.
+        """
+        plan = QueryPlan(query)
+        for dataset in datasets:
+            for start, end in split_by_month(from_date, to_date):
+                ingested_at = self.local_freshness(dataset.key, start, end, aggregate)
+                expires_in = cache_for(dataset).expires_in(cache_key(dataset, start, end))
+                if ingested_at is not None:
+                    plan.segments.append(PlanSegment(dataset, LOCAL, start, end, f"ingested {ingested_at}"))
+                elif expires_in is not None:
+                    plan.segments.append(PlanSegment(dataset, CACHE, start, end, f"expires in {expires_in:.0f}s"))
+                else:
+                    plan.segments.append(PlanSegment(dataset, SODA, start, end))
+        return plan
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timezone
+from typing import Dict, List, Sequence
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from py_nyc.web.data_access.store.trip_cube import CUBE_FIELDS, N_ZONES, ONE_HOUR, TripCube
+
+# Documents per insert_many when loading a month
+INSERT_BATCH = 10000
+
+
+class TripAggregateService:
+    """Hourly per-zone trip aggregates kept in MongoDB, for nodes without a local trip store."""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.aggregate_collection = db.get_collection('zone_hour_aggregates')
+        self.month_collection = db.get_collection('trip_aggregate_months')
+
+    async def months(self, dataset_key: str) -> set[str]:
+        """Completely loaded months (YYYY-MM) of a dataset."""
+        cursor = self.month_collection.find({"dataset": dataset_key}, {"_id": 0, "month": 1})
+        return {doc["month"] async for doc in cursor}
+
+    async def replace_month(self, dataset_key: str, month: date, cube: TripCube, rows: int) -> int:
+        """
+        Load the non-empty cells of a month's cube, replacing the month if it was loaded before.
+        The month is unlisted while its cells are rewritten, so queries fall back meanwhile.
+        """
+        month_key = f"{month:%Y-%m}"
+        await self.month_collection.delete_one({"dataset": dataset_key, "month": month_key})
+        await self.aggregate_collection.delete_many({"meta.dataset": dataset_key, "meta.month": month_key})
+
+        hour_idx, zones = np.nonzero((cube["requests"] > 0) | (cube["pickups"] > 0))
+        hours = (cube.start + hour_idx * ONE_HOUR).astype("datetime64[ms]").tolist()
+        values = {field: cube[field][hour_idx, zones].astype(np.float64).tolist() for field in CUBE_FIELDS}
+
+        documents = [{
+            "hour": hour,
+            "meta": {"dataset": dataset_key, "month": month_key, "location_id": int(zone)},
+            **{field: values[field][i] for field in CUBE_FIELDS}
+        } for i, (hour, zone) in enumerate(zip(hours, zones))]
+        for start in range(0, len(documents), INSERT_BATCH):
+            await self.aggregate_collection.insert_many(documents[start:start + INSERT_BATCH], ordered=False)
+
+        await self.month_collection.insert_one(
+            {"dataset": dataset_key, "month": month_key, "rows": rows, "ingested_at": datetime.now(timezone.utc)})
+        return len(documents)
+
+    async def density(self, dataset_keys: Sequence[str], from_date: datetime, to_date: datetime, start_hr: int, end_hr: int) -> np.ndarray:
+        """Trip requests per zone over the hours of [from_date, to_date) between start_hr and end_hr, shape (N_ZONES,)."""
+        cursor = self.aggregate_collection.aggregate([
+            _match(dataset_keys, from_date, to_date),
+            {"$match": {"$expr": {"$and": [
+                {"$gte": [{"$hour": "$hour"}, start_hr]},
+                {"$lte": [{"$hour": "$hour"}, end_hr]}
+            ]}}},
+            {"$group": {"_id": "$meta.location_id", "density": {"$sum": "$requests"}}}
+        ])
+
+        vector = np.zeros(N_ZONES)
+        async for row in cursor:
+            if 0 <= row["_id"] < N_ZONES:
+                vector[row["_id"]] = row["density"]
+        return vector
+
+    async def earnings(self, dataset_keys: Sequence[str], from_date: datetime, to_date: datetime) -> List[Dict]:
+        """Hourly driver pay and trip counts of [from_date, to_date), as SODA shaped earnings rows."""
+        cursor = self.aggregate_collection.aggregate([
+            _match(dataset_keys, from_date, to_date),
+            {"$group": {"_id": "$hour", "trip_count": {"$sum": "$pickups"}, "total_driver_pay": {"$sum": "$driver_pay"}}},
+            {"$match": {"trip_count": {"$gt": 0}}},
+            {"$sort": {"_id": 1}}
+        ])
+
+        return [{'pickup_date': f"{row['_id']:%Y-%m-%d}T00:00:00.000", 'pickup_hour': row['_id'].hour,
+                 'total_driver_pay': round(row['total_driver_pay'], 2), 'trip_count': int(row['trip_count'])}
+                async for row in cursor]
+
+
+def _match(dataset_keys: Sequence[str], from_date: datetime, to_date: datetime) -> dict:
+    return {"$match": {"meta.dataset": {"$in": list(dataset_keys)}, "hour": {"$gte": from_date, "$lt": to_date}}}
@@ -1,13 +1,341 @@
+import asyncio
 from datetime import datetime
-from typing import List
-from py_nyc.web.core.models import TripDensity, TripEarningSoQL
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.core.models import TripDensity, TripEarningSoQL, TripFilters
+from py_nyc.web.data_access.services.query_planner import LOCAL, MONGO, PlanSegment, QueryPlan, QueryPlanner, is_hour_aligned
+from py_nyc.web.data_access.services.trip_aggregate_service import TripAggregateService
+from py_nyc.web.data_access.store.anomalies import AnomalyIndex
+from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, TripDataNotIngestedError, months_between
+from py_nyc.web.data_access.store.trip_cube import N_ZONES, ONE_HOUR, TripCube
+from py_nyc.web.data_access.store.unit_pay import UNIT_PAY_BINS
 from py_nyc.web.external.nyc_open_data_api import get_density_soda, get_earnings_soda
+from py_nyc.web.external.tlc_datasets import DEFAULT_DATASET, FLAG_COLUMNS, TlcDataset, get_datasets
+from py_nyc.web.utils.ttl_cache import TTLCache
+
+
+@lru_cache()
+def get_source_cache(dataset_key: str) -> TTLCache:
+    """Query result cache of a single dataset. Only created once per dataset."""
+    settings = get_settings()
+    return TTLCache(settings.trip_query_cache_size, settings.trip_query_cache_ttl_seconds)
 
 
 class TripService:
+    """
+    Unified query layer over the TLC trip datasets.
+    Queries are split into month segments, each answered by the cheapest backend covering it
+    (local cube, query cache or SODA), and the segments run concurrently.
+    With `aggregates`, density and earnings queries whose months are all loaded into MongoDB
+    are answered by a single aggregation pipeline instead.
+    The plans of the queries run by this instance are kept in `plans` for debugging.
+    """
+
+    def __init__(self, store: LocalTripStore, aggregates: Optional[TripAggregateService] = None):
+        self.store = store
+        self.aggregates = aggregates
+        self.planner = QueryPlanner(store)
+        self.plans: List[QueryPlan] = []
+
+    async def get_density_between(self, from_date: datetime, to_date: datetime, start_hr: int, end_hr: int, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                                  filters: Optional[TripFilters] = None) -> List[TripDensity]:
+        """Density of the trips matching `filters`, answered from the ingested flag bitmaps where possible."""
+        return density_rows(await self.get_density_vector(from_date, to_date, start_hr, end_hr, datasets, filters))
+
+    async def get_density_vector(self, from_date: datetime, to_date: datetime, start_hr: int, end_hr: int, datasets: Sequence[str] = (DEFAULT_DATASET,),
+                                 filters: Optional[TripFilters] = None) -> np.ndarray:
+        """Density as a per-zone count vector of shape (N_ZONES,)."""
+        sources = get_datasets(list(datasets))
+        filters = filters if filters and filters.selected() else None
+        for dataset in sources:
+            for flag in (filters.selected() if filters else {}):
+                dataset.column(FLAG_COLUMNS[flag])  # Fail before querying anything
+
+        if not filters and await self._mongo_covers("density", sources, from_date, to_date):
+            return await self.aggregates.density([dataset.key for dataset in sources], from_date, to_date, start_hr, end_hr)
+
+        return await self._planned_density(sources, from_date, to_date, start_hr, end_hr, filters)
+
+    async def get_earnings_data(self, start_date: datetime, end_date: datetime, datasets: Sequence[str] = (DEFAULT_DATASET,)) -> List[TripEarningSoQL]:
+        sources = get_datasets(list(datasets))
+        for dataset in sources:
+            dataset.column("driver_pay")  # Fail before querying anything
+
+        if await self._mongo_covers("earnings", sources, start_date, end_date):
+            return await self.aggregates.earnings([dataset.key for dataset in sources], start_date, end_date)
+
+        plan = await self._plan("earnings", sources, start_date, end_date, get_earnings_soda)
+        results = await asyncio.gather(*[self._earnings_segment(segment) for segment in plan.segments])
+
+        return merge_earnings_rows(results)
+
+    async def get_earnings_columns(self, start_date: datetime, end_date: datetime, datasets: Sequence[str] = (DEFAULT_DATASET,)) -> Dict[str, np.ndarray]:
+        """
+        Hourly earnings as arrays sorted by hour: hour (datetime64[h]), trip_count and total_driver_pay.
+        Local segments are read straight from their cubes, without building a row per hour.
+        """
+        sources = get_datasets(list(datasets))
+        for dataset in sources:
+            dataset.column("driver_pay")
+
+        if await self._mongo_covers("earnings", sources, start_date, end_date):
+            return earnings_columns(await self.aggregates.earnings([dataset.key for dataset in sources], start_date, end_date))
+
+        plan = await self._plan("earnings", sources, start_date, end_date, get_earnings_soda)
+        results = await asyncio.gather(*[self._earnings_segment_columns(segment) for segment in plan.segments])
+
+        return merge_earnings_columns(results)
+
+    async def get_density_windows(self, windows: List[tuple], start_hr: int, end_hr: int, datasets: Sequence[str] = (DEFAULT_DATASET,)) -> np.ndarray:
+        """
+        Trip counts per zone for several (from_date, to_date) windows, shape (len(windows), N_ZONES).
+        Datasets with every month ingested are answered in one pass over their local cubes,
+        the others with concurrent SODA queries.
+        """
+        per_source = await asyncio.gather(*[
+            self._density_windows_from_source(dataset, windows, start_hr, end_hr)
+            for dataset in get_datasets(list(datasets))
+        ])
+
+        return np.sum(per_source, axis=0, dtype=np.float64)
+
+    async def _density_windows_from_source(self, dataset: TlcDataset, windows: List[tuple], start_hr: int, end_hr: int) -> np.ndarray:
+        months = sorted({month for from_date, to_date in windows for month in months_between(from_date, to_date)})
+        cubes = await asyncio.to_thread(self.store.load_cubes, dataset.key, months)
+        if cubes is not None:
+            return sum(cube.density_windows(windows, start_hr, end_hr) for cube in cubes)
+
+        return np.stack(await asyncio.gather(*[
+            self._planned_density([dataset], from_date, to_date, start_hr, end_hr)
+            for from_date, to_date in windows
+        ]))
+
+    async def get_zone_totals(self, windows: List[tuple], start_hr: int, end_hr: int, fields: Sequence[str],
+                              dataset_key: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """Per-zone totals of cube fields summed over several windows, each of shape (N_ZONES,), from ingested data only."""
+        months = sorted({month for from_date, to_date in windows for month in months_between(from_date, to_date)})
+        cubes = await asyncio.to_thread(self.store.load_cubes, dataset_key, months)
+        if cubes is None:
+            raise TripDataNotIngestedError(f"Trip data of dataset '{dataset_key}' has not been ingested for every month of the windows")
+        return {field: sum(cube.density_windows(windows, start_hr, end_hr, field).sum(axis=0, dtype=np.float64) for cube in cubes)
+                for field in fields}
+
+    async def get_zone_profile(self, dataset_key: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """Per (zone, hour of week) trip counts and medians aggregated at ingestion."""
+        return await asyncio.to_thread(lambda: self.store.load_stats(dataset_key).zone_profile)
+
+    async def get_od_profile(self, pulocationid: int, dolocationid: int, dataset_key: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """Per hour of week trip counts and means of one OD pair aggregated at ingestion."""
+        return await asyncio.to_thread(lambda: self.store.load_stats(dataset_key).od_profile(pulocationid, dolocationid))
+
+    async def get_anomaly_index(self, dataset_key: str = DEFAULT_DATASET) -> AnomalyIndex:
+        """Zone hours of unusual demand flagged by the detect_anomalies job."""
+        return await asyncio.to_thread(self.store.load_anomalies, dataset_key)
+
+    async def get_unit_pay_histograms(self, from_date: datetime, to_date: datetime, zones: np.ndarray, hours_of_week: np.ndarray,
+                                      dataset_key: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """
+        Pay per mile and per minute histograms of the given zones over the selected hours of week,
+        summed over the months overlapping [from_date, to_date). Each of shape (len(zones), n_bins).
+        """
+        def load() -> Dict[str, np.ndarray]:
+            months = self.store.load_unit_pay(dataset_key, months_between(from_date, to_date))
+            return {
+                metric: sum((month.window(metric, zones, hours_of_week) for month in months),
+                            np.zeros((len(zones), spec.n_bins), dtype=np.uint64))
+                for metric, spec in UNIT_PAY_BINS.items()
+            }
+
+        return await asyncio.to_thread(load)
+
+    async def get_unit_pay_cells(self, from_date: datetime, to_date: datetime, zones: np.ndarray, hours_of_week: np.ndarray,
+                                 dataset_key: str = DEFAULT_DATASET) -> Dict[str, np.ndarray]:
+        """
+        Pay per mile and per minute histograms of the (zones[i], hours_of_week[i]) pairs, summed over
+        the months overlapping [from_date, to_date). Each of shape (len(zones), n_bins).
+        """
+        def load() -> Dict[str, np.ndarray]:
+            months = self.store.load_unit_pay(dataset_key, months_between(from_date, to_date))
+            return {
+                metric: sum((month.cells(metric, zones, hours_of_week) for month in months),
+                            np.zeros((len(zones), spec.n_bins), dtype=np.uint64))
+                for metric, spec in UNIT_PAY_BINS.items()
+            }
+
+        return await asyncio.to_thread(load)
+
+    async def get_cube(self, from_date: datetime, to_date: datetime, dataset_key: str = DEFAULT_DATASET) -> TripCube:
+        """Hourly per-zone aggregates over the months overlapping [from_date, to_date), from ingested data only."""
+        cube = await asyncio.to_thread(self.store.load_cube, dataset_key, from_date, to_date)
+        if cube is None:
+            raise TripDataNotIngestedError(
+                f"Trip data of dataset '{dataset_key}' has not been ingested for {from_date:%Y-%m-%d} - {to_date:%Y-%m-%d}")
+        return cube
+
+    async def _mongo_covers(self, query: str, sources: List[TlcDataset], from_date: datetime, to_date: datetime) -> bool:
+        """Whether every month of the query is loaded into MongoDB (hourly, like the local cubes), recording the plan if so."""
+        if self.aggregates is None or not (is_hour_aligned(from_date) and is_hour_aligned(to_date)):
+            return False
+
+        months = {f"{month:%Y-%m}" for month in months_between(from_date, to_date)}
+        loaded = await asyncio.gather(*[self.aggregates.months(dataset.key) for dataset in sources])
+        if not all(months <= dataset_months for dataset_months in loaded):
+            return False
+
+        self.plans.append(QueryPlan(query, [
+            PlanSegment(dataset, MONGO, from_date, to_date, f"{len(months)} months loaded") for dataset in sources]))
+        return True
+
+    async def _plan(self, query: str, sources: List[TlcDataset], from_date: datetime, to_date: datetime, query_fn, *args,
+                    aggregate: str = "cube") -> QueryPlan:
+        plan = await asyncio.to_thread(
+            self.planner.plan, query, sources, from_date, to_date,
+            lambda dataset: get_source_cache(dataset.key),
+            lambda dataset, start, end: _cache_key(dataset, query_fn, start, end, *args), aggregate)
+        self.plans.append(plan)
+        return plan
+
+    async def _planned_density(self, sources: List[TlcDataset], from_date: datetime, to_date: datetime, start_hr: int, end_hr: int,
+                               filters: Optional[TripFilters] = None) -> np.ndarray:
+        plan = await self._plan("density", sources, from_date, to_date, get_density_soda, start_hr, end_hr, filters,
+                                aggregate="bitmaps" if filters else "cube")
+        vectors = await asyncio.gather(*[self._density_segment(segment, start_hr, end_hr, filters) for segment in plan.segments])
+        return np.sum(vectors, axis=0, dtype=np.float64) if vectors else np.zeros(N_ZONES)
+
+    async def _density_segment(self, segment: PlanSegment, start_hr: int, end_hr: int, filters: Optional[TripFilters]) -> np.ndarray:
+        if segment.backend == LOCAL and filters:
+            month = months_between(segment.from_date, segment.to_date)[0]
+            bitmaps = await asyncio.to_thread(self.store.load_bitmaps, segment.dataset.key, month)
+            if bitmaps is not None and bitmaps.supports(filters):
+                return await asyncio.to_thread(bitmaps.density, filters, segment.from_date, segment.to_date, start_hr, end_hr)
+        elif segment.backend == LOCAL:
+            cube = await self._segment_cube(segment)
+            if cube is not None:
+                return cube.density(segment.from_date, segment.to_date, start_hr, end_hr)
+
+        rows = await self._query_source(segment.dataset, get_density_soda, segment.from_date, segment.to_date, start_hr, end_hr, filters)
+        return density_vector(rows)
+
+    async def _earnings_segment(self, segment: PlanSegment) -> list:
+        if segment.backend == LOCAL:
+            cube = await self._segment_cube(segment)
+            if cube is not None:
+                return cube_earnings_rows(cube, segment.from_date, segment.to_date)
+
+        return await self._query_source(segment.dataset, get_earnings_soda, segment.from_date, segment.to_date)
+
+    async def _earnings_segment_columns(self, segment: PlanSegment) -> Dict[str, np.ndarray]:
+        if segment.backend == LOCAL:
+            cube = await self._segment_cube(segment)
+            if cube is not None:
+                return cube_earnings_columns(cube, segment.from_date, segment.to_date)
+
+        return earnings_columns(await self._query_source(segment.dataset, get_earnings_soda, segment.from_date, segment.to_date))
+
+    async def _segment_cube(self, segment: PlanSegment) -> Optional[TripCube]:
+        """Cube of a local segment, None if the partition went away since planning."""
+        cubes = await asyncio.to_thread(self.store.load_cubes, segment.dataset.key, months_between(segment.from_date, segment.to_date))
+        return cubes[0] if cubes else None
+
+    async def _query_source(self, dataset: TlcDataset, query_fn, *args) -> list:
+        cache = get_source_cache(dataset.key)
+        key = _cache_key(dataset, query_fn, *args)
+
+        rows = cache.get(key)
+        if rows is None:
+            rows = await asyncio.to_thread(query_fn, *args, dataset=dataset)
+            cache.set(key, rows)
+
+        return rows
+
+
+def _cache_key(dataset: TlcDataset, query_fn, *args) -> tuple:
+    return (query_fn.__name__, dataset.dataset_id, *args)
+
+
+def merge_density_rows(results: List[list]) -> List[Dict]:
+    """Sum per-location densities of several sources into SODA shaped rows."""
+    merged: Dict[int, int] = {}
+    for rows in results:
+        for row in rows:
+            if row.get('location_id') is None:
+                continue
+            location_id = int(row['location_id'])
+            merged[location_id] = merged.get(location_id, 0) + int(row['density'])
+
+    return [{'location_id': location_id, 'density': density} for location_id, density in merged.items()]
+
+
+def density_vector(rows: list) -> np.ndarray:
+    """SODA density rows as a per-zone count vector of shape (N_ZONES,)."""
+    vector = np.zeros(N_ZONES)
+    for row in merge_density_rows([rows]):
+        if 0 < row['location_id'] < N_ZONES:
+            vector[row['location_id']] += row['density']
+    return vector
+
+
+def density_rows(vector: np.ndarray) -> List[Dict]:
+    """Per-zone count vector as SODA shaped density rows, zones without trips left out."""
+    return [{'location_id': int(location_id), 'density': int(round(vector[location_id]))}
+            for location_id in np.flatnonzero(vector[1:]) + 1]
+
+
+def cube_earnings_columns(cube: TripCube, from_date: datetime, to_date: datetime) -> Dict[str, np.ndarray]:
+    """Hourly driver pay and trip counts of [from_date, to_date) from a cube, hours without trips left out."""
+    mask = cube.hour_mask(from_date, to_date)
+    hours = cube.start + np.flatnonzero(mask) * ONE_HOUR
+    trip_counts = cube["pickups"][mask].sum(axis=1, dtype=np.int64)
+    driver_pay = cube["driver_pay"][mask].sum(axis=1, dtype=np.float64)
+
+    has_trips = trip_counts > 0
+    return {'hour': hours[has_trips].astype("datetime64[h]"), 'trip_count': trip_counts[has_trips],
+            'total_driver_pay': driver_pay[has_trips].round(2)}
+
+
+def cube_earnings_rows(cube: TripCube, from_date: datetime, to_date: datetime) -> List[Dict]:
+    """Hourly driver pay and trip counts of [from_date, to_date) from a cube, as SODA shaped earnings rows."""
+    columns = cube_earnings_columns(cube, from_date, to_date)
+
+    return [{'pickup_date': f"{np.datetime_as_string(hour, unit='D')}T00:00:00.000",
+             'pickup_hour': int(hour.astype(np.int64) % 24),
+             'total_driver_pay': float(pay), 'trip_count': int(count)}
+            for hour, count, pay in zip(columns['hour'], columns['trip_count'], columns['total_driver_pay'])]
+
+
+def merge_earnings_rows(results: List[list]) -> List[Dict]:
+    """Sum per-hour earnings of several sources into SODA shaped rows."""
+    merged: Dict[tuple, Dict] = {}
+    for rows in results:
+        for row in rows:
+            key = (row['pickup_date'], int(row['pickup_hour']))
+            if key not in merged:
+                merged[key] = {'pickup_date': row['pickup_date'], 'pickup_hour': key[1],
+                               'total_driver_pay': 0.0, 'trip_count': 0}
+            merged[key]['total_driver_pay'] += float(row.get('total_driver_pay') or 0)
+            merged[key]['trip_count'] += int(row['trip_count'])
+
+    return list(merged.values())
+
+
+def earnings_columns(rows: list) -> Dict[str, np.ndarray]:
+    """SODA shaped earnings rows as hourly columns, see cube_earnings_columns."""
+    days = np.array([row['pickup_date'][:10] for row in rows], dtype="datetime64[D]")
+    hours = days.astype("datetime64[h]") + np.array([int(row['pickup_hour']) for row in rows], dtype=np.int64)
+    return {'hour': hours,
+            'trip_count': np.array([int(row['trip_count']) for row in rows], dtype=np.int64),
+            'total_driver_pay': np.array([float(row.get('total_driver_pay') or 0) for row in rows], dtype=np.float64)}
 
-    def get_density_between(self, from_date: datetime, to_date: datetime, start_hr: int, end_hr: int) -> List[TripDensity]:
-        return get_density_soda(from_date, to_date, start_hr, end_hr)
 
-    def get_earnings_data(start_date: datetime, end_date: datetime) -> List[TripEarningSoQL]:
-        return get_earnings_soda(start_date, end_date)
+def merge_earnings_columns(results: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Sum hourly earnings columns of several sources, sorted by hour."""
+    if not results:
+        return earnings_columns([])
+    hours, index = np.unique(np.concatenate([columns['hour'] for columns in results]), return_inverse=True)
+    return {'hour': hours,
+            'trip_count': np.bincount(index, np.concatenate([columns['trip_count'] for columns in results]),
+                                      minlength=len(hours)).astype(np.int64),
+            'total_driver_pay': np.bincount(index, np.concatenate([columns['total_driver_pay'] for columns in results]),
+                                            minlength=len(hours)).round(2)}
@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from py_nyc.web.data_access.store.trip_cube import ONE_HOUR, TripCube, to_hour
+from py_nyc.web.data_access.store.trip_stats import HOURS_PER_WEEK, hour_of_week
+
+# Modified z-score above which a zone hour is flagged (Iglewicz and Hoaglin)
+ANOMALY_SCORE = 3.5
+# Scales the MAD to the standard deviation of normally distributed values
+MAD_SCALE = 0.6745
+# Floor of the MAD in trips, so zones with a constant baseline (often 0) do not score infinitely
+MIN_MAD = 1.0
+# Deviations smaller than this many trips are never flagged, however unusual
+MIN_DEVIATION = 5
+# Hours of week seen in fewer weeks have no baseline yet
+MIN_WEEKS = 3
+
+ANOMALY_FIELDS = ["hour", "location_id", "requests", "baseline", "mad", "score"]
+# End of the last hour with trips the index was built from, a single element (none without data)
+DATA_END = "data_end"
+
+
+def hour_of_week_baseline(requests: np.ndarray, hours_of_week: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Median and median absolute deviation of the requests of every zone at each hour of week,
+    over the weeks in `requests` (shape (hours, N_ZONES)). Both of shape (HOURS_PER_WEEK, N_ZONES),
+    NaN for hours of week seen in fewer than MIN_WEEKS weeks.
+    """
+    median = np.full((HOURS_PER_WEEK, requests.shape[1]), np.nan)
+    mad = np.full((HOURS_PER_WEEK, requests.shape[1]), np.nan)
+    for hour in range(HOURS_PER_WEEK):
+        weeks = requests[hours_of_week == hour]
+        if len(weeks) >= MIN_WEEKS:
+            median[hour] = np.median(weeks, axis=0)
+            mad[hour] = np.median(np.abs(weeks - median[hour]), axis=0)
+    return median, mad
+
+
+def robust_z(values: np.ndarray, median: np.ndarray, mad: np.ndarray) -> np.ndarray:
+    """Modified z-score of values against their median and MAD, positive for more trips than usual."""
+    return MAD_SCALE * (values - median) / np.maximum(mad, MIN_MAD)
+
+
+class AnomalyIndex:
+    """
+    Zone hours whose trip requests deviate strongly from the zone's usual demand at that hour
+    of week, sorted by hour so a time window is found by binary search. Built by the
+    detect_anomalies job from every ingested month of a dataset.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays["hour"])
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.arrays[field]
+
+    @property
+    def last_hour(self) -> Optional[np.datetime64]:
+        return self.arrays["hour"][-1] if len(self) else None
+
+    @property
+    def data_end(self) -> Optional[np.datetime64]:
+        """End of the ingested data, or of the last flagged hour for indexes built before it was stored."""
+        data_end = self.arrays.get(DATA_END)
+        if data_end is not None and len(data_end):
+            return data_end[0]
+        return self.last_hour + ONE_HOUR if self.last_hour is not None else None
+
+    @classmethod
+    def build(cls, cubes: List[TripCube], min_score: float = ANOMALY_SCORE) -> "AnomalyIndex":
+        requests = np.concatenate([cube["requests"] for cube in cubes])
+        hours = np.concatenate([cube.start + np.arange(cube.n_hours) * ONE_HOUR for cube in cubes])
+
+        # Hours without a single trip in the city are missing data (e.g. the rest of a month
+        # ingested part way), not a drop in demand
+        with_trips = requests.sum(axis=1) > 0
+        requests, hours = requests[with_trips], hours[with_trips]
+
+        hours_of_week = hour_of_week(hours)
+        median, mad = hour_of_week_baseline(requests, hours_of_week)
+        median, mad = median[hours_of_week], mad[hours_of_week]
+        score = robust_z(requests, median, mad)
+
+        with np.errstate(invalid="ignore"):
+            flagged = (np.abs(score) >= min_score) & (np.abs(requests - median) >= MIN_DEVIATION)
+        flagged[:, 0] = False  # Trips without a known zone
+        hour_idx, zones = np.nonzero(flagged)
+
+        return cls({
+            "hour": hours[hour_idx].astype("datetime64[h]"),
+            "location_id": zones.astype(np.int16),
+            "requests": requests[hour_idx, zones].astype(np.float32),
+            "baseline": median[hour_idx, zones].astype(np.float32),
+            "mad": mad[hour_idx, zones].astype(np.float32),
+            "score": score[hour_idx, zones].astype(np.float32),
+            DATA_END: (hours[-1:] + ONE_HOUR).astype("datetime64[h]"),
+        })
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "AnomalyIndex":
+        return cls({field: arrays[field] for field in ANOMALY_FIELDS + [DATA_END] if field in arrays})
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        return dict(self.arrays)
+
+    def query(self, from_date: datetime, to_date: datetime, location_ids: Sequence[int] = (), direction: str = "both",
+              min_score: float = ANOMALY_SCORE, limit: int = 100) -> np.ndarray:
+        """
+        Positions of the anomalies in [from_date, to_date), optionally of some zones only, with
+        direction "spike" (more trips than usual), "drop" or "both". Strongest first.
+        """
+        start, end = np.searchsorted(self.arrays["hour"], [to_hour(from_date), to_hour(to_date)])
+        score = self.arrays["score"][start:end]
+        keep = np.abs(score) >= min_score
+        if direction == "spike":
+            keep &= score > 0
+        elif direction == "drop":
+            keep &= score < 0
+        if location_ids:
+            keep &= np.isin(self.arrays["location_id"][start:end], location_ids)
+
+        positions = np.flatnonzero(keep)
+        if len(positions) > limit:
+            positions = positions[np.argpartition(-np.abs(score[positions]), limit - 1)[:limit]]
+        return start + positions[np.argsort(-np.abs(score[positions]), kind="stable")]
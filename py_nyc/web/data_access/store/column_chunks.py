@@ -0,0 +1,290 @@
+"""
+Chunked, compressed storage of trip columns.
+
+Rows are cut into chunks of CHUNK_ROWS. Every column of a chunk is encoded
+according to its type, compressed with zstd and appended to a single data
+file. A JSON index records where each encoded chunk lives, how to decode it
+and the chunk's min/max, so range scans only read and decode the chunks that
+can hold matching rows.
+
+    {name}.bin     encoded chunks
+    {name}.json    index: columns, encodings, chunk offsets and statistics
+
+Encodings:
+    delta       timestamps, as a base plus int32/int64 second deltas
+    dictionary  zone ids, as uint8 codes into a per-chunk uint16 dictionary
+    scaled      decimals, as integers of value * scale (e.g. cents)
+    bits        flags, packed 8 per byte
+    plain       anything else, raw bytes
+"""
+import json
+import os
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import zstandard
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+
+CHUNK_ROWS = 65536
+ZSTD_LEVEL = 3
+FORMAT_VERSION = 1
+
+INT32_MIN = np.iinfo(np.int32).min
+NAT = np.iinfo(np.int64).min
+
+
+def _fits_int32(values: np.ndarray) -> bool:
+    return values.size == 0 or (values.min() > INT32_MIN and values.max() <= np.iinfo(np.int32).max)
+
+
+class DeltaEncoding:
+    """Timestamps as the first value plus deltas, NaT stored in a separate packed mask."""
+    name = "delta"
+
+    def encode(self, values: np.ndarray) -> tuple[Dict[str, np.ndarray], dict]:
+        seconds = values.astype("datetime64[s]").astype(np.int64)
+        nulls = np.isnat(values)
+        parts = {}
+        if nulls.any():
+            # Repeat the previous timestamp in place of NaT, so nulls become zero deltas
+            previous = np.where(nulls, 0, np.arange(len(seconds)))
+            np.maximum.accumulate(previous, out=previous)
+            seconds = seconds[previous]
+            valid = seconds[seconds != NAT]
+            seconds[seconds == NAT] = valid[0] if valid.size else 0
+            parts["nulls"] = np.packbits(nulls)
+
+        base = int(seconds[0]) if seconds.size else 0
+        deltas = np.diff(seconds, prepend=base)
+        parts["deltas"] = deltas.astype(np.int32) if _fits_int32(deltas) else deltas
+        return parts, {"base": base}
+
+    def decode(self, parts: Dict[str, np.ndarray], params: dict, n_rows: int) -> np.ndarray:
+        seconds = params["base"] + np.cumsum(parts["deltas"], dtype=np.int64)
+        values = seconds.astype("datetime64[s]")
+        if "nulls" in parts:
+            values[np.unpackbits(parts["nulls"], count=n_rows).astype(bool)] = np.datetime64("NaT")
+        return values
+
+
+class DictionaryEncoding:
+    """Small integer ids as uint8 codes into the chunk's distinct values, raw when there are more than 256."""
+    name = "dictionary"
+
+    def encode(self, values: np.ndarray) -> tuple[Dict[str, np.ndarray], dict]:
+        dictionary, codes = np.unique(values, return_inverse=True)
+        if len(dictionary) > 256:
+            return {"values": values}, {}
+        return {"dictionary": dictionary, "codes": codes.astype(np.uint8)}, {}
+
+    def decode(self, parts: Dict[str, np.ndarray], params: dict, n_rows: int) -> np.ndarray:
+        if "values" in parts:
+            return parts["values"]
+        return parts["dictionary"][parts["codes"]]
+
+
+class ScaledEncoding:
+    """Decimals as integers of value * scale. Lossless for values with at most log10(scale) decimals."""
+    name = "scaled"
+
+    def __init__(self, scale: int):
+        self.scale = scale
+
+    def encode(self, values: np.ndarray) -> tuple[Dict[str, np.ndarray], dict]:
+        scaled = np.round(values.astype(np.float64) * self.scale)
+        nulls = np.isnan(scaled)
+        scaled[nulls] = INT32_MIN
+        integers = scaled.astype(np.int64)
+        return {"values": integers.astype(np.int32) if _fits_int32(integers[~nulls]) else integers}, {"scale": self.scale}
+
+    def decode(self, parts: Dict[str, np.ndarray], params: dict, n_rows: int) -> np.ndarray:
+        integers = parts["values"]
+        values = integers / params["scale"]
+        values[integers == INT32_MIN] = np.nan
+        return values
+
+
+class BitsEncoding:
+    name = "bits"
+
+    def encode(self, values: np.ndarray) -> tuple[Dict[str, np.ndarray], dict]:
+        return {"bits": np.packbits(values)}, {}
+
+    def decode(self, parts: Dict[str, np.ndarray], params: dict, n_rows: int) -> np.ndarray:
+        return np.unpackbits(parts["bits"], count=n_rows).astype(bool)
+
+
+class PlainEncoding:
+    name = "plain"
+
+    def encode(self, values: np.ndarray) -> tuple[Dict[str, np.ndarray], dict]:
+        return {"values": values}, {}
+
+    def decode(self, parts: Dict[str, np.ndarray], params: dict, n_rows: int) -> np.ndarray:
+        return parts["values"]
+
+
+CURRENCY = ScaledEncoding(100)
+
+COLUMN_ENCODINGS = {
+    "pickup_datetime": DeltaEncoding(),
+    "dropoff_datetime": DeltaEncoding(),
+    "request_datetime": DeltaEncoding(),
+    "on_scene_datetime": DeltaEncoding(),
+    "pulocationid": DictionaryEncoding(),
+    "dolocationid": DictionaryEncoding(),
+    "trip_miles": ScaledEncoding(1000),
+    "trip_time": ScaledEncoding(1),
+    "driver_pay": CURRENCY,
+    "base_passenger_fare": CURRENCY,
+    "tips": CURRENCY,
+    "shared_request_flag": BitsEncoding(),
+    "wav_request_flag": BitsEncoding(),
+    "airport_fee": CURRENCY,
+}
+
+ENCODINGS = {encoding.name: encoding for encoding in
+             [DeltaEncoding(), DictionaryEncoding(), CURRENCY, BitsEncoding(), PlainEncoding()]}
+
+
+def _encoding_for(name: str, values: np.ndarray):
+    if name in COLUMN_ENCODINGS:
+        return COLUMN_ENCODINGS[name]
+    return BitsEncoding() if values.dtype.kind == "b" else PlainEncoding()
+
+
+def _stat_values(values: np.ndarray) -> np.ndarray:
+    """Values comparable by min/max: seconds for timestamps, nulls left out."""
+    if values.dtype.kind == "M":
+        return values[~np.isnat(values)].astype("datetime64[s]").astype(np.int64)
+    if values.dtype.kind == "f":
+        return values[~np.isnan(values)]
+    return values
+
+
+def write_chunked_columns(path: Path, columns: TripColumns, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Write `columns` to {path}.bin and {path}.json, replacing existing files atomically. Returns the index."""
+    path = Path(path)
+    data_path, index_path = path.with_suffix(".bin"), path.with_suffix(".json")
+    tmp_data_path, tmp_index_path = path.with_suffix(".bin.tmp"), path.with_suffix(".json.tmp")
+
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    index = {
+        "version": FORMAT_VERSION,
+        "rows": len(columns),
+        "columns": {name: str(columns[name].dtype) for name in columns.names},
+        "chunks": [],
+    }
+
+    offset = 0
+    with open(tmp_data_path, "wb") as data_file:
+        for start in range(0, len(columns), chunk_rows):
+            chunk = {"rows": min(chunk_rows, len(columns) - start), "columns": {}}
+            for name in columns.names:
+                values = columns[name][start:start + chunk_rows]
+                encoding = _encoding_for(name, values)
+                parts, params = encoding.encode(values)
+                blob = compressor.compress(b"".join(np.ascontiguousarray(part).tobytes() for part in parts.values()))
+                data_file.write(blob)
+
+                stat_values = _stat_values(values)
+                chunk["columns"][name] = {
+                    "encoding": encoding.name,
+                    "params": params,
+                    "parts": [[part_name, str(part.dtype), len(part)] for part_name, part in parts.items()],
+                    "offset": offset,
+                    "length": len(blob),
+                    "min": stat_values.min().item() if stat_values.size else None,
+                    "max": stat_values.max().item() if stat_values.size else None,
+                }
+                offset += len(blob)
+            index["chunks"].append(chunk)
+
+    tmp_index_path.write_text(json.dumps(index))
+    os.replace(tmp_data_path, data_path)
+    os.replace(tmp_index_path, index_path)
+    return index
+
+
+def _bound(value) -> Optional[int | float]:
+    """Query bound in the units of the chunk statistics."""
+    if value is None:
+        return None
+    if isinstance(value, (date, np.datetime64)):
+        return int(np.datetime64(value, "s").astype(np.int64))
+    return value
+
+
+class ChunkedColumns:
+    """Reader of columns written by write_chunked_columns."""
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        self.data_path = path.with_suffix(".bin")
+        self.index = json.loads(path.with_suffix(".json").read_text())
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        return Path(path).with_suffix(".json").is_file()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.index["columns"])
+
+    def __len__(self) -> int:
+        return self.index["rows"]
+
+    def chunks_overlapping(self, column: str, low=None, high=None) -> List[int]:
+        """Chunks whose [min, max] of `column` intersects [low, high)."""
+        low, high = _bound(low), _bound(high)
+        selected = []
+        for chunk_id, chunk in enumerate(self.index["chunks"]):
+            stats = chunk["columns"][column]
+            if stats["min"] is None:
+                continue
+            if (high is None or stats["min"] < high) and (low is None or stats["max"] >= low):
+                selected.append(chunk_id)
+        return selected
+
+    def read(self, names: Optional[List[str]] = None, chunk_ids: Optional[List[int]] = None) -> TripColumns:
+        names = [name for name in (names or self.names) if name in self.index["columns"]]
+        chunk_ids = range(len(self.index["chunks"])) if chunk_ids is None else chunk_ids
+
+        decompressor = zstandard.ZstdDecompressor()
+        decoded: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        with open(self.data_path, "rb") as data_file:
+            for chunk_id in chunk_ids:
+                chunk = self.index["chunks"][chunk_id]
+                for name in names:
+                    decoded[name].append(self._decode(data_file, decompressor, chunk["columns"][name], chunk["rows"]))
+
+        return TripColumns({
+            name: np.concatenate(arrays).astype(self.index["columns"][name]) if arrays
+            else np.empty(0, dtype=self.index["columns"][name])
+            for name, arrays in decoded.items()
+        })
+
+    def scan(self, names: Optional[List[str]], column: str, low=None, high=None) -> TripColumns:
+        """Rows with low <= column < high, decoding only the chunks that can contain them."""
+        names = list(names or self.names)
+        columns = self.read(names + ([column] if column not in names else []), self.chunks_overlapping(column, low, high))
+
+        values = columns[column]
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= (np.datetime64(low, "s") if values.dtype.kind == "M" else low)
+        if high is not None:
+            mask &= values < (np.datetime64(high, "s") if values.dtype.kind == "M" else high)
+        return TripColumns({name: columns[name][mask] for name in names})
+
+    def _decode(self, data_file, decompressor, stats: dict, n_rows: int) -> np.ndarray:
+        data_file.seek(stats["offset"])
+        buffer = decompressor.decompress(data_file.read(stats["length"]))
+
+        parts, position = {}, 0
+        for part_name, dtype, length in stats["parts"]:
+            dtype = np.dtype(dtype)
+            parts[part_name] = np.frombuffer(buffer, dtype=dtype, count=length, offset=position).copy()
+            position += dtype.itemsize * length
+        return ENCODINGS[stats["encoding"]].decode(parts, stats["params"], n_rows)
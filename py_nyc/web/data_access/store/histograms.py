@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass(frozen=True)
+class BinSpec:
+    """Uniform histogram bins starting at 0. The last bin also collects values above the top edge."""
+    step: float
+    n_bins: int
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.arange(self.n_bins + 1) * self.step
+
+    def bin_index(self, values: np.ndarray) -> np.ndarray:
+        return np.minimum(values // self.step, self.n_bins - 1).astype(np.int64)
+
+
+def binned_histogram(keys: np.ndarray, values: np.ndarray, n_keys: int, spec: BinSpec) -> np.ndarray:
+    """
+    Histogram `values` per key in one bincount.
+    Rows with a NaN or negative value are skipped. Returns uint32 (n_keys, n_bins).
+    """
+    valid = np.isfinite(values) & (values >= 0)
+    flat = keys[valid].astype(np.int64) * spec.n_bins + spec.bin_index(values[valid])
+    counts = np.bincount(flat, minlength=n_keys * spec.n_bins)
+    return counts.astype(np.uint32).reshape(n_keys, spec.n_bins)
+
+
+def histogram_quantile(hist: np.ndarray, spec: BinSpec, q: float) -> np.ndarray:
+    """
+    Quantile of every histogram along the last axis, interpolated linearly within the bin.
+    NaN where a histogram is empty.
+    """
+    hist = hist.astype(np.float64)
+    cumulative = hist.cumsum(axis=-1)
+    total = cumulative[..., -1]
+    target = q * total
+
+    idx = np.minimum((cumulative < target[..., None]).sum(axis=-1), spec.n_bins - 1)
+    before = np.where(idx > 0, np.take_along_axis(cumulative, np.maximum(idx - 1, 0)[..., None], axis=-1)[..., 0], 0.0)
+    in_bin = np.take_along_axis(hist, idx[..., None], axis=-1)[..., 0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.clip(np.where(in_bin > 0, (target - before) / in_bin, 0.0), 0.0, 1.0)
+        return np.where(total > 0, (idx + fraction) * spec.step, np.nan)
+
+
+def histogram_rank(hist: np.ndarray, spec: BinSpec, values: np.ndarray) -> np.ndarray:
+    """
+    Percentile rank (0-100) of each value within its own histogram row, interpolated linearly
+    within the bin. hist has shape (len(values), n_bins); NaN where the value is NaN or the row is empty.
+    """
+    hist = hist.astype(np.float64)
+    cumulative = hist.cumsum(axis=-1)
+    total = cumulative[:, -1]
+    known = np.isfinite(values)
+
+    idx = spec.bin_index(np.where(known, np.maximum(values, 0), 0))[:, None]
+    before = np.take_along_axis(cumulative, idx, axis=-1)[:, 0] - np.take_along_axis(hist, idx, axis=-1)[:, 0]
+    in_bin = np.take_along_axis(hist, idx, axis=-1)[:, 0]
+    fraction = np.clip(np.where(known, values, 0) / spec.step - idx[:, 0], 0.0, 1.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(known & (total > 0), (before + fraction * in_bin) / total * 100, np.nan)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.data_access.store.anomalies import AnomalyIndex
+from py_nyc.web.data_access.store.column_chunks import ChunkedColumns, write_chunked_columns
+from py_nyc.web.data_access.store.shared_arrays import SharedArrays, default_shared_root
+from py_nyc.web.data_access.store.trip_bitmaps import TripBitmaps
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import TripCube
+from py_nyc.web.data_access.store.trip_stats import TripStats
+from py_nyc.web.data_access.store.unit_pay import UnitPayHistograms
+from py_nyc.web.utils.ttl_cache import TTLCache
+
+
+class TripDataNotIngestedError(Exception):
+    """Raised when the local store has no ingested data for a dataset."""
+    pass
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_between(from_date: datetime, to_date: datetime) -> List[date]:
+    """Months overlapping [from_date, to_date)."""
+    months = []
+    month = month_start(from_date)
+    while datetime(month.year, month.month, 1) < to_date:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def _write_npz(path: Path, arrays: Dict[str, np.ndarray]) -> None:
+    tmp_path = path.with_suffix(".tmp.npz")
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _read_npz(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+class LocalTripStore:
+    """
+    On-disk trip store partitioned by dataset and month:
+
+        {root}/{dataset}/{YYYY-MM}/columns.bin    raw trip columns, encoded and zstd compressed by chunk
+        {root}/{dataset}/{YYYY-MM}/columns.json   chunk index with per-chunk min/max (see column_chunks)
+        {root}/{dataset}/{YYYY-MM}/{name}.npz     aggregates built at ingestion
+        {root}/{dataset}/{YYYY-MM}/quarantine.npz rows that failed validation, kept out of everything else
+        {root}/{dataset}/{YYYY-MM}/meta.json      written last, marks the partition complete
+        {root}/{dataset}/anomalies.npz            demand anomalies over all months (see detect_anomalies)
+
+    Aggregates are decompressed once into `shared` and memory mapped from there, so every
+    worker process reads the same copy. They are republished when a partition is re-ingested,
+    and read into process memory when `shared` has no room for them.
+    Partitions ingested before columns were chunked keep their columns in columns.npz.
+    """
+
+    COLUMNS = "columns"
+    LEGACY_COLUMNS_FILE = "columns.npz"
+    META_FILE = "meta.json"
+    QUARANTINE_FILE = "quarantine.npz"
+
+    def __init__(self, root: str | Path, cache_size: int = 64, shared: Optional[SharedArrays] = None):
+        self.root = Path(root)
+        self.shared = shared or SharedArrays(default_shared_root(self.root))
+        self._aggregates = TTLCache(cache_size)
+
+    def partition_dir(self, dataset_key: str, month: date) -> Path:
+        return self.root / dataset_key / month.strftime("%Y-%m")
+
+    def months(self, dataset_key: str) -> List[date]:
+        """Completely ingested months of a dataset, oldest first."""
+        dataset_dir = self.root / dataset_key
+        if not dataset_dir.is_dir():
+            return []
+        return sorted(
+            datetime.strptime(path.name, "%Y-%m").date()
+            for path in dataset_dir.iterdir()
+            if (path / self.META_FILE).is_file()
+        )
+
+    def has_months(self, dataset_key: str, months: List[date]) -> bool:
+        return all((self.partition_dir(dataset_key, month) / self.META_FILE).is_file() for month in months)
+
+    def has_aggregate(self, dataset_key: str, month: date, name: str) -> bool:
+        """Whether the partition was ingested with the aggregate `name` (re-ingest or rebuild to add it)."""
+        return (self.partition_dir(dataset_key, month) / f"{name}.npz").is_file()
+
+    def write_partition(self, dataset_key: str, month: date, columns: TripColumns,
+                        aggregates: Dict[str, Dict[str, np.ndarray]], meta: dict,
+                        quarantine: Optional[Dict[str, np.ndarray]] = None) -> None:
+        partition = self.partition_dir(dataset_key, month)
+        partition.mkdir(parents=True, exist_ok=True)
+        (partition / self.META_FILE).unlink(missing_ok=True)
+
+        write_chunked_columns(partition / self.COLUMNS, columns)
+        (partition / self.LEGACY_COLUMNS_FILE).unlink(missing_ok=True)
+        if quarantine and len(quarantine["violations"]):
+            _write_npz(partition / self.QUARANTINE_FILE, quarantine)
+        else:
+            (partition / self.QUARANTINE_FILE).unlink(missing_ok=True)
+        self.write_aggregates(dataset_key, month, aggregates, meta)
+
+    def write_aggregates(self, dataset_key: str, month: date,
+                         aggregates: Dict[str, Dict[str, np.ndarray]], meta: dict) -> None:
+        partition = self.partition_dir(dataset_key, month)
+        for name, arrays in aggregates.items():
+            _write_npz(partition / f"{name}.npz", arrays)
+
+        tmp_meta = partition / f"{self.META_FILE}.tmp"
+        tmp_meta.write_text(json.dumps(meta, indent=2, default=str))
+        os.replace(tmp_meta, partition / self.META_FILE)
+
+    def read_quarantine(self, dataset_key: str, month: date) -> Dict[str, np.ndarray]:
+        """Rows of a month that failed validation with their `violations` bits, empty if there were none."""
+        path = self.partition_dir(dataset_key, month) / self.QUARANTINE_FILE
+        return _read_npz(path) if path.is_file() else {}
+
+    def read_meta(self, dataset_key: str, month: date) -> dict:
+        return json.loads((self.partition_dir(dataset_key, month) / self.META_FILE).read_text())
+
+    def read_columns(self, dataset_key: str, month: date, names: Optional[List[str]] = None) -> TripColumns:
+        partition = self.partition_dir(dataset_key, month)
+        if ChunkedColumns.exists(partition / self.COLUMNS):
+            return ChunkedColumns(partition / self.COLUMNS).read(names)
+
+        with np.load(partition / self.LEGACY_COLUMNS_FILE) as npz:
+            return TripColumns({name: npz[name] for name in (names or npz.files) if name in npz.files})
+
+    def scan_columns(self, dataset_key: str, month: date, from_date: datetime, to_date: datetime,
+                     names: Optional[List[str]] = None, column: str = "pickup_datetime") -> TripColumns:
+        """Trips of a month with from_date <= column < to_date, decoding only the chunks that overlap."""
+        partition = self.partition_dir(dataset_key, month)
+        if ChunkedColumns.exists(partition / self.COLUMNS):
+            return ChunkedColumns(partition / self.COLUMNS).scan(names, column, from_date, to_date)
+
+        columns = self.read_columns(dataset_key, month)
+        in_range = (columns[column] >= np.datetime64(from_date, "s")) & (columns[column] < np.datetime64(to_date, "s"))
+        return TripColumns({name: columns[name][in_range] for name in (names or columns.names)})
+
+    def partition_version(self, dataset_key: str, month: date) -> int:
+        """Changes whenever the partition is (re-)ingested."""
+        return (self.partition_dir(dataset_key, month) / self.META_FILE).stat().st_mtime_ns
+
+    def version(self, dataset_key: str) -> tuple:
+        return tuple((month, self.partition_version(dataset_key, month)) for month in self.months(dataset_key))
+
+    def read_aggregate(self, dataset_key: str, month: date, name: str) -> Dict[str, np.ndarray]:
+        key = (dataset_key, month, name, self.partition_version(dataset_key, month))
+        arrays = self._aggregates.get(key)
+        if arrays is None:
+            path = self.partition_dir(dataset_key, month) / f"{name}.npz"
+            arrays = self.shared.load(f"{dataset_key}/{month:%Y-%m}/{name}", str(key[-1]), lambda: _read_npz(path))
+            self._aggregates.set(key, arrays)
+        return arrays
+
+    def load_cubes(self, dataset_key: str, months: List[date]) -> Optional[List[TripCube]]:
+        """Monthly cubes of the given months, or None if any month is missing."""
+        if not months or not self.has_months(dataset_key, months):
+            return None
+        return [TripCube.from_npz(self.read_aggregate(dataset_key, month, "cube")) for month in months]
+
+    def load_bitmaps(self, dataset_key: str, month: date) -> Optional[TripBitmaps]:
+        """Trip flag bitmaps of a month, or None if it is missing or was ingested without them."""
+        if not self.has_months(dataset_key, [month]) or not self.has_aggregate(dataset_key, month, "bitmaps"):
+            return None
+        return TripBitmaps.from_npz(self.read_aggregate(dataset_key, month, "bitmaps"))
+
+    def load_cube(self, dataset_key: str, from_date: datetime, to_date: datetime) -> Optional[TripCube]:
+        """Hourly cube over the months of [from_date, to_date), or None if any month is missing."""
+        cubes = self.load_cubes(dataset_key, months_between(from_date, to_date))
+        return TripCube.concat(cubes) if cubes else None
+
+    def load_unit_pay(self, dataset_key: str, months: List[date]) -> List[UnitPayHistograms]:
+        """Pay per mile and per minute histograms of the given months."""
+        missing = [month for month in months
+                   if not self.has_months(dataset_key, [month]) or not self.has_aggregate(dataset_key, month, "unit_pay")]
+        if missing:
+            raise TripDataNotIngestedError(
+                f"Pay histograms of dataset '{dataset_key}' are missing for {', '.join(f'{month:%Y-%m}' for month in missing)}")
+        return [UnitPayHistograms.from_npz(self.read_aggregate(dataset_key, month, "unit_pay")) for month in months]
+
+    def load_stats(self, dataset_key: str) -> TripStats:
+        """
+        Trip statistics merged over every ingested month of a dataset.
+        Only the merged result is shared between workers, monthly histograms are read from disk.
+        """
+        version = self.version(dataset_key)
+        if not version:
+            raise TripDataNotIngestedError(
+                f"No trip data has been ingested for dataset '{dataset_key}'")
+
+        key = (dataset_key, "stats", version)
+        stats = self._aggregates.get(key)
+        if stats is None:
+            def merge() -> Dict[str, np.ndarray]:
+                merged = None
+                for month, _ in version:
+                    partition_stats = TripStats.from_npz(_read_npz(self.partition_dir(dataset_key, month) / "stats.npz"))
+                    merged = partition_stats if merged is None else TripStats.merge([merged, partition_stats])
+                return merged.to_npz()
+
+            digest = hashlib.sha1(repr(version).encode()).hexdigest()[:12]
+            stats = TripStats.from_npz(self.shared.load(f"{dataset_key}/stats", digest, merge))
+            self._aggregates.set(key, stats)
+        return stats
+
+    def write_anomalies(self, dataset_key: str, index: AnomalyIndex) -> None:
+        _write_npz(self.root / dataset_key / "anomalies.npz", index.to_npz())
+
+    def load_anomalies(self, dataset_key: str) -> AnomalyIndex:
+        path = self.root / dataset_key / "anomalies.npz"
+        try:
+            version = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise TripDataNotIngestedError(
+                f"No demand anomalies have been detected for dataset '{dataset_key}', run the detect_anomalies job")
+
+        key = (dataset_key, "anomalies", version)
+        index = self._aggregates.get(key)
+        if index is None:
+            index = AnomalyIndex.from_npz(self.shared.load(f"{dataset_key}/anomalies", str(version), lambda: _read_npz(path)))
+            self._aggregates.set(key, index)
+        return index
+
+
+@lru_cache()
+def get_local_trip_store() -> LocalTripStore:
+    """Process wide local trip store. Only created once per application lifecycle."""
+    settings = get_settings()
+    max_bytes = settings.shared_array_max_mb * 2**20 if settings.shared_array_max_mb else None
+    shared = SharedArrays(settings.shared_array_dir or default_shared_root(settings.trip_store_dir), max_bytes=max_bytes)
+    return LocalTripStore(settings.trip_store_dir, shared=shared)
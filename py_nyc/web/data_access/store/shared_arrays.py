@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import numpy as np
+
+
+def default_shared_root(store_root: Path) -> Path:
+    """Under /dev/shm (tmpfs) where available, one directory per trip store."""
+    digest = hashlib.sha1(str(Path(store_root).resolve()).encode()).hexdigest()[:8]
+    shm = Path("/dev/shm")
+    return shm / f"py_nyc-{digest}" if shm.is_dir() else Path(store_root) / ".shared"
+
+
+class SharedArrays:
+    """
+    Aggregates published once as uncompressed .npy files and memory mapped read-only by every
+    worker process, so any number of uvicorn workers share a single copy in the page cache:
+
+        {root}/{key}/gen-{n}-{version}/{array}.npy
+        {root}/{key}/CURRENT            {"generation": n, "version": ...}, replaced atomically
+
+    Publishing a new version writes the next generation next to the live one and then swaps
+    CURRENT. Workers still mapping an older generation keep valid views (the files stay alive
+    while mapped) until they attach to the new one; older generations are pruned.
+
+    The directory is kept under `max_bytes` (by default half of its file system) by removing the
+    least recently attached keys first. Arrays that cannot be shared, too large for the bound or
+    with the file system full, are returned as built and kept in process memory only.
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, root: str | Path, keep_generations: int = 2, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.keep_generations = keep_generations
+        self.max_bytes = max_bytes
+
+    def current(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads((self.root / key / self.CURRENT_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+    def load(self, key: str, version: str, build: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        Memory mapped arrays of `key` at `version`. The first process asking for a version
+        builds and publishes it, every other process attaches to the published files.
+        """
+        arrays = None
+        try:
+            current = self.current(key)
+            if current is None or current["version"] != version:
+                arrays = build()
+                current = self.publish(key, version, arrays)
+
+            shared = self.attach(key, current) if current else {}
+            if not shared and current:
+                # Pruned or evicted by other publishes before this process got to map it
+                arrays = build() if arrays is None else arrays
+                current = self.publish(key, version, arrays)
+                shared = self.attach(key, current) if current else {}
+        except OSError as e:
+            print(f"[SharedArrays] Keeping {key} in process memory: {e}")
+            shared = {}
+        return shared or (build() if arrays is None else arrays)
+
+    def attach(self, key: str, current: dict) -> Dict[str, np.ndarray]:
+        generation_dir = self.root / key / _generation_name(current)
+        arrays = {path.stem: _map(path) for path in generation_dir.glob("*.npy")}
+        if arrays:
+            # Marks the key as recently used, see evict()
+            os.utime(self.root / key / self.CURRENT_FILE)
+        return arrays
+
+    def publish(self, key: str, version: str, arrays: Dict[str, np.ndarray]) -> Optional[dict]:
+        """Publish `arrays` as the next generation of `key`, or return None if they do not fit the size bound."""
+        key_dir = self.root / key
+        key_dir.mkdir(parents=True, exist_ok=True)
+        if not self.evict(key, sum(array.nbytes for array in arrays.values())):
+            print(f"[SharedArrays] {key} does not fit in {self.root}")
+            return None
+        previous = self.current(key)
+        current = {"generation": previous["generation"] + 1 if previous else 1, "version": version}
+
+        tmp_dir = key_dir / f"{_generation_name(current)}.tmp-{os.getpid()}"
+        try:
+            tmp_dir.mkdir()
+            for name, array in arrays.items():
+                np.save(tmp_dir / f"{name}.npy", array)
+        except OSError:
+            # Typically the file system filling up, leave no partial generation behind
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        try:
+            os.rename(tmp_dir, key_dir / _generation_name(current))
+        except OSError:
+            # Another worker published the same generation of this version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        tmp_current = key_dir / f"{self.CURRENT_FILE}.tmp-{os.getpid()}"
+        tmp_current.write_text(json.dumps(current))
+        os.replace(tmp_current, key_dir / self.CURRENT_FILE)
+        self.prune(key, current["generation"])
+        print(f"[SharedArrays] Published {key} generation {current['generation']}")
+        return current
+
+    def evict(self, key: str, size: int) -> bool:
+        """
+        Remove the least recently attached other keys until `size` more bytes fit under the bound.
+        False if they cannot, even with every other key removed.
+        """
+        max_bytes = self.max_bytes or shutil.disk_usage(self.root).total // 2
+        if size > max_bytes:
+            return False
+
+        keys = []
+        for current_file in self.root.glob(f"**/{self.CURRENT_FILE}"):
+            key_dir = current_file.parent
+            try:
+                used = current_file.stat().st_mtime_ns
+                keys.append((used, key_dir, sum(path.stat().st_size for path in key_dir.glob("gen-*/*.npy"))))
+            except FileNotFoundError:
+                # Removed by another worker meanwhile
+                continue
+
+        total = sum(key_size for _, _, key_size in keys)
+        for _, key_dir, key_size in sorted(keys):
+            if total + size <= max_bytes:
+                break
+            if key_dir == self.root / key:
+                continue
+            shutil.rmtree(key_dir, ignore_errors=True)
+            total -= key_size
+            print(f"[SharedArrays] Evicted {key_dir.relative_to(self.root)}")
+        return total + size <= max_bytes
+
+    def prune(self, key: str, generation: int) -> None:
+        for path in (self.root / key).glob("gen-*"):
+            if path.is_dir() and ".tmp-" not in path.name and int(path.name.split("-")[1]) <= generation - self.keep_generations:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _generation_name(current: dict) -> str:
+    return f"gen-{current['generation']}-{current['version']}"
+
+
+def _map(path: Path) -> np.ndarray:
+    array = np.load(path, mmap_mode="r")
+    # Scalars such as a cube's start hour are copied into memory so indexing them gives a plain value
+    return array if array.ndim else np.array(array)
@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+import shutil
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from py_nyc.web.core.config import get_settings
+
+
+class SnapshotStore:
+    """
+    Versioned directories of precomputed, gzip compressed API responses:
+
+        {root}/{version}/manifest.json
+        {root}/{version}/{path}.json.gz
+        {root}/CURRENT                    name of the version being served, replaced atomically
+
+    A version is written completely before CURRENT points at it, so readers never
+    see a half-built snapshot. Older versions are pruned after publishing.
+    """
+
+    CURRENT_FILE = "CURRENT"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, root: str | Path, keep_versions: int = 3):
+        self.root = Path(root)
+        self.keep_versions = keep_versions
+        self._manifest: Optional[tuple] = None  # (CURRENT mtime, manifest)
+
+    def current_manifest(self) -> Optional[dict]:
+        """Manifest of the published version, None if nothing was published yet."""
+        current = self.root / self.CURRENT_FILE
+        try:
+            mtime = current.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        if self._manifest is None or self._manifest[0] != mtime:
+            version = current.read_text().strip()
+            self._manifest = (mtime, json.loads((self.root / version / self.MANIFEST_FILE).read_text()))
+        return self._manifest[1]
+
+    def read(self, version: str, path: str) -> Optional[bytes]:
+        """Compressed response stored at `path` in `version`, None if the snapshot has no such file."""
+        try:
+            return (self.root / version / f"{path}.json.gz").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, version: str, path: str, content: bytes) -> None:
+        file = self.root / version / f"{path}.json.gz"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # mtime=0 keeps the bytes, and so ETags, identical across builds of the same data
+        file.write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+
+    def publish(self, version: str, manifest: dict) -> None:
+        (self.root / version / self.MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, default=str))
+
+        tmp_current = self.root / f"{self.CURRENT_FILE}.tmp"
+        tmp_current.write_text(version)
+        os.replace(tmp_current, self.root / self.CURRENT_FILE)
+        self.prune(keep=version)
+
+    def prune(self, keep: str) -> None:
+        versions = sorted((path for path in self.root.iterdir() if path.is_dir() and path.name != keep),
+                          key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in versions[self.keep_versions - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+@lru_cache()
+def get_snapshot_store() -> SnapshotStore:
+    """Process wide snapshot store. Only created once per application lifecycle."""
+    return SnapshotStore(get_settings().snapshot_dir)
@@ -0,0 +1,68 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Sequence
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.data_access.store.trip_cube import N_ZONES
+from py_nyc.web.utils.precompressed import PrecompressedFile
+
+TAXI_ZONES_GEOJSON = Path(__file__).resolve().parents[2] / "static" / "nyc-taxi-zones.geojson"
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+
+UNKNOWN = "Unknown"
+
+
+class UnknownBoroughError(Exception):
+    """Raised when a borough filter names a borough without taxi zones."""
+    pass
+
+
+class ZoneTable:
+    """
+    Names and boroughs of the TLC taxi zones as arrays indexed by location id, for joining onto
+    per-zone aggregates. Ids without a zone on the map (0, 264 and 265) are "Unknown".
+    """
+
+    def __init__(self, names: np.ndarray, boroughs: np.ndarray):
+        self.names = names
+        self.boroughs = boroughs
+
+    @classmethod
+    def from_geojson(cls, path: str | Path = TAXI_ZONES_GEOJSON) -> "ZoneTable":
+        names = np.full(N_ZONES, UNKNOWN, dtype=object)
+        boroughs = np.full(N_ZONES, UNKNOWN, dtype=object)
+        with open(path) as file:
+            for feature in json.load(file)["features"]:
+                properties = feature["properties"]
+                location_id = int(properties["location_id"])
+                if 0 < location_id < N_ZONES:
+                    names[location_id] = properties["zone"]
+                    boroughs[location_id] = properties["borough"]
+        return cls(names, boroughs)
+
+    def borough_names(self) -> List[str]:
+        return sorted(set(self.boroughs[1:]) - {UNKNOWN})
+
+    def zones_in(self, boroughs: Sequence[str] = ()) -> np.ndarray:
+        """Location ids of the zones in any of `boroughs` (case insensitive), every zone when empty."""
+        if not boroughs:
+            return np.arange(1, N_ZONES)
+
+        known = {name.lower(): name for name in self.borough_names()}
+        unknown = [borough for borough in boroughs if borough.lower() not in known]
+        if unknown:
+            raise UnknownBoroughError(f"Unknown borough '{unknown[0]}'. Available: {', '.join(known.values())}")
+        return np.flatnonzero(np.isin(self.boroughs, [known[borough.lower()] for borough in boroughs]))
+
+
+@lru_cache()
+def get_zone_table() -> ZoneTable:
+    """Process wide zone table. Only read once per application lifecycle."""
+    return ZoneTable.from_geojson()
+
+
+@lru_cache()
+def get_taxi_zones_file() -> PrecompressedFile:
+    """The full detail zone GeoJSON as a static file, with its precompressed variants."""
+    return PrecompressedFile(TAXI_ZONES_GEOJSON, get_settings().static_build_dir, GEOJSON_MEDIA_TYPE)
@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Dict
+import numpy as np
+from py_nyc.web.core.models import TripFilters
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import N_ZONES, hour_mask, to_hour, zone_index
+from py_nyc.web.external.tlc_datasets import FLAG_COLUMNS
+
+
+def flag_values(columns: TripColumns) -> Dict[str, np.ndarray]:
+    """Boolean value of every trip flag the columns can tell."""
+    flags = {}
+    for flag, column in FLAG_COLUMNS.items():
+        if column in columns:
+            # NaN airport fees compare False, so trips without a fee recorded are not airport trips
+            flags[flag] = columns[column] > 0 if column == "airport_fee" else columns[column].astype(bool)
+    return flags
+
+
+# Set bits of every byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def rank(packed: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Set bits of a packed bitmap (np.packbits order) before each bit position, counted a byte at a time."""
+    before = np.zeros(len(packed) + 1, dtype=np.int64)
+    np.cumsum(POPCOUNT[packed], out=before[1:])
+    byte, bit = np.divmod(positions, 8)
+    # The leading `bit` bits of the byte holding the position
+    partial = np.append(packed, np.uint8(0))[byte] & ((0xFF00 >> bit) & 0xFF).astype(np.uint8)
+    return before[byte] + POPCOUNT[partial]
+
+
+class TripBitmaps:
+    """
+    Packed bitmaps (np.packbits) of the trip flags of a partition, one bit per trip, with the trips
+    sorted by density slot (request hour * N_ZONES + pickup zone) and the offsets of every slot's
+    range of bits in CSR form. Trips outside the partition are left out.
+
+    Filter combinations are answered by AND-ing bitmaps and counting the selected bits of each
+    slot range, without reading the trip columns or expanding the selection to one value per trip.
+    """
+
+    def __init__(self, start, n_rows: int, n_hours: int, bitmaps: Dict[str, np.ndarray], offsets: np.ndarray):
+        self.start = to_hour(start)
+        self.n_rows = n_rows
+        self.n_hours = n_hours
+        self.bitmaps = bitmaps
+        self.offsets = offsets  # first bit of every slot, n_hours * N_ZONES + 1 entries
+
+    @classmethod
+    def build(cls, columns: TripColumns, start: datetime, end: datetime) -> "TripBitmaps":
+        start_hour = to_hour(start)
+        n_hours = int((to_hour(end) - start_hour) / np.timedelta64(1, "h"))
+
+        requested_at = columns.get("request_datetime", columns["pickup_datetime"])
+        hours = (requested_at.astype("datetime64[h]") - start_hour).astype(np.int64)
+        slots = hours * N_ZONES + zone_index(columns["pulocationid"])
+        slots[np.isnat(requested_at) | (hours < 0) | (hours >= n_hours)] = -1
+        return cls.from_slots(start_hour, n_hours, slots, flag_values(columns))
+
+    @classmethod
+    def from_slots(cls, start, n_hours: int, slots: np.ndarray, flags: Dict[str, np.ndarray]) -> "TripBitmaps":
+        """Bitmaps of trips given their density slots (-1 outside the partition) and flag values."""
+        order = np.argsort(slots, kind="stable")
+        order = order[slots[order] >= 0]
+        offsets = np.searchsorted(slots[order], np.arange(n_hours * N_ZONES + 1)).astype(np.int64)
+        bitmaps = {flag: np.packbits(values[order]) for flag, values in flags.items()}
+        return cls(start, len(order), n_hours, bitmaps, offsets)
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "TripBitmaps":
+        start = arrays["start"].astype("datetime64[h]")[()]
+        n_rows, n_hours = int(arrays["n_rows"]), int(arrays["n_hours"])
+        bitmaps = {flag: arrays[f"flag_{flag}"] for flag in FLAG_COLUMNS if f"flag_{flag}" in arrays}
+        if "offsets" not in arrays:
+            # Months ingested before trips were sorted by slot, until they are ingested again
+            flags = {flag: np.unpackbits(bitmap, count=n_rows).astype(bool) for flag, bitmap in bitmaps.items()}
+            return cls.from_slots(start, n_hours, arrays["slots"].astype(np.int64), flags)
+        return cls(start, n_rows, n_hours, bitmaps, arrays["offsets"])
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        return {
+            "start": np.array(self.start),
+            "n_rows": np.array(self.n_rows),
+            "n_hours": np.array(self.n_hours),
+            "offsets": self.offsets,
+            **{f"flag_{flag}": bitmap for flag, bitmap in self.bitmaps.items()},
+        }
+
+    def supports(self, filters: TripFilters) -> bool:
+        return all(flag in self.bitmaps for flag in filters.selected())
+
+    def select(self, filters: TripFilters) -> np.ndarray:
+        """Packed bitmap of the trips matching every selected filter."""
+        selected = np.full((self.n_rows + 7) // 8, 0xFF, dtype=np.uint8)
+        for flag, wanted in filters.selected().items():
+            np.bitwise_and(selected, self.bitmaps[flag] if wanted else np.invert(self.bitmaps[flag]), out=selected)
+        return selected
+
+    def density(self, filters: TripFilters, from_date: datetime, to_date: datetime, start_hr: int, end_hr: int) -> np.ndarray:
+        """Requests per zone of the matching trips over the selected hours, shape (N_ZONES,)."""
+        hours = np.flatnonzero(hour_mask(self.start, self.n_hours, from_date, to_date, start_hr, end_hr))
+        bounds = self.offsets[hours[:, None] * N_ZONES + np.arange(N_ZONES + 1)]
+        counts = np.diff(rank(self.select(filters), bounds.ravel()).reshape(bounds.shape), axis=1)
+        return counts.sum(axis=0).astype(np.float32)
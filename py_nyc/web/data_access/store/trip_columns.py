@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+# Storage dtype of every logical trip column (see tlc_datasets.LOGICAL_COLUMNS).
+# Missing values are NaT for timestamps, NaN for floats and 0 for zone ids.
+COLUMN_DTYPES: Dict[str, np.dtype] = {
+    "pickup_datetime": np.dtype("datetime64[s]"),
+    "dropoff_datetime": np.dtype("datetime64[s]"),
+    "request_datetime": np.dtype("datetime64[s]"),
+    "on_scene_datetime": np.dtype("datetime64[s]"),
+    "pulocationid": np.dtype(np.uint16),
+    "dolocationid": np.dtype(np.uint16),
+    "trip_miles": np.dtype(np.float32),
+    "trip_time": np.dtype(np.float32),
+    "driver_pay": np.dtype(np.float32),
+    "base_passenger_fare": np.dtype(np.float32),
+    "tips": np.dtype(np.float32),
+    "shared_request_flag": np.dtype(np.bool_),
+    "wav_request_flag": np.dtype(np.bool_),
+    "airport_fee": np.dtype(np.float32),
+    "pickup_longitude": np.dtype(np.float64),
+    "pickup_latitude": np.dtype(np.float64),
+    "dropoff_longitude": np.dtype(np.float64),
+    "dropoff_latitude": np.dtype(np.float64),
+}
+
+
+def _parse_column(name: str, values: list) -> np.ndarray:
+    dtype = COLUMN_DTYPES[name]
+
+    if dtype.kind == "M":
+        return np.array([v if v is not None else "NaT" for v in values], dtype=dtype)
+    if dtype.kind == "b":
+        return np.array([v == "Y" for v in values], dtype=dtype)
+
+    parsed = np.array([v if v is not None else "nan" for v in values], dtype=np.float64)
+    if dtype.kind == "u":
+        parsed = np.nan_to_num(parsed, nan=0.0)
+    return parsed.astype(dtype)
+
+
+class TripColumns:
+    """
+    Column-oriented batch of trips, keyed by logical column name.
+    All columns have the same length.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records: List[dict], names: Iterable[str]) -> "TripColumns":
+        """Parse raw SODA records (already using logical column names)."""
+        return cls({
+            name: _parse_column(name, [record.get(name) for record in records])
+            for name in names
+        })
+
+    @classmethod
+    def concat(cls, batches: List["TripColumns"]) -> "TripColumns":
+        if not batches:
+            return cls({})
+        names = batches[0].names
+        return cls({name: np.concatenate([batch[name] for batch in batches]) for name in names})
+
+    @classmethod
+    def empty(cls, names: Iterable[str]) -> "TripColumns":
+        return cls({name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in names})
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def get(self, name: str, default: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        return self.columns.get(name, default)
+
+    def take(self, index: np.ndarray) -> "TripColumns":
+        """Select rows by integer index or boolean mask."""
+        return TripColumns({name: column[index] for name, column in self.columns.items()})
+
+    def sorted_by(self, name: str) -> "TripColumns":
+        return self.take(np.argsort(self.columns[name], kind="stable"))
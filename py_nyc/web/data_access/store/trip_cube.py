@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+
+# TLC location ids run from 1 to 265; index 0 collects trips with a missing or unknown zone.
+N_ZONES = 266
+
+CUBE_FIELDS = ["requests", "pickups", "driver_pay", "trip_time", "trip_miles"]
+
+ONE_HOUR = np.timedelta64(1, "h")
+
+
+def to_hour(value) -> np.datetime64:
+    return np.datetime64(value, "h")
+
+
+def hour_mask(start: np.datetime64, n_hours: int, from_date: datetime, to_date: datetime,
+              start_hr: int = 0, end_hr: int = 23) -> np.ndarray:
+    """
+    Which of the n_hours hours from start are within [from_date, to_date) and have an
+    hour of day between start_hr and end_hr (inclusive, like date_extract_hh between).
+    """
+    hours = start + np.arange(n_hours) * ONE_HOUR
+    hour_of_day = hours.astype(np.int64) % 24
+    return (hours >= to_hour(from_date)) & (hours < to_hour(to_date)) & \
+        (hour_of_day >= start_hr) & (hour_of_day <= end_hr)
+
+
+def zone_index(location_ids: np.ndarray) -> np.ndarray:
+    """Location ids as array indexes, mapping out of range ids to 0."""
+    zones = location_ids.astype(np.int64)
+    zones[(zones < 0) | (zones >= N_ZONES)] = 0
+    return zones
+
+
+class TripCube:
+    """
+    Hourly per-zone trip aggregates over a contiguous range of hours.
+
+    `requests` counts trips by the dataset's density timestamp (request time
+    where recorded, same as the SODA density query); the other fields are
+    keyed by pickup time. Every field is a float32 array of shape (hours, N_ZONES).
+    """
+
+    def __init__(self, start, arrays: Dict[str, np.ndarray]):
+        self.start = to_hour(start)
+        self.arrays = arrays
+
+    @property
+    def n_hours(self) -> int:
+        return self.arrays["requests"].shape[0]
+
+    @property
+    def end(self) -> np.datetime64:
+        """First hour after the cube (exclusive)."""
+        return self.start + self.n_hours * ONE_HOUR
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.arrays[field]
+
+    @classmethod
+    def build(cls, columns: TripColumns, start: datetime, end: datetime) -> "TripCube":
+        start_hour = to_hour(start)
+        n_hours = int((to_hour(end) - start_hour) / ONE_HOUR)
+        zones = zone_index(columns["pulocationid"])
+        pickups = columns["pickup_datetime"]
+
+        def bin_by_hour(timestamps: np.ndarray, weights=None) -> np.ndarray:
+            hours = (timestamps.astype("datetime64[h]") - start_hour).astype(np.int64)
+            valid = ~np.isnat(timestamps) & (hours >= 0) & (hours < n_hours)
+            if weights is not None:
+                weights = np.nan_to_num(weights[valid].astype(np.float64))
+            counts = np.bincount(hours[valid] * N_ZONES + zones[valid],
+                                 weights=weights, minlength=n_hours * N_ZONES)
+            return counts.astype(np.float32).reshape(n_hours, N_ZONES)
+
+        arrays = {
+            "requests": bin_by_hour(columns.get("request_datetime", pickups)),
+            "pickups": bin_by_hour(pickups),
+        }
+        for field in ["driver_pay", "trip_time", "trip_miles"]:
+            arrays[field] = bin_by_hour(pickups, columns[field]) if field in columns \
+                else np.zeros((n_hours, N_ZONES), dtype=np.float32)
+
+        return cls(start_hour, arrays)
+
+    @classmethod
+    def concat(cls, cubes: List["TripCube"]) -> "TripCube":
+        """Join cubes covering consecutive hour ranges into one."""
+        cubes = sorted(cubes, key=lambda cube: cube.start)
+        for previous, cube in zip(cubes, cubes[1:]):
+            if cube.start != previous.end:
+                raise ValueError(
+                    f"Cubes are not contiguous: {previous.end} != {cube.start}")
+
+        return cls(cubes[0].start, {
+            field: np.concatenate([cube.arrays[field] for cube in cubes])
+            for field in CUBE_FIELDS
+        })
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "TripCube":
+        return cls(arrays["start"].astype("datetime64[h]")[()], {field: arrays[field] for field in CUBE_FIELDS})
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        return {"start": np.array(self.start), **self.arrays}
+
+    def covers(self, from_date: datetime, to_date: datetime) -> bool:
+        return self.start <= to_hour(from_date) and to_hour(to_date) <= self.end
+
+    def hour_mask(self, from_date: datetime, to_date: datetime, start_hr: int = 0, end_hr: int = 23) -> np.ndarray:
+        return hour_mask(self.start, self.n_hours, from_date, to_date, start_hr, end_hr)
+
+    def density(self, from_date: datetime, to_date: datetime, start_hr: int, end_hr: int) -> np.ndarray:
+        """Trip requests per zone over the selected hours, shape (N_ZONES,)."""
+        return self.arrays["requests"][self.hour_mask(from_date, to_date, start_hr, end_hr)].sum(axis=0)
+
+    def density_windows(self, windows: List[tuple], start_hr: int, end_hr: int, field: str = "requests") -> np.ndarray:
+        """
+        Trip requests (or another field) per zone for several (from_date, to_date) windows
+        in a single pass over the cube, shape (len(windows), N_ZONES).
+        """
+        masks = np.stack([self.hour_mask(from_date, to_date, start_hr, end_hr) for from_date, to_date in windows])
+        return masks.astype(np.float32) @ self.arrays[field]
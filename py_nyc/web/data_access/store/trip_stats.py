@@ -0,0 +1,167 @@
+from functools import cached_property
+from typing import Dict, List
+import numpy as np
+from py_nyc.web.data_access.store.histograms import BinSpec, binned_histogram, histogram_quantile
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import N_ZONES, zone_index
+
+HOURS_PER_WEEK = 168
+
+STAT_BINS: Dict[str, BinSpec] = {
+    "wait_seconds": BinSpec(step=30, n_bins=61),    # 0 - 30 min
+    "trip_seconds": BinSpec(step=120, n_bins=61),   # 0 - 2 h
+    "speed_mph": BinSpec(step=1, n_bins=61),        # 0 - 60 mph
+}
+
+
+def hour_of_week(timestamps: np.ndarray) -> np.ndarray:
+    """Hour of week with Monday 00:00 as hour 0."""
+    hours = timestamps.astype("datetime64[h]").astype(np.int64)
+    # 1970-01-01 was a Thursday
+    return (hours + 3 * 24) % HOURS_PER_WEEK
+
+
+def _seconds_between(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    seconds = (end - start).astype("timedelta64[s]").astype(np.float64)
+    seconds[np.isnat(start) | np.isnat(end)] = np.nan
+    return seconds
+
+
+def trip_metrics(columns: TripColumns) -> Dict[str, np.ndarray]:
+    """Per-trip wait, duration and speed as float64 arrays, NaN where unknown."""
+    n = len(columns)
+    pickups = columns["pickup_datetime"]
+
+    if "request_datetime" in columns:
+        wait = _seconds_between(columns["request_datetime"], pickups)
+    else:
+        wait = np.full(n, np.nan)
+
+    if "trip_time" in columns:
+        trip_seconds = columns["trip_time"].astype(np.float64)
+    elif "dropoff_datetime" in columns:
+        trip_seconds = _seconds_between(pickups, columns["dropoff_datetime"])
+    else:
+        trip_seconds = np.full(n, np.nan)
+
+    miles = columns["trip_miles"].astype(np.float64) if "trip_miles" in columns else np.full(n, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        speed = np.where(trip_seconds > 0, miles / (trip_seconds / 3600), np.nan)
+
+    return {"wait_seconds": wait, "trip_seconds": trip_seconds, "speed_mph": speed, "trip_miles": miles}
+
+
+class TripStats:
+    """
+    Pickup wait, trip duration and speed per (zone, hour of week) and per
+    (OD pair, hour of week), aggregated once at ingestion.
+
+    Zone statistics are binned histograms so partitions merge by addition
+    and medians are read off the cumulative counts. There are far too many
+    OD pairs for histograms, so they keep sums (and therefore means) in a
+    sparse layout keyed by (pickup zone * N_ZONES + dropoff zone) * 168 + hour.
+    """
+
+    def __init__(self, zone_trips: np.ndarray, zone_hist: Dict[str, np.ndarray], od: Dict[str, np.ndarray]):
+        self.zone_trips = zone_trips
+        self.zone_hist = zone_hist
+        self.od = od
+
+    @classmethod
+    def build(cls, columns: TripColumns) -> "TripStats":
+        metrics = trip_metrics(columns)
+        pickups = columns["pickup_datetime"]
+        known = ~np.isnat(pickups)
+        how = hour_of_week(pickups)
+        pu = zone_index(columns["pulocationid"])
+
+        zone_keys = pu * HOURS_PER_WEEK + how
+        zone_trips = np.bincount(zone_keys[known], minlength=N_ZONES * HOURS_PER_WEEK) \
+            .astype(np.uint32).reshape(N_ZONES, HOURS_PER_WEEK)
+        zone_hist = {
+            metric: binned_histogram(zone_keys[known], metrics[metric][known], N_ZONES * HOURS_PER_WEEK, spec)
+            .reshape(N_ZONES, HOURS_PER_WEEK, spec.n_bins)
+            for metric, spec in STAT_BINS.items()
+        }
+
+        do = zone_index(columns["dolocationid"]) if "dolocationid" in columns else np.zeros_like(pu)
+        od_keys, inverse = np.unique(((pu * N_ZONES + do) * HOURS_PER_WEEK + how)[known], return_inverse=True)
+
+        def sum_by_key(values: np.ndarray) -> np.ndarray:
+            return np.bincount(inverse, weights=np.nan_to_num(values[known]), minlength=len(od_keys))
+
+        def count_by_key(values: np.ndarray) -> np.ndarray:
+            return np.bincount(inverse, weights=np.isfinite(values[known]), minlength=len(od_keys)).astype(np.uint32)
+
+        moving = np.where(np.isfinite(metrics["trip_seconds"]) & np.isfinite(metrics["trip_miles"]), 1.0, np.nan)
+        od = {
+            "keys": od_keys.astype(np.int32),
+            "trips": np.bincount(inverse, minlength=len(od_keys)).astype(np.uint32),
+            "wait_count": count_by_key(metrics["wait_seconds"]),
+            "wait_sum": sum_by_key(metrics["wait_seconds"]),
+            "moving_count": count_by_key(moving),
+            "trip_seconds_sum": sum_by_key(metrics["trip_seconds"] * moving),
+            "trip_miles_sum": sum_by_key(metrics["trip_miles"] * moving),
+        }
+
+        return cls(zone_trips, zone_hist, od)
+
+    @classmethod
+    def merge(cls, stats: List["TripStats"]) -> "TripStats":
+        zone_trips = np.sum([s.zone_trips for s in stats], axis=0, dtype=np.uint32)
+        zone_hist = {
+            metric: np.sum([s.zone_hist[metric] for s in stats], axis=0, dtype=np.uint32)
+            for metric in STAT_BINS
+        }
+
+        all_keys = np.concatenate([s.od["keys"] for s in stats])
+        od_keys, inverse = np.unique(all_keys, return_inverse=True)
+        od = {"keys": od_keys.astype(np.int32)}
+        for field in stats[0].od:
+            if field == "keys":
+                continue
+            values = np.concatenate([s.od[field] for s in stats]).astype(np.float64)
+            od[field] = np.bincount(inverse, weights=values, minlength=len(od_keys)).astype(stats[0].od[field].dtype)
+
+        return cls(zone_trips, zone_hist, od)
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "TripStats":
+        zone_hist = {metric: arrays[f"zone_{metric}"] for metric in STAT_BINS}
+        od = {name[3:]: array for name, array in arrays.items() if name.startswith("od_")}
+        return cls(arrays["zone_trips"], zone_hist, od)
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        arrays = {"zone_trips": self.zone_trips}
+        arrays.update({f"zone_{metric}": hist for metric, hist in self.zone_hist.items()})
+        arrays.update({f"od_{name}": array for name, array in self.od.items()})
+        return arrays
+
+    @cached_property
+    def zone_profile(self) -> Dict[str, np.ndarray]:
+        """Trip counts and medians per (zone, hour of week), each of shape (N_ZONES, 168)."""
+        profile = {"trips": self.zone_trips}
+        for metric, spec in STAT_BINS.items():
+            profile[f"median_{metric}"] = histogram_quantile(self.zone_hist[metric], spec, 0.5)
+        return profile
+
+    def od_profile(self, pulocationid: int, dolocationid: int) -> Dict[str, np.ndarray]:
+        """Trip counts and means per hour of week for one OD pair, each of shape (168,)."""
+        first = (pulocationid * N_ZONES + dolocationid) * HOURS_PER_WEEK
+        lo, hi = np.searchsorted(self.od["keys"], [first, first + HOURS_PER_WEEK])
+        hours = self.od["keys"][lo:hi] - first
+
+        def spread(values: np.ndarray) -> np.ndarray:
+            out = np.zeros(HOURS_PER_WEEK)
+            out[hours] = values[lo:hi]
+            return out
+
+        trips, wait_count, moving_count = spread(self.od["trips"]), spread(self.od["wait_count"]), spread(self.od["moving_count"])
+        trip_seconds, trip_miles = spread(self.od["trip_seconds_sum"]), spread(self.od["trip_miles_sum"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "trips": trips,
+                "mean_wait_seconds": np.where(wait_count > 0, spread(self.od["wait_sum"]) / wait_count, np.nan),
+                "mean_trip_seconds": np.where(moving_count > 0, trip_seconds / moving_count, np.nan),
+                "avg_speed_mph": np.where(trip_seconds > 0, trip_miles / (trip_seconds / 3600), np.nan),
+            }
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict
+import numpy as np
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import N_ZONES
+
+# Longest plausible trip, in seconds and miles
+MAX_TRIP_SECONDS = 6 * 3600
+MAX_TRIP_MILES = 250
+
+
+def _seconds(delta: np.ndarray) -> np.ndarray:
+    seconds = delta.astype("timedelta64[s]").astype(np.float64)
+    seconds[np.isnat(delta)] = np.nan
+    return seconds
+
+
+def _pickup_out_of_range(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    pickups = columns["pickup_datetime"]
+    return np.isnat(pickups) | (pickups < np.datetime64(start, "s")) | (pickups >= np.datetime64(end, "s"))
+
+
+def _bad_pickup_zone(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    # Missing zone ids are stored as 0
+    return (columns["pulocationid"] == 0) | (columns["pulocationid"] >= N_ZONES)
+
+
+def _bad_dropoff_zone(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    return columns["dolocationid"] >= N_ZONES
+
+
+def _impossible_duration(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    bad = np.zeros(len(columns), dtype=bool)
+    if "dropoff_datetime" in columns:
+        seconds = _seconds(columns["dropoff_datetime"] - columns["pickup_datetime"])
+        with np.errstate(invalid="ignore"):
+            bad |= (seconds < 0) | (seconds > MAX_TRIP_SECONDS)
+    if "trip_time" in columns:
+        bad |= (columns["trip_time"] < 0) | (columns["trip_time"] > MAX_TRIP_SECONDS)
+    return bad
+
+
+def _request_after_pickup(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    return columns["request_datetime"] > columns["pickup_datetime"]
+
+
+def _negative_pay(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    return columns["driver_pay"] < 0
+
+
+def _negative_fare(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    bad = columns["base_passenger_fare"] < 0
+    if "tips" in columns:
+        bad |= columns["tips"] < 0
+    return bad
+
+
+def _impossible_distance(columns: TripColumns, start: datetime, end: datetime) -> np.ndarray:
+    return (columns["trip_miles"] < 0) | (columns["trip_miles"] > MAX_TRIP_MILES)
+
+
+# Rule name -> (column it needs, vectorized check returning the rows breaking it).
+# NaT and NaN compare False, so missing optional values are not violations.
+VALIDATION_RULES: Dict[str, tuple[str, Callable[[TripColumns, datetime, datetime], np.ndarray]]] = {
+    "pickup_out_of_range": ("pickup_datetime", _pickup_out_of_range),
+    "bad_pickup_zone": ("pulocationid", _bad_pickup_zone),
+    "bad_dropoff_zone": ("dolocationid", _bad_dropoff_zone),
+    "impossible_duration": ("pickup_datetime", _impossible_duration),
+    "request_after_pickup": ("request_datetime", _request_after_pickup),
+    "negative_pay": ("driver_pay", _negative_pay),
+    "impossible_distance": ("trip_miles", _impossible_distance),
+    # Last, so the violation bits of rows quarantined before it keep their meaning
+    "negative_fare": ("base_passenger_fare", _negative_fare),
+}
+
+
+@dataclass
+class TripValidation:
+    clean: TripColumns
+    quarantined: TripColumns
+    violations: np.ndarray  # per quarantined row, bit i set for the i-th rule of VALIDATION_RULES
+    counts: Dict[str, int]  # rows breaking each rule, a row can break several
+
+    def report(self) -> dict:
+        return {"rows_received": len(self.clean) + len(self.quarantined),
+                "rows_quarantined": len(self.quarantined),
+                "violations": self.counts}
+
+    def quarantine_arrays(self) -> Dict[str, np.ndarray]:
+        return {**self.quarantined.columns, "violations": self.violations}
+
+
+def validate_trips(columns: TripColumns, start: datetime, end: datetime) -> TripValidation:
+    """
+    Check a month of trips picked up in [start, end) against every rule at once and split off the
+    rows breaking any, so aggregates and queries only ever see clean rows.
+    """
+    violations = np.zeros(len(columns), dtype=np.uint16)
+    counts = {}
+    for bit, (rule, (required, check)) in enumerate(VALIDATION_RULES.items()):
+        if required not in columns:
+            continue
+        bad = check(columns, start, end)
+        counts[rule] = int(bad.sum())
+        violations |= bad.astype(np.uint16) << bit
+
+    bad_rows = violations != 0
+    return TripValidation(columns.take(~bad_rows), columns.take(bad_rows), violations[bad_rows], counts)
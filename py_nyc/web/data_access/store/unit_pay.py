@@ -0,0 +1,69 @@
+from typing import Dict, List
+import numpy as np
+from py_nyc.web.data_access.store.histograms import BinSpec, binned_histogram
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+from py_nyc.web.data_access.store.trip_cube import N_ZONES, zone_index
+from py_nyc.web.data_access.store.trip_stats import HOURS_PER_WEEK, hour_of_week
+
+UNIT_PAY_BINS: Dict[str, BinSpec] = {
+    "pay_per_mile": BinSpec(step=0.25, n_bins=61),     # $0 - $15 per mile
+    "pay_per_minute": BinSpec(step=0.05, n_bins=61),   # $0 - $3 per minute
+}
+
+
+def unit_pay(columns: TripColumns) -> Dict[str, np.ndarray]:
+    """Driver pay per mile and per minute of every trip, NaN where pay, distance or duration is unknown or zero."""
+    n = len(columns)
+    pay = columns["driver_pay"].astype(np.float64) if "driver_pay" in columns else np.full(n, np.nan)
+    miles = columns["trip_miles"].astype(np.float64) if "trip_miles" in columns else np.full(n, np.nan)
+    minutes = columns["trip_time"].astype(np.float64) / 60 if "trip_time" in columns else np.full(n, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "pay_per_mile": np.where(miles > 0, pay / miles, np.nan),
+            "pay_per_minute": np.where(minutes > 0, pay / minutes, np.nan),
+        }
+
+
+def hour_of_week_mask(start_hr: int = 0, end_hr: int = 23, weekdays: List[int] = range(7)) -> np.ndarray:
+    """Hours of the week (Monday 00:00 = 0) on the given weekdays (Monday = 0) with start_hr <= hour <= end_hr."""
+    hours = np.arange(HOURS_PER_WEEK)
+    return np.isin(hours // 24, list(weekdays)) & (hours % 24 >= start_hr) & (hours % 24 <= end_hr)
+
+
+class UnitPayHistograms:
+    """
+    Histograms of driver pay per mile and per minute for every (pickup zone, hour of week),
+    each of shape (N_ZONES, 168, n_bins). Built at ingestion so distributions over any zones,
+    hour window and months are sums of bins.
+    """
+
+    def __init__(self, hist: Dict[str, np.ndarray]):
+        self.hist = hist
+
+    @classmethod
+    def build(cls, columns: TripColumns) -> "UnitPayHistograms":
+        pickups = columns["pickup_datetime"]
+        known = ~np.isnat(pickups)
+        keys = (zone_index(columns["pulocationid"]) * HOURS_PER_WEEK + hour_of_week(pickups))[known]
+
+        return cls({
+            metric: binned_histogram(keys, values[known], N_ZONES * HOURS_PER_WEEK, UNIT_PAY_BINS[metric])
+            .reshape(N_ZONES, HOURS_PER_WEEK, UNIT_PAY_BINS[metric].n_bins)
+            for metric, values in unit_pay(columns).items()
+        })
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "UnitPayHistograms":
+        return cls({metric: arrays[metric] for metric in UNIT_PAY_BINS})
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        return dict(self.hist)
+
+    def window(self, metric: str, zones: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Histograms of the given zones summed over the selected hours of week, shape (len(zones), n_bins)."""
+        return self.hist[metric][zones][:, hours].sum(axis=1, dtype=np.uint64)
+
+    def cells(self, metric: str, zones: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Histograms of the (zones[i], hours[i]) pairs, shape (len(zones), n_bins)."""
+        return self.hist[metric][zones, hours].astype(np.uint64)
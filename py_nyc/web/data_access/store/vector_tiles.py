@@ -0,0 +1,261 @@
+import gzip
+import json
+import math
+import os
+import shutil
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.data_access.store.zone_geometry import GeometryLevel, get_zone_geometry_store, get_zone_topology
+
+LAYER_NAME = "zones"
+# Tile coordinates per tile side, and how far past the tile edge polygons are kept so
+# strokes along the edge are not drawn where neighbouring tiles meet
+MVT_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Geometry commands and feature type of the vector tile spec (version 2)
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+
+class InvalidTileError(Exception):
+    """Raised when a tile's x or y is outside the grid of its zoom."""
+    pass
+
+
+def to_world(lon_lat: np.ndarray) -> np.ndarray:
+    """Longitude/latitude points (shape (n, 2)) in Web Mercator scaled to [0, 1], y growing south."""
+    lon, lat = np.radians(lon_lat[:, 0]), np.radians(lon_lat[:, 1])
+    return np.stack([(lon + math.pi) / (2 * math.pi), (1 - np.log(np.tan(math.pi / 4 + lat / 2)) / math.pi) / 2], axis=1)
+
+
+def check_tile(z: int, x: int, y: int) -> None:
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise InvalidTileError(f"Tile {z}/{x}/{y} is outside the {2 ** z}x{2 ** z} grid of zoom {z}")
+
+
+def clip_ring(points: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Sutherland-Hodgman clip of a ring (shape (n, 2), not closed) to the square [low, high]²."""
+    for axis, bound, below in ((0, low, False), (0, high, True), (1, low, False), (1, high, True)):
+        if not len(points):
+            break
+        inside = points[:, axis] <= bound if below else points[:, axis] >= bound
+        if inside.all():
+            continue
+        following = np.roll(points, -1, axis=0)
+        crossing = inside != np.roll(inside, -1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = (bound - points[:, axis]) / (following[:, axis] - points[:, axis])
+            crossings = points + t[:, None] * (following - points)
+        # Every edge emits its start when inside, then its crossing with the bound
+        points = np.stack([points, crossings], axis=1).reshape(-1, 2)[np.stack([inside, crossing], axis=1).ravel()]
+    return points
+
+
+def _ring_area(points: np.ndarray) -> float:
+    following = np.roll(points, -1, axis=0)
+    return float((points[:, 0] * following[:, 1] - following[:, 0] * points[:, 1]).sum()) / 2
+
+
+def _quantize(points: np.ndarray) -> np.ndarray:
+    points = np.round(points).astype(np.int64)
+    repeated = (points == np.roll(points, 1, axis=0)).all(axis=1)
+    if repeated.all():
+        return points[:1]
+    return points[~repeated]
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values << 1) ^ (values >> 63)
+
+
+def encode_polygons(polygons: List[List[np.ndarray]]) -> List[int]:
+    """
+    Geometry commands of a (multi)polygon in tile coordinates. Exterior rings are wound with positive
+    area and holes with negative area, as the spec requires in tile coordinates (y growing down).
+    """
+    commands: List[int] = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            if (_ring_area(ring) > 0) != (i == 0):
+                ring = ring[::-1]
+            deltas = _zigzag(np.diff(np.vstack([cursor, ring]), axis=0)).ravel().tolist()
+            commands += [MOVE_TO | 1 << 3, *deltas[:2], LINE_TO | (len(ring) - 1) << 3, *deltas[2:], CLOSE_PATH | 1 << 3]
+            cursor = ring[-1]
+    return commands
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """A length delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: List[int]) -> bytes:
+    return _field(number, b"".join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    """A vector tile Value message: strings, unsigned or signed integers, doubles."""
+    if isinstance(value, str):
+        return _field(1, value.encode())
+    if isinstance(value, int):
+        return _varint(5 << 3) + _varint(value) if value >= 0 else _varint(6 << 3) + _varint(-2 * value - 1)
+    return _varint(3 << 3 | 1) + struct.pack("<d", value)
+
+
+class TileLayer:
+    """A vector tile layer being written, sharing keys and values between its features."""
+
+    def __init__(self, name: str, extent: int = MVT_EXTENT):
+        self.name = name
+        self.extent = extent
+        self.keys: Dict[str, int] = {}
+        self.values: Dict[tuple, int] = {}
+        self.features: List[bytes] = []
+
+    def add_polygon(self, feature_id: int, properties: dict, polygons: List[List[np.ndarray]]) -> None:
+        tags = []
+        for key, value in properties.items():
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        self.features.append(_varint(1 << 3) + _varint(feature_id) + _packed(2, tags) +
+                             _varint(3 << 3) + _varint(POLYGON) + _packed(4, encode_polygons(polygons)))
+
+    def encode(self) -> bytes:
+        return (_varint(15 << 3) + _varint(2) + _field(1, self.name.encode()) +
+                b"".join(_field(2, feature) for feature in self.features) +
+                b"".join(_field(3, key.encode()) for key in self.keys) +
+                b"".join(_field(4, _value(value)) for _, value in self.values) +
+                _varint(5 << 3) + _varint(self.extent))
+
+
+class ZoneTiles:
+    """
+    Taxi zone polygons of one level of detail in Web Mercator, cut into Mapbox vector tiles
+    on request. Zones and parts whose bounding box misses a tile are skipped before clipping.
+    """
+
+    def __init__(self, collection: dict):
+        self.properties: List[dict] = []
+        self.polygons: List[List[List[np.ndarray]]] = []  # per zone, polygon, ring
+        boxes = []
+        for feature in collection["features"]:
+            properties = feature["properties"]
+            polygons = [[to_world(np.asarray(ring, dtype=np.float64)[:-1]) for ring in polygon]
+                        for polygon in feature["geometry"]["coordinates"]]
+            self.properties.append({"location_id": int(properties["location_id"]),
+                                    "zone": properties["zone"], "borough": properties["borough"]})
+            self.polygons.append(polygons)
+            boxes.append([(polygon[0].min(axis=0), polygon[0].max(axis=0)) for polygon in polygons])
+        self.boxes = boxes  # per zone and polygon, (min, max) of the exterior ring
+        self.bounds = (np.min([low for zone in boxes for low, _ in zone], axis=0),
+                       np.max([high for zone in boxes for _, high in zone], axis=0))
+
+    def tiles(self, z: int) -> Iterator[Tuple[int, int]]:
+        """(x, y) of every tile of zoom z overlapping the zones."""
+        (x0, y0), (x1, y1) = (np.floor(corner * 2 ** z).astype(int) for corner in self.bounds)
+        for x in range(x0, min(x1, 2 ** z - 1) + 1):
+            for y in range(y0, min(y1, 2 ** z - 1) + 1):
+                yield x, y
+
+    def render(self, z: int, x: int, y: int, values: Dict[str, np.ndarray]) -> bytes:
+        """
+        The tile's zones as one polygon layer, with each `values` array (indexed by location id)
+        added to a zone's properties unless NaN. Empty bytes for a tile without zones.
+        """
+        check_tile(z, x, y)
+        scale = 2 ** z
+        buffer = TILE_BUFFER / MVT_EXTENT / scale
+        low, high = np.array([x, y]) / scale - buffer, np.array([x + 1, y + 1]) / scale + buffer
+
+        layer = TileLayer(LAYER_NAME)
+        for properties, polygons, boxes in zip(self.properties, self.polygons, self.boxes):
+            tile_polygons = []
+            for polygon, (box_low, box_high) in zip(polygons, boxes):
+                if (box_high < low).any() or (box_low > high).any():
+                    continue
+                rings = []
+                for ring in polygon:
+                    ring = clip_ring((ring * scale - [x, y]) * MVT_EXTENT, -TILE_BUFFER, MVT_EXTENT + TILE_BUFFER)
+                    ring = _quantize(ring) if len(ring) else ring
+                    if len(ring) < 3 or _ring_area(ring) == 0:
+                        if not rings:
+                            break  # The exterior ring missed the tile or collapsed
+                        continue
+                    rings.append(ring)
+                if rings:
+                    tile_polygons.append(rings)
+            if not tile_polygons:
+                continue
+
+            location_id = properties["location_id"]
+            zone_values = {name: array[location_id].item() for name, array in values.items()
+                           if 0 <= location_id < len(array) and not np.isnan(array[location_id])}
+            layer.add_polygon(location_id, {**properties, **{name: int(value) if float(value).is_integer() else value
+                                                             for name, value in zone_values.items()}}, tile_polygons)
+
+        return _field(3, layer.encode()) if layer.features else b""
+
+
+class TileStore:
+    """
+    Vector tiles rendered ahead by the prerender_tiles job, gzip compressed, per data version:
+    {root}/{dataset}/{data_version}/{key}/{z}/{x}/{y}.mvt.gz
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def _path(self, dataset: str, version: str, key: str, z: int, x: int, y: int) -> Path:
+        return self.root / dataset / version / key / str(z) / str(x) / f"{y}.mvt.gz"
+
+    def read(self, dataset: str, version: str, key: str, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            return self._path(dataset, version, key, z, x, y).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, dataset: str, version: str, key: str, z: int, x: int, y: int, content: bytes) -> None:
+        path = self._path(dataset, version, key, z, x, y)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+    def prune(self, dataset: str, keep_version: str) -> None:
+        """Remove the tiles of every other data version of a dataset."""
+        for path in (self.root / dataset).glob("*"):
+            if path.is_dir() and path.name != keep_version:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def compress_tile(content: bytes) -> bytes:
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+@lru_cache()
+def get_zone_tiles(level: GeometryLevel) -> ZoneTiles:
+    """Zone polygons of a level of detail, from the build_zone_geometries output when there is one."""
+    content = get_zone_geometry_store().read(level)
+    collection = json.loads(gzip.decompress(content)) if content else get_zone_topology().simplified(level)
+    return ZoneTiles(collection)
+
+
+@lru_cache()
+def get_tile_store() -> TileStore:
+    """Process wide tile store. Only created once per application lifecycle."""
+    return TileStore(get_settings().tile_dir)
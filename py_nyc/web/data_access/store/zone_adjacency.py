@@ -0,0 +1,97 @@
+from functools import lru_cache
+from typing import Dict
+import numpy as np
+from py_nyc.web.data_access.store.trip_cube import N_ZONES
+from py_nyc.web.data_access.store.zone_geometry import ZoneTopology, get_zone_geometry_store, get_zone_topology
+
+# Getis-Ord Gi* z-score from which a zone is a hotspot, significant at the 95% level (two-sided)
+HOTSPOT_SCORE = 1.96
+
+
+class ZoneAdjacency:
+    """
+    Taxi zones sharing a border, as a symmetric sparse matrix over location ids in CSR form
+    (N_ZONES rows). Zones are neighbours when a boundary arc of the zone topology belongs to both;
+    zones touching at a single point are not.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, mapped: np.ndarray):
+        self.indptr = indptr
+        self.indices = indices
+        self.mapped = mapped  # whether each location id has a zone on the map
+        self.rows = np.repeat(np.arange(N_ZONES), np.diff(indptr))  # row of every stored entry
+
+    @classmethod
+    def from_topology(cls, topology: ZoneTopology) -> "ZoneAdjacency":
+        arc_zones = [set() for _ in topology.arcs]
+        for feature, polygons in zip(topology.features, topology.rings):
+            location_id = int(feature["properties"]["location_id"])
+            for rings in polygons:
+                for ring in rings:
+                    for arc, _ in ring:
+                        arc_zones[arc].add(location_id)
+
+        pairs = {(a, b) for zones in arc_zones for a in zones for b in zones if a != b}
+        pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+        mapped = np.zeros(N_ZONES, dtype=bool)
+        mapped[[int(feature["properties"]["location_id"]) for feature in topology.features]] = True
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(pairs[:, 0], minlength=N_ZONES))])
+        return cls(indptr, pairs[:, 1].astype(np.int16), mapped)
+
+    @classmethod
+    def from_npz(cls, arrays: Dict[str, np.ndarray]) -> "ZoneAdjacency":
+        return cls(arrays["indptr"], arrays["indices"], arrays["mapped"])
+
+    def to_npz(self) -> Dict[str, np.ndarray]:
+        return {"indptr": self.indptr, "indices": self.indices, "mapped": self.mapped}
+
+    @property
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def neighbours(self, location_id: int) -> np.ndarray:
+        return self.indices[self.indptr[location_id]:self.indptr[location_id + 1]]
+
+    def matvec(self, values: np.ndarray) -> np.ndarray:
+        """Sum of the neighbours' values of every zone, the product of the matrix with a per-zone vector."""
+        return np.bincount(self.rows, weights=values[self.indices], minlength=N_ZONES)
+
+    def components(self, members: np.ndarray) -> np.ndarray:
+        """
+        Connected components of the zones in `members` (a boolean mask over location ids) linked by
+        shared borders with each other, labelled by their smallest location id; -1 outside `members`.
+        """
+        labels = np.where(members, np.arange(N_ZONES), N_ZONES)
+        inner = members[self.rows] & members[self.indices]
+        rows, indices = self.rows[inner], self.indices[inner]
+        while True:
+            # Every zone takes the smallest label among its neighbours until nothing changes
+            updated = labels.copy()
+            np.minimum.at(updated, rows, labels[indices])
+            if (updated == labels).all():
+                return np.where(members, labels, -1)
+            labels = updated
+
+
+def getis_ord(adjacency: ZoneAdjacency, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Neighbourhood mean (the zone and its neighbours) and Getis-Ord Gi* z-score of a per-zone
+    vector, over the zones on the map; NaN elsewhere. Both cost a single sparse matrix-vector product.
+    """
+    mapped = adjacency.mapped
+    n = mapped.sum()
+    weights = adjacency.degree + 1.0
+    neighbourhood = values + adjacency.matvec(values)
+
+    mean = values[mapped].mean()
+    std = np.sqrt((values[mapped] ** 2).mean() - mean ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score = (neighbourhood - mean * weights) / (std * np.sqrt((n * weights - weights ** 2) / (n - 1)))
+    return np.where(mapped, neighbourhood / weights, np.nan), np.where(mapped, score, np.nan)
+
+
+@lru_cache()
+def get_zone_adjacency() -> ZoneAdjacency:
+    """Process wide zone adjacency, from the build_zone_geometries output when there is one."""
+    arrays = get_zone_geometry_store().read_adjacency()
+    return ZoneAdjacency.from_npz(arrays) if arrays is not None else ZoneAdjacency.from_topology(get_zone_topology())
@@ -0,0 +1,278 @@
+import gzip
+import json
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from py_nyc.web.core.config import get_settings
+from py_nyc.web.data_access.store.taxi_zones import TAXI_ZONES_GEOJSON
+
+# Coordinates are snapped to this grid (about 10 cm) so vertices shared by neighbouring zones compare equal
+COORDINATE_SCALE = 10 ** 6
+
+
+@dataclass(frozen=True)
+class GeometryLevel:
+    name: str
+    max_zoom: int  # finest map zoom the level is served for
+    tolerance: float  # Douglas-Peucker tolerance in degrees, about a pixel at max_zoom
+
+    @property
+    def digits(self) -> int:
+        """Decimals kept in the output, a tenth of the tolerance."""
+        return max(0, math.ceil(-math.log10(self.tolerance / 10)))
+
+
+def _pixel_degrees(zoom: int) -> float:
+    return 360 / (256 * 2 ** zoom)
+
+
+# Coarsest first; zooms past the last level get the last level
+GEOMETRY_LEVELS = [GeometryLevel(f"z{zoom}", zoom, _pixel_degrees(zoom)) for zoom in (9, 11, 13, 15)]
+
+
+def level_for_zoom(zoom: int) -> GeometryLevel:
+    return next((level for level in GEOMETRY_LEVELS if zoom <= level.max_zoom), GEOMETRY_LEVELS[-1])
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Mask of the points of a line (shape (n, 2)) kept by Douglas-Peucker simplification; both ends are kept."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        between = points[start + 1:end] - points[start]
+        direction = points[end] - points[start]
+        length = np.hypot(*direction)
+        if length == 0:
+            # Closed line, measure from the shared end point
+            distances = np.hypot(between[:, 0], between[:, 1])
+        else:
+            distances = np.abs(direction[0] * between[:, 1] - direction[1] * between[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack += [(start, split), (split, end)]
+    return keep
+
+
+def _ring_keys(ring: list) -> np.ndarray:
+    """A ring's vertices snapped to the grid as (n, 2) int64, without the closing point or repeated points."""
+    points = np.round(np.asarray(ring, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    if len(points) > 1 and (points[0] == points[-1]).all():
+        points = points[:-1]
+    repeated = np.concatenate([[False], (points[1:] == points[:-1]).all(axis=1)])
+    return points[~repeated]
+
+
+def _vertex_ids(points: np.ndarray) -> np.ndarray:
+    return (points[:, 0] << 32) ^ (points[:, 1] & 0xFFFFFFFF)
+
+
+class ZoneTopology:
+    """
+    Taxi zone rings cut into arcs at every vertex where more than two boundaries meet, so a boundary
+    shared by two zones is a single arc. Simplifying each arc once keeps neighbouring zones
+    exactly adjacent (no gaps or overlaps) at every tolerance.
+    """
+
+    def __init__(self, features: List[dict], arcs: List[np.ndarray], rings: List[List[List[List[Tuple[int, bool]]]]]):
+        self.features = features  # GeoJSON features without geometry
+        self.arcs = arcs  # (n, 2) float coordinates
+        self.rings = rings  # per feature, polygon, ring: (arc, reversed) pairs
+
+    @classmethod
+    def from_geojson(cls, path: str | Path = TAXI_ZONES_GEOJSON) -> "ZoneTopology":
+        with open(path) as file:
+            collection = json.load(file)
+
+        features, feature_rings = [], []
+        for feature in collection["features"]:
+            geometry = feature["geometry"]
+            polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+            features.append({"type": "Feature", "properties": feature["properties"]})
+            feature_rings.append([[_ring_keys(ring) for ring in polygon] for polygon in polygons])
+
+        # Degree of every vertex in the graph of boundary segments; junctions are vertices of degree other than 2
+        all_rings = [ring for polygons in feature_rings for polygon in polygons for ring in polygon]
+        ids = [_vertex_ids(ring) for ring in all_rings]
+        edges = np.concatenate([np.stack([ring_ids, np.roll(ring_ids, -1)], axis=1) for ring_ids in ids])
+        edges = np.unique(np.sort(edges, axis=1), axis=0)
+        vertices, degree = np.unique(edges, return_counts=True)
+        junctions = set(vertices[degree != 2].tolist())
+
+        arc_ids: Dict[tuple, int] = {}
+        arcs: List[np.ndarray] = []
+
+        def add_arc(points: np.ndarray, point_ids: list) -> Tuple[int, bool]:
+            forward, backward = tuple(point_ids), tuple(reversed(point_ids))
+            key, reversed_ = (forward, False) if forward <= backward else (backward, True)
+            if key not in arc_ids:
+                arc_ids[key] = len(arcs)
+                arcs.append((points[::-1] if reversed_ else points) / COORDINATE_SCALE)
+            return arc_ids[key], reversed_
+
+        rings = []
+        ring_iter = iter(zip(all_rings, ids))
+        for polygons in feature_rings:
+            feature_arcs = []
+            for polygon in polygons:
+                polygon_arcs = []
+                for _ in polygon:
+                    points, point_ids = next(ring_iter)
+                    cuts = [i for i, vertex in enumerate(point_ids.tolist()) if vertex in junctions]
+                    if not cuts:
+                        # A ring touching no other boundary, cut where every ring with these points would
+                        cuts = [int(np.argmin(point_ids))]
+                    # Start at a cut and close the ring, so every arc runs from one cut to the next
+                    order = np.roll(np.arange(len(points)), -cuts[0])
+                    points, point_ids = np.vstack([points[order], points[order[:1]]]), np.append(point_ids[order], point_ids[order[0]])
+                    bounds = [cut - cuts[0] for cut in cuts] + [len(points) - 1]
+                    polygon_arcs.append([add_arc(points[start:end + 1], point_ids[start:end + 1].tolist())
+                                         for start, end in zip(bounds, bounds[1:])])
+                feature_arcs.append(polygon_arcs)
+            rings.append(feature_arcs)
+
+        return cls(features, arcs, rings)
+
+    def simplified(self, level: Optional[GeometryLevel]) -> dict:
+        """
+        The zones as a GeoJSON FeatureCollection simplified to `level` with coordinates rounded to its
+        digits, or at full detail without a level. Parts and holes that collapse are left out; a zone
+        whose every part collapses keeps its largest part at full detail.
+        """
+        if level is None:
+            arcs = self.arcs
+        else:
+            arcs = [arc[douglas_peucker(arc, level.tolerance)] for arc in self.arcs]
+        digits = level.digits if level else int(math.log10(COORDINATE_SCALE))
+
+        features = []
+        for feature, polygons in zip(self.features, self.rings):
+            coordinates = [polygon for polygon in (self._polygon(rings, arcs, digits) for rings in polygons) if polygon]
+            if not coordinates and polygons:
+                largest = max(polygons, key=lambda rings: sum(len(self.arcs[arc]) for arc, _ in rings[0]))
+                coordinates = [self._polygon(largest, self.arcs, int(math.log10(COORDINATE_SCALE)))]
+            features.append({**feature, "geometry": {"type": "MultiPolygon", "coordinates": coordinates}})
+        return {"type": "FeatureCollection", "features": features}
+
+    @staticmethod
+    def _polygon(rings: List[List[Tuple[int, bool]]], arcs: List[np.ndarray], digits: int) -> list:
+        polygon = []
+        for ring_arcs in rings:
+            points = np.vstack([arcs[arc][::-1] if reversed_ else arcs[arc] for arc, reversed_ in ring_arcs]).round(digits)
+            repeated = np.concatenate([[False], (points[1:] == points[:-1]).all(axis=1)])
+            points = points[~repeated]
+            if len(points) < 4:
+                if not polygon:
+                    return []  # The outer ring collapsed
+                continue
+            polygon.append(points.tolist())
+        return polygon
+
+
+class ZoneGeometryStore:
+    """
+    Simplified zone geometries built by the build_zone_geometries job, one gzip
+    compressed GeoJSON file per level: {root}/{level}.geojson.gz, and the zone
+    adjacency matrix: {root}/adjacency.npz
+    """
+
+    ADJACENCY_FILE = "adjacency.npz"
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def read(self, level: GeometryLevel) -> Optional[bytes]:
+        try:
+            return (self.root / f"{level.name}.geojson.gz").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def version(self, level: GeometryLevel) -> Optional[int]:
+        """Modification time of a level's file, None when the job has not written it."""
+        try:
+            return (self.root / f"{level.name}.geojson.gz").stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def write(self, level: GeometryLevel, collection: dict) -> bytes:
+        content = compress_geojson(collection)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f"{level.name}.geojson.gz.tmp"
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, self.root / f"{level.name}.geojson.gz")
+        return content
+
+    def read_adjacency(self) -> Optional[Dict[str, np.ndarray]]:
+        try:
+            with np.load(self.root / self.ADJACENCY_FILE) as npz:
+                return {name: npz[name] for name in npz.files}
+        except FileNotFoundError:
+            return None
+
+    def write_adjacency(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f"{self.ADJACENCY_FILE}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.root / self.ADJACENCY_FILE)
+
+
+class ZoneFeatureTemplate:
+    """
+    A zone FeatureCollection serialized once, with a gap in every feature's properties for its
+    density (see core.models.TaxiZoneProperties). Annotating it formats one number per zone
+    and joins the stored bytes around them, so the geometry is never encoded again.
+    """
+
+    def __init__(self, collection: dict):
+        self.location_ids = np.array([int(feature["properties"]["location_id"]) for feature in collection["features"]])
+        heads, tails = [], []
+        for feature in collection["features"]:
+            properties = feature["properties"]
+            properties = {
+                "shape_area": float(properties["shape_area"]),
+                "objectid": int(properties["objectid"]),
+                "shape_leng": float(properties["shape_leng"]),
+                "location_id": int(properties["location_id"]),
+                "zone": properties["zone"],
+                "borough": properties["borough"],
+            }
+            heads.append('{"type":"Feature","properties":' + json.dumps(properties, separators=(",", ":"))[:-1] + ',"density":')
+            tails.append('},"geometry":' + json.dumps(feature["geometry"], separators=(",", ":")) + "}")
+        # The bytes between consecutive densities
+        self.pieces = [piece.encode() for piece in
+                       ['{"type":"FeatureCollection","features":[' + heads[0]] +
+                       [tail + "," + head for tail, head in zip(tails, heads[1:])] +
+                       [tails[-1] + "]}"]]
+
+    def render(self, density: np.ndarray) -> bytes:
+        """The collection with each feature's density taken from `density`, indexed by location id."""
+        parts = [b""] * (2 * len(self.pieces) - 1)
+        parts[::2] = self.pieces
+        parts[1::2] = [b"%d" % value for value in np.round(density[self.location_ids]).astype(np.int64).tolist()]
+        return b"".join(parts)
+
+
+def compress_geojson(collection: dict) -> bytes:
+    # mtime=0 keeps identical geometries byte identical, and so their ETags
+    return gzip.compress(json.dumps(collection, separators=(",", ":")).encode(), compresslevel=9, mtime=0)
+
+
+@lru_cache()
+def get_zone_geometry_store() -> ZoneGeometryStore:
+    """Process wide zone geometry store. Only created once per application lifecycle."""
+    return ZoneGeometryStore(get_settings().zone_geometry_dir)
+
+
+@lru_cache()
+def get_zone_topology() -> ZoneTopology:
+    """Process wide zone topology, for levels that were not built ahead."""
+    return ZoneTopology.from_geojson()
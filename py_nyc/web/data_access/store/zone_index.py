@@ -0,0 +1,157 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+from py_nyc.web.data_access.store.taxi_zones import TAXI_ZONES_GEOJSON
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+
+# Grid cell side in degrees (about 400 m north-south), so most cells lie inside a single zone
+CELL_DEGREES = 0.004
+# Cells crossed by a zone boundary
+MIXED = -1
+# Points tested against a polygon at once, times its edges
+PIP_BLOCK = 1 << 22
+
+# Zone id columns of datasets that predate taxi zones, and the coordinate columns each is derived from
+COORDINATE_COLUMNS = {
+    "pulocationid": ("pickup_longitude", "pickup_latitude"),
+    "dolocationid": ("dropoff_longitude", "dropoff_latitude"),
+}
+
+
+def _expand(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenated ranges [starts[i], starts[i] + counts[i])."""
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts - starts, counts)
+
+
+def points_in_polygon(edges: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting of points (shape (n, 2)) against every ring edge (x0, y0, x1, y1) of a polygon, holes included."""
+    x0, y0, x1, y1 = edges.T
+    inside = np.zeros(len(points), dtype=bool)
+    block = max(1, PIP_BLOCK // max(len(edges), 1))
+    for start in range(0, len(points), block):
+        px, py = points[start:start + block, :1], points[start:start + block, 1:]
+        spans = (y0 > py) != (y1 > py)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            crossings = spans & (px < x0 + (py - y0) * (x1 - x0) / (y1 - y0))
+        inside[start:start + block] = crossings.sum(axis=1) % 2 == 1
+    return inside
+
+
+class ZoneIndex:
+    """
+    Point to taxi zone lookup over a regular longitude/latitude grid. Cells no zone boundary
+    crosses resolve straight to their zone; points in the other cells are prefiltered by the
+    bounding boxes of the polygons overlapping their cell and ray cast against the survivors only.
+    """
+
+    def __init__(self, part_zones: np.ndarray, part_edges: list, cell_degrees: float = CELL_DEGREES):
+        self.part_zones = part_zones  # location id of each polygon
+        self.part_edges = part_edges  # (n, 4) ring edges (x0, y0, x1, y1) of each polygon
+        self.part_boxes = np.array([[edges[:, [0, 2]].min(), edges[:, [1, 3]].min(), edges[:, [0, 2]].max(), edges[:, [1, 3]].max()]
+                                    for edges in part_edges])  # (min lon, min lat, max lon, max lat) of each polygon
+        self.cell_degrees = cell_degrees
+        self.origin = self.part_boxes[:, :2].min(axis=0)  # lon, lat of the grid's south west corner
+        self.shape = tuple(int(n) for n in np.floor((self.part_boxes[:, 2:].max(axis=0) - self.origin) / cell_degrees) + 1)
+
+        # Cells a boundary may cross: those overlapped by the bounding box of any edge
+        edges = np.concatenate(part_edges)
+        edge_boxes = np.hstack([np.minimum(edges[:, :2], edges[:, 2:]), np.maximum(edges[:, :2], edges[:, 2:])])
+        mixed = np.zeros(self.shape[0] * self.shape[1], dtype=bool)
+        mixed[self._box_cells(edge_boxes)[0]] = True
+
+        # Polygons overlapping each mixed cell, in CSR form
+        cells, parts = self._box_cells(self.part_boxes)
+        in_mixed = mixed[cells]
+        order = np.argsort(cells[in_mixed], kind="stable")
+        self.cell_parts = parts[in_mixed][order]
+        self.cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cells[in_mixed], minlength=len(mixed)))])
+
+        # Every other cell lies wholly inside one zone or outside all of them, like its center
+        pure = np.flatnonzero(~mixed)
+        pure_position = np.cumsum(~mixed) - 1
+        centers = self.origin + (np.stack([pure % self.shape[0], pure // self.shape[0]], axis=1) + 0.5) * cell_degrees
+        self.cell_zones = np.full(len(mixed), MIXED, dtype=np.int32)  # 0 outside every zone, MIXED when crossed by a boundary
+        self.cell_zones[pure] = self._test_parts(centers, parts[~in_mixed], pure_position[cells[~in_mixed]])
+
+    @classmethod
+    def from_geojson(cls, path: str | Path = TAXI_ZONES_GEOJSON, cell_degrees: float = CELL_DEGREES) -> "ZoneIndex":
+        with open(path) as file:
+            collection = json.load(file)
+
+        part_zones, part_edges = [], []
+        for feature in collection["features"]:
+            geometry = feature["geometry"]
+            polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype=np.float64) for ring in polygon]
+                part_zones.append(int(feature["properties"]["location_id"]))
+                part_edges.append(np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings]))
+        return cls(np.array(part_zones, dtype=np.uint16), part_edges, cell_degrees)
+
+    def _box_cells(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(cell, box) pairs of every grid cell each (min lon, min lat, max lon, max lat) box overlaps."""
+        low = np.clip(np.floor((boxes[:, :2] - self.origin) / self.cell_degrees).astype(np.int64), 0, np.array(self.shape) - 1)
+        high = np.clip(np.floor((boxes[:, 2:] - self.origin) / self.cell_degrees).astype(np.int64), 0, np.array(self.shape) - 1)
+        width, height = (high - low + 1).T
+        owners = np.repeat(np.arange(len(boxes)), width * height)
+        within = _expand(np.zeros(len(boxes), dtype=np.int64), width * height)
+        x = low[owners, 0] + within % width[owners]
+        y = low[owners, 1] + within // width[owners]
+        return y * self.shape[0] + x, owners
+
+    def _test_parts(self, points: np.ndarray, pair_parts: np.ndarray, pair_points: np.ndarray) -> np.ndarray:
+        """Zone of each point among its candidate (point, polygon) pairs, 0 when none holds it."""
+        zones = np.zeros(len(points), dtype=np.uint16)
+        boxes = self.part_boxes[pair_parts]
+        xy = points[pair_points]
+        keep = ((xy >= boxes[:, :2]) & (xy <= boxes[:, 2:])).all(axis=1)
+        pair_parts, pair_points = pair_parts[keep], pair_points[keep]
+
+        order = np.argsort(pair_parts, kind="stable")
+        pair_parts, pair_points = pair_parts[order], pair_points[order]
+        bounds = np.flatnonzero(np.diff(pair_parts)) + 1
+        for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(pair_parts)]])):
+            if start == end:
+                continue
+            part = pair_parts[start]
+            candidates = pair_points[start:end]
+            zones[candidates[points_in_polygon(self.part_edges[part], points[candidates])]] = self.part_zones[part]
+        return zones
+
+    def lookup(self, longitudes: np.ndarray, latitudes: np.ndarray) -> np.ndarray:
+        """Location id of the zone holding each point, 0 for points outside every zone (or missing)."""
+        points = np.stack([np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64)], axis=1)
+        zones = np.zeros(len(points), dtype=np.uint16)
+        with np.errstate(invalid="ignore"):
+            cell_xy = np.floor((points - self.origin) / self.cell_degrees)
+            on_grid = np.flatnonzero(((cell_xy >= 0) & (cell_xy < self.shape)).all(axis=1))
+        cells = cell_xy[on_grid, 1].astype(np.int64) * self.shape[0] + cell_xy[on_grid, 0].astype(np.int64)
+
+        cell_zones = self.cell_zones[cells]
+        pure = cell_zones != MIXED
+        zones[on_grid[pure]] = cell_zones[pure]
+
+        mixed_points, mixed_cells = on_grid[~pure], cells[~pure]
+        counts = self.cell_offsets[mixed_cells + 1] - self.cell_offsets[mixed_cells]
+        pair_parts = self.cell_parts[_expand(self.cell_offsets[mixed_cells], counts)]
+        pair_points = np.repeat(np.arange(len(mixed_points)), counts)
+        zones[mixed_points] = self._test_parts(points[mixed_points], pair_parts, pair_points)
+        return zones
+
+
+def with_location_ids(columns: TripColumns, index: Optional["ZoneIndex"] = None) -> TripColumns:
+    """Trips with the zone id columns they lack derived from their coordinates, where they have them."""
+    derived: Dict[str, np.ndarray] = {}
+    for name, (longitude, latitude) in COORDINATE_COLUMNS.items():
+        if name not in columns and longitude in columns and latitude in columns:
+            derived[name] = (index or get_zone_index()).lookup(columns[longitude], columns[latitude])
+    return TripColumns({**columns.columns, **derived}) if derived else columns
+
+
+@lru_cache()
+def get_zone_index() -> ZoneIndex:
+    """Process wide point to zone index. Only built once per application lifecycle."""
+    return ZoneIndex.from_geojson()
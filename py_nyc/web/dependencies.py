@@ -10,6 +10,13 @@ from py_nyc.web.data_access.services.user_service import UserService
 from .core.listings_logic import ListingsLogic
 from .core.plates_logic import PlatesLogic
 from .core.trips_logic import TripsLogic
+from .core.analytics_jobs import AnalyticsJobs
+from .core.driver_trips_logic import DriverTripsLogic
+from .core.driver_benchmark_logic import DriverBenchmarkLogic
+from .core.earnings_logic import EarningsLogic
+from .core.snapshot_logic import SnapshotLogic
+from .core.zones_logic import ZonesLogic
+from .core.tiles_logic import TilesLogic, get_tile_cache, get_zone_values_cache
 from .core.vehicles_logic import VehiclesLogic
 from .core.waitlist_logic import WaitlistLogic
 from .core.feedback_logic import FeedbackLogic
@@ -18,12 +25,20 @@ from .core.email_logic import EmailLogic
 from .data_access.services.listing_service import ListingService
 from .data_access.services.plate_service import PlateService
 from .data_access.services.trip_service import TripService
+from .data_access.services.trip_aggregate_service import TripAggregateService
+from .data_access.services.driver_trip_service import DriverTripService
 from .data_access.services.vehicle_service import VehicleService
 from .data_access.services.waitlist_service import WaitlistService
 from .data_access.services.feedback_service import FeedbackService
 from .data_access.services.payment_service import PaymentService
 from .data_access.services.email_service import EmailService
 from .data_access.services.password_reset_service import PasswordResetService
+from .data_access.services.analytics_job_service import AnalyticsJobService
+from .data_access.store.local_trip_store import get_local_trip_store
+from .data_access.store.snapshot_store import get_snapshot_store
+from .data_access.store.vector_tiles import get_tile_store
+from .data_access.store.zone_geometry import get_zone_geometry_store
+from .data_access.store.zone_index import get_zone_index
 
 
 # Database dependency
@@ -63,8 +78,15 @@ async def get_plate_service(db: DB) -> PlateService:
     return PlateService(db)
 
 
-async def get_trip_service() -> TripService:
-    return TripService()
+async def get_trip_service(settings: Annotated[Settings, Depends(get_settings)]) -> TripService:
+    aggregates = None
+    if settings.trip_aggregates_in_mongo:
+        aggregates = TripAggregateService(get_client().get_database(settings.mongodb_db_name))
+    return TripService(get_local_trip_store(), aggregates)
+
+
+async def get_driver_trip_service(db: DB) -> DriverTripService:
+    return DriverTripService(db)
 
 
 async def get_user_service(db: DB) -> UserService:
@@ -117,6 +139,55 @@ async def get_trips_logic(
     return TripsLogic(trip_service)
 
 
+async def get_earnings_logic(
+    trip_service: Annotated[TripService, Depends(get_trip_service)]
+) -> EarningsLogic:
+    return EarningsLogic(trip_service)
+
+
+async def get_driver_trips_logic(
+    driver_trip_service: Annotated[DriverTripService, Depends(get_driver_trip_service)]
+) -> DriverTripsLogic:
+    return DriverTripsLogic(driver_trip_service)
+
+
+async def get_driver_benchmark_logic(
+    driver_trip_service: Annotated[DriverTripService, Depends(get_driver_trip_service)],
+    trip_service: Annotated[TripService, Depends(get_trip_service)]
+) -> DriverBenchmarkLogic:
+    return DriverBenchmarkLogic(driver_trip_service, trip_service)
+
+
+async def get_snapshot_logic(
+    trips_logic: Annotated[TripsLogic, Depends(get_trips_logic)],
+    earnings_logic: Annotated[EarningsLogic, Depends(get_earnings_logic)]
+) -> SnapshotLogic:
+    return SnapshotLogic(trips_logic, earnings_logic, get_local_trip_store(), get_snapshot_store())
+
+
+async def get_zones_logic() -> ZonesLogic:
+    return ZonesLogic(get_zone_geometry_store(), get_zone_index())
+
+
+async def get_tiles_logic(
+    snapshot_logic: Annotated[SnapshotLogic, Depends(get_snapshot_logic)]
+) -> TilesLogic:
+    return TilesLogic(snapshot_logic, get_tile_store(), get_tile_cache(), get_zone_values_cache())
+
+
+@lru_cache()
+def get_analytics_jobs() -> AnalyticsJobs:
+    settings = get_settings()
+
+    async def logic_factory():
+        trip_service = await get_trip_service(settings)
+        return TripsLogic(trip_service), EarningsLogic(trip_service)
+
+    service = AnalyticsJobService(get_client().get_database(settings.mongodb_db_name))
+    return AnalyticsJobs(service, logic_factory, settings.analytics_job_workers, settings.analytics_job_queue_size,
+                         settings.analytics_job_result_ttl_seconds)
+
+
 async def get_feedback_logic(
     feedback_service: Annotated[FeedbackService, Depends(get_feedback_service)]
 ) -> FeedbackLogic:
@@ -159,6 +230,13 @@ ListingsLogicDep = Annotated[ListingsLogic, Depends(get_listings_logic)]
 VehiclesLogicDep = Annotated[VehiclesLogic, Depends(get_vehicles_logic)]
 PlatesLogicDep = Annotated[PlatesLogic, Depends(get_plates_logic)]
 TripsLogicDep = Annotated[TripsLogic, Depends(get_trips_logic)]
+EarningsLogicDep = Annotated[EarningsLogic, Depends(get_earnings_logic)]
+SnapshotLogicDep = Annotated[SnapshotLogic, Depends(get_snapshot_logic)]
+ZonesLogicDep = Annotated[ZonesLogic, Depends(get_zones_logic)]
+TilesLogicDep = Annotated[TilesLogic, Depends(get_tiles_logic)]
+DriverTripsLogicDep = Annotated[DriverTripsLogic, Depends(get_driver_trips_logic)]
+DriverBenchmarkLogicDep = Annotated[DriverBenchmarkLogic, Depends(get_driver_benchmark_logic)]
+AnalyticsJobsDep = Annotated[AnalyticsJobs, Depends(get_analytics_jobs)]
 UsersLogicDep = Annotated[UsersLogic, Depends(get_users_logic)]
 WaitlistLogicDep = Annotated[WaitlistLogic, Depends(get_waitlist_logic)]
 FeedbackLogicDep = Annotated[FeedbackLogic, Depends(get_feedback_logic)]
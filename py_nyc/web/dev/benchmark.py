@@ -0,0 +1,292 @@
+"""
+Benchmarks of the trip query paths over 1 day, 1 month and 1 year of trips.
+
+Each scenario reports latency percentiles, rows/sec (input trips covered per
+second) and peak traced memory. Results are written as JSON so runs can be
+compared against a stored baseline.
+
+Data sources:
+  synthetic  generated trips, ingested into a temporary local store and served
+             to the SODA paths by an in-process stand-in (default)
+  recorded   the configured local trip store and NYC_OPEN_DATA_BASE_URL, e.g. a
+             stand-in serving recorded fixtures
+
+Usage:
+    python -m py_nyc.web.dev.benchmark --output benchmarks/baselines/main.json
+    python -m py_nyc.web.dev.benchmark --compare benchmarks/baselines/main.json --max-regression 0.2
+    python -m py_nyc.web.dev.benchmark --source recorded --start 2023-01-01 --sizes day month
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+SIZES = {"day": 1, "month": 31, "year": 365}
+
+
+class Scenario:
+    """A benchmarked call. `fn` takes no arguments and may return a coroutine, which is then awaited."""
+
+    def __init__(self, name: str, size: str, rows: int, fn: Callable, setup: Optional[Callable] = None):
+        self.name = name
+        self.size = size
+        self.rows = rows
+        self.fn = fn
+        self.setup = setup
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+
+def _call(fn: Callable):
+    result = fn()
+    return asyncio.run(result) if asyncio.iscoroutine(result) else result
+
+
+def measure(scenario: Scenario, repeat: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        if scenario.setup:
+            scenario.setup()
+        _call(scenario.fn)
+
+    timings = []
+    for _ in range(repeat):
+        if scenario.setup:
+            scenario.setup()
+        started = time.perf_counter()
+        _call(scenario.fn)
+        timings.append(time.perf_counter() - started)
+
+    # Memory is traced in a separate run, tracing slows allocations down too much to time them
+    if scenario.setup:
+        scenario.setup()
+    tracemalloc.start()
+    _call(scenario.fn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings_ms = np.array(timings) * 1000
+    return {
+        "size": scenario.size,
+        "rows": scenario.rows,
+        "repeat": repeat,
+        "p50_ms": round(float(np.percentile(timings_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(timings_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(timings_ms, 99)), 3),
+        "mean_ms": round(statistics.fmean(timings_ms), 3),
+        "rows_per_sec": round(scenario.rows / statistics.median(timings)) if scenario.rows else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: float) -> List[str]:
+    """Print p50 changes against a baseline and return the scenarios slower than allowed."""
+    regressions = []
+    print(f"\n{'scenario':<40} {'baseline p50':>14} {'p50':>10} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:<40} {'-':>14} {result['p50_ms']:>10.2f}")
+            continue
+        before, after = baseline[key]["p50_ms"], result["p50_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = " !" if change > max_regression else ""
+        print(f"{key:<40} {before:>14.2f} {after:>10.2f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_standin(samples_dir: Path, fixtures_dir: Path) -> str:
+    """Serve synthetic samples with the SODA stand-in on a background thread, returns its base URL."""
+    import uvicorn
+    from py_nyc.web.dev.soda_standin import SodaStandIn, create_app
+
+    port = _free_port()
+    standin = SodaStandIn(str(fixtures_dir), str(samples_dir))
+    server = uvicorn.Server(uvicorn.Config(create_app(standin), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_scenarios(start: datetime, sizes: List[str], source: str, rows_per_day: int,
+                    soda_rows_per_day: int, work_dir: Path) -> List[Scenario]:
+    # Settings are cached on first use, so the environment has to be in place before these imports run any code
+    from py_nyc.web.core.earnings_logic import EarningsLogic
+    from py_nyc.web.core.geodata_logic import GeoDataLogic
+    from py_nyc.web.core.ingestion_logic import IngestionLogic
+    from py_nyc.web.core.trips_logic import TripsLogic
+    from py_nyc.web.data_access.services.trip_service import TripService, get_source_cache
+    from py_nyc.web.core.config import get_settings
+    from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, months_between, next_month
+    from py_nyc.web.data_access.store.shared_arrays import SharedArrays
+    from py_nyc.web.dev.synthetic_trips import synthetic_trip_columns, to_soda_records
+    from py_nyc.web.external.tlc_datasets import HVFHV
+
+    # Aggregates are shared from the work directory, not /dev/shm: nothing outlives the run, and cold
+    # scenarios are not served from what an API process (or an earlier run) published
+    shared = SharedArrays(work_dir / "shared")
+    if source == "synthetic":
+        store = LocalTripStore(work_dir / "trip_store", shared=shared)
+        days = max(SIZES[size] for size in sizes)
+        columns = synthetic_trip_columns(start, days, rows_per_day)
+        pickups = columns["pickup_datetime"]
+        ingestion_logic = IngestionLogic(store)
+        for month in months_between(start, start + timedelta(days=days)):
+            in_month = (pickups >= np.datetime64(month, "s")) & (pickups < np.datetime64(next_month(month), "s"))
+            ingestion_logic.ingest_columns(HVFHV, month, columns.take(in_month))
+
+        # The SoQL evaluator of the stand-in is pure python, so SODA paths get a thinner sample
+        samples_dir = work_dir / "soda" / "samples"
+        samples_dir.mkdir(parents=True)
+        sample = synthetic_trip_columns(start, days, soda_rows_per_day, seed=1)
+        (samples_dir / f"{HVFHV.dataset_id}.json").write_text(json.dumps(to_soda_records(sample)))
+        os.environ["NYC_OPEN_DATA_BASE_URL"] = start_standin(samples_dir, work_dir / "soda" / "fixtures")
+        soda_rows = lambda size: SIZES[size] * soda_rows_per_day
+    else:
+        store = LocalTripStore(get_settings().trip_store_dir, shared=shared)
+        soda_rows = lambda size: 0
+
+    trip_service = TripService(store)
+    trips_logic = TripsLogic(trip_service)
+    geodata_logic = GeoDataLogic(trip_service)
+    earnings_logic = EarningsLogic(trip_service)
+    clear_query_cache = lambda: get_source_cache(HVFHV.key).clear()
+
+    def clear_store_cache():
+        store._aggregates.clear()
+        shutil.rmtree(shared.root, ignore_errors=True)
+
+    scenarios = []
+    for size in sizes:
+        end = start + timedelta(days=SIZES[size])
+        middle = start + (end - start) / 2
+        windows = [(start, end), (start, middle), (middle, end)]
+        cube = store.load_cube(HVFHV.key, start, end)
+        rows = int(cube["pickups"][cube.hour_mask(start, end)].sum()) if cube is not None else 0
+
+        scenarios += [
+            Scenario("trips_logic.get_density", size, soda_rows(size),
+                     lambda end=end: trips_logic.get_density(start, end, 8, 20), setup=clear_query_cache),
+            Scenario("trips_logic.get_density.cached", size, soda_rows(size),
+                     lambda end=end: trips_logic.get_density(start, end, 8, 20)),
+            Scenario("geodata_logic.get_density_within", size, soda_rows(size),
+                     lambda end=end: geodata_logic.get_density_within(start, end), setup=clear_query_cache),
+            Scenario("earnings_logic.get_earnings", size, soda_rows(size),
+                     lambda end=end: earnings_logic.get_earnings(start, end), setup=clear_query_cache),
+            Scenario("store.load_cube.cold", size, rows,
+                     lambda end=end: store.load_cube(HVFHV.key, start, end), setup=clear_store_cache),
+            Scenario("store.load_cube.warm", size, rows,
+                     lambda end=end: store.load_cube(HVFHV.key, start, end)),
+            Scenario("store.scan_columns", size, rows,
+                     lambda end=end: [store.scan_columns(HVFHV.key, month, start, end, ["pulocationid", "driver_pay"])
+                                      for month in months_between(start, end)]),
+            Scenario("trip_service.get_density_windows", size, rows,
+                     lambda windows=windows: trip_service.get_density_windows(windows, 8, 20)),
+        ]
+        if cube is not None:
+            scenarios += [
+                Scenario("trip_cube.density", size, rows,
+                         lambda cube=cube, end=end: cube.density(start, end, 8, 20)),
+                Scenario("trip_cube.density_windows", size, rows,
+                         lambda cube=cube, windows=windows: cube.density_windows(windows, 8, 20)),
+            ]
+
+    if store.months(HVFHV.key):
+        scenarios.append(Scenario("store.load_stats.zone_profile", "all", 0,
+                                  lambda: store.load_stats(HVFHV.key).zone_profile, setup=clear_store_cache))
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trip query paths.")
+    parser.add_argument("--source", choices=["synthetic", "recorded"], default="synthetic")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--start", default="2023-01-01", help="First day of every benchmarked range (YYYY-MM-DD)")
+    parser.add_argument("--rows-per-day", type=int, default=20000, help="Synthetic trips per day in the local store")
+    parser.add_argument("--soda-rows-per-day", type=int, default=200, help="Synthetic trips per day behind SODA")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", help="Run only scenarios whose name contains this text")
+    parser.add_argument("--output", help="Write results as JSON to this file, e.g. benchmarks/baselines/main.json")
+    parser.add_argument("--compare", help="Baseline JSON to compare the results with")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Fail when a p50 latency grows by more than this fraction of the baseline")
+    args = parser.parse_args()
+
+    from py_nyc.web.core.config import load_env_file
+    load_env_file()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    with tempfile.TemporaryDirectory(prefix="py_nyc_bench_") as work_dir:
+        scenarios = build_scenarios(start, args.sizes, args.source, args.rows_per_day,
+                                    args.soda_rows_per_day, Path(work_dir))
+
+        results = {}
+        for scenario in scenarios:
+            if args.only and args.only not in scenario.name:
+                continue
+            results[scenario.key] = measure(scenario, args.repeat, args.warmup)
+            result = results[scenario.key]
+            print(f"[Bench] {scenario.key:<48} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                  f"peak {result['peak_memory_bytes'] / 2**20:>7.1f}MiB")
+
+    report = {
+        "meta": {
+            "source": args.source,
+            "start": args.start,
+            "rows_per_day": args.rows_per_day if args.source == "synthetic" else None,
+            "soda_rows_per_day": args.soda_rows_per_day if args.source == "synthetic" else None,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"[Bench] Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["results"]
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"[Bench] {len(regressions)} scenario(s) regressed by more than {args.max_regression:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Local stand-in for the Socrata (SODA) API, for benchmarks and load tests that
+must not hit data.cityofnewyork.us.
+
+Requests to /resource/{dataset_id}.json are answered, in order, from:
+  1. a recorded fixture: {fixtures}/{dataset_id}/{request hash}.json
+  2. a local sample: {samples}/{dataset_id}.json or .jsonl, evaluated with a SoQL subset
+  3. the upstream API when --record is set, saving the response as a new fixture
+
+Point the app at it with NYC_OPEN_DATA_BASE_URL=http://localhost:8010.
+
+Usage:
+    python -m py_nyc.web.dev.soda_standin --port 8010 --latency-ms 200 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+import requests
+import uvicorn
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from py_nyc.web.dev.soql import SoQLError, SoQLQuery
+
+SOQL_PARAMS = ["$query", "$select", "$where", "$group", "$order", "$limit", "$offset"]
+
+
+def request_key(dataset_id: str, params: Dict[str, str]) -> str:
+    """Stable hash of a SODA request, ignoring whitespace differences in the SoQL."""
+    soql = {name: " ".join(str(params[name]).split()) for name in SOQL_PARAMS if name in params}
+    payload = json.dumps({"dataset": dataset_id, "params": soql}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+class SodaStandIn:
+    def __init__(self, fixtures_dir: str, samples_dir: str, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, error_status: int = 503, upstream: Optional[str] = None,
+                 app_token: Optional[str] = None, seed: Optional[int] = None):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.samples_dir = Path(samples_dir)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.upstream = upstream
+        self.app_token = app_token
+        self.random = random.Random(seed)
+        self.load_sample = lru_cache()(self._load_sample)
+
+    def fixture_path(self, dataset_id: str, params: Dict[str, str]) -> Path:
+        return self.fixtures_dir / dataset_id / f"{request_key(dataset_id, params)}.json"
+
+    def _load_sample(self, dataset_id: str) -> Optional[List[dict]]:
+        path = self.samples_dir / f"{dataset_id}.json"
+        if path.is_file():
+            rows = json.loads(path.read_text())
+        elif path.with_suffix(".jsonl").is_file():
+            rows = [json.loads(line) for line in path.with_suffix(".jsonl").read_text().splitlines() if line.strip()]
+        else:
+            return None
+
+        for index, row in enumerate(rows):
+            row.setdefault(":id", str(index))
+        return rows
+
+    def record(self, dataset_id: str, params: Dict[str, str]) -> List[dict]:
+        headers = {"X-App-Token": self.app_token} if self.app_token else {}
+        resp = requests.get(f"{self.upstream}/resource/{dataset_id}.json", params=params, headers=headers, timeout=300)
+        resp.raise_for_status()
+        rows = resp.json()
+
+        path = self.fixture_path(dataset_id, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"request": {"dataset": dataset_id, "params": params}, "response": rows}))
+        return rows
+
+    def answer(self, dataset_id: str, params: Dict[str, str]) -> Optional[List[dict]]:
+        fixture = self.fixture_path(dataset_id, params)
+        if fixture.is_file():
+            return json.loads(fixture.read_text())["response"]
+
+        sample = self.load_sample(dataset_id)
+        if sample is not None:
+            return SoQLQuery.from_params(params).execute(sample)
+
+        if self.upstream:
+            return self.record(dataset_id, params)
+        return None
+
+    async def inject_faults(self) -> Optional[JSONResponse]:
+        delay_ms = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            return JSONResponse(status_code=self.error_status, content={
+                "code": "injected_error", "error": True, "message": "Error injected by the SODA stand-in"})
+        return None
+
+
+def create_app(standin: SodaStandIn) -> FastAPI:
+    app = FastAPI(title="SODA stand-in")
+
+    @app.get("/resource/{dataset_id}.json")
+    async def get_resource(dataset_id: str, request: Request):
+        fault = await standin.inject_faults()
+        if fault is not None:
+            return fault
+
+        params = dict(request.query_params)
+        try:
+            rows = await asyncio.to_thread(standin.answer, dataset_id, params)
+        except SoQLError as e:
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={
+                "code": "query.compiler.malformed", "error": True, "message": str(e)})
+
+        if rows is None:
+            return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={
+                "code": "not_found", "error": True,
+                "message": f"No fixture or sample for dataset {dataset_id}"})
+        return rows
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SODA-compatible stand-in server.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--fixtures", default="data/soda/fixtures", help="Directory of recorded responses")
+    parser.add_argument("--samples", default="data/soda/samples", help="Directory of local dataset samples")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fixed latency added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra latency, uniform in [0, jitter]")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="Status code of injected errors")
+    parser.add_argument("--record", action="store_true",
+                        help="Forward unknown requests upstream and save them as fixtures")
+    parser.add_argument("--upstream", default="https://data.cityofnewyork.us")
+    parser.add_argument("--seed", type=int, help="Seed for latency jitter and error injection")
+    args = parser.parse_args()
+
+    standin = SodaStandIn(
+        args.fixtures, args.samples, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+        upstream=args.upstream if args.record else None,
+        app_token=os.getenv("NYC_OPEN_DATA_APP_TOKEN"), seed=args.seed)
+    uvicorn.run(create_app(standin), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
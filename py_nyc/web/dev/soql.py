@@ -0,0 +1,463 @@
+"""
+A small SoQL evaluator for the SODA stand-in server.
+
+Supports the subset of SoQL the app uses: SELECT with aliases and
+COUNT/SUM/AVG/MIN/MAX, WHERE with comparisons, BETWEEN, IN, IS NULL,
+AND/OR/NOT and arithmetic, GROUP BY (columns or select aliases),
+ORDER BY, LIMIT and OFFSET, and the date_trunc_* / date_extract_*
+functions. Rows are dicts of strings, as SODA returns them.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_LIMIT = 1000
+
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+
+KEYWORDS = {"select", "where", "group", "by", "order", "limit", "offset", "as", "and", "or", "not",
+            "between", "is", "null", "asc", "desc", "true", "false", "in", "having"}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^']|'')*')
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<ident>[:@]?[A-Za-z_][A-Za-z0-9_]*|`[^`]+`)
+      | (?P<op>>=|<=|!=|<>|=|<|>|\(|\)|,|\*|\+|-|/)
+    )""", re.VERBOSE)
+
+_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}")
+_NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+class SoQLError(Exception):
+    """Raised for queries outside the supported subset or malformed queries."""
+    pass
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise SoQLError(f"Unexpected input at: {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            tokens.append(("lit", value[1:-1].replace("''", "'")))
+        elif kind == "number":
+            tokens.append(("lit", float(value) if "." in value else int(value)))
+        elif kind == "ident" and value.lower() in KEYWORDS:
+            tokens.append(("kw", value.lower()))
+        elif kind == "ident":
+            tokens.append(("ident", value.strip("`")))
+        else:
+            tokens.append(("op", value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self, kind: str = None, value: Any = None) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        token_kind, token_value = self.tokens[self.pos]
+        return (kind is None or token_kind == kind) and (value is None or token_value == value)
+
+    def accept(self, kind: str, value: Any = None) -> Optional[Any]:
+        if self.peek(kind, value):
+            self.pos += 1
+            return self.tokens[self.pos - 1][1]
+        return None
+
+    def expect(self, kind: str, value: Any = None) -> Any:
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else "end of query"
+            raise SoQLError(f"Expected {value or kind}, found {found!r}")
+        return token
+
+    def done(self) -> bool:
+        return self.pos >= len(self.tokens)
+
+    # Clauses
+
+    def select_list(self) -> List[Tuple[tuple, Optional[str]]]:
+        items = []
+        while True:
+            expr = self.expression()
+            alias = self.expect("ident") if self.accept("kw", "as") else None
+            items.append((expr, alias))
+            if not self.accept("op", ","):
+                return items
+
+    def expression_list(self) -> List[tuple]:
+        items = [self.expression()]
+        while self.accept("op", ","):
+            items.append(self.expression())
+        return items
+
+    def order_list(self) -> List[Tuple[tuple, bool]]:
+        items = []
+        while True:
+            expr = self.expression()
+            descending = bool(self.accept("kw", "desc"))
+            if not descending:
+                self.accept("kw", "asc")
+            items.append((expr, descending))
+            if not self.accept("op", ","):
+                return items
+
+    # Expressions, lowest precedence first
+
+    def expression(self) -> tuple:
+        left = self.conjunction()
+        while self.accept("kw", "or"):
+            left = ("or", left, self.conjunction())
+        return left
+
+    def conjunction(self) -> tuple:
+        left = self.negation()
+        while self.accept("kw", "and"):
+            left = ("and", left, self.negation())
+        return left
+
+    def negation(self) -> tuple:
+        if self.accept("kw", "not"):
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self) -> tuple:
+        left = self.additive()
+        if self.accept("kw", "between"):
+            low = self.additive()
+            self.expect("kw", "and")
+            return ("between", left, low, self.additive())
+        if self.accept("kw", "is"):
+            negate = bool(self.accept("kw", "not"))
+            self.expect("kw", "null")
+            return ("isnull", left, negate)
+        negate_in = self.peek("kw", "not") and self.tokens[self.pos + 1:self.pos + 2] == [("kw", "in")]
+        if negate_in:
+            self.pos += 1
+        if self.accept("kw", "in"):
+            self.expect("op", "(")
+            items = self.expression_list()
+            self.expect("op", ")")
+            node = ("in", left, items)
+            return ("not", node) if negate_in else node
+        for op in [">=", "<=", "!=", "<>", "=", "<", ">"]:
+            if self.accept("op", op):
+                return ("cmp", "!=" if op == "<>" else op, left, self.additive())
+        return left
+
+    def additive(self) -> tuple:
+        left = self.multiplicative()
+        while self.peek("op", "+") or self.peek("op", "-"):
+            op = self.expect("op")
+            left = ("arith", op, left, self.multiplicative())
+        return left
+
+    def multiplicative(self) -> tuple:
+        left = self.unary()
+        while self.peek("op", "*") or self.peek("op", "/"):
+            op = self.expect("op")
+            left = ("arith", op, left, self.unary())
+        return left
+
+    def unary(self) -> tuple:
+        if self.accept("op", "-"):
+            return ("arith", "-", ("lit", 0), self.unary())
+        return self.primary()
+
+    def primary(self) -> tuple:
+        if self.accept("op", "("):
+            expr = self.expression()
+            self.expect("op", ")")
+            return expr
+        if self.accept("op", "*"):
+            return ("star",)
+        if self.peek("lit"):
+            return ("lit", self.expect("lit"))
+        if self.accept("kw", "null"):
+            return ("lit", None)
+        if self.accept("kw", "true"):
+            return ("lit", True)
+        if self.accept("kw", "false"):
+            return ("lit", False)
+
+        name = self.expect("ident")
+        if self.accept("op", "("):
+            args = [] if self.peek("op", ")") else self.expression_list()
+            self.expect("op", ")")
+            return ("call", name.lower(), args)
+        return ("col", name)
+
+
+class SoQLQuery:
+    """A parsed SoQL query, built from a full $query string or the individual $ parameters."""
+
+    def __init__(self, select, where=None, group=None, order=None, limit=DEFAULT_LIMIT, offset=0):
+        self.select = select
+        self.where = where
+        self.order = order or []
+        self.limit = limit
+        self.offset = offset
+
+        # GROUP BY may name select aliases
+        aliases = {alias: expr for expr, alias in select if alias}
+        self.group = [aliases.get(expr[1], expr) if expr[0] == "col" else expr for expr in (group or [])]
+
+    @classmethod
+    def parse(cls, query: str) -> "SoQLQuery":
+        parser = _Parser(query)
+        parser.expect("kw", "select")
+        clauses = {"select": parser.select_list(), "limit": DEFAULT_LIMIT, "offset": 0}
+
+        while not parser.done():
+            if parser.accept("kw", "where"):
+                clauses["where"] = parser.expression()
+            elif parser.accept("kw", "group"):
+                parser.expect("kw", "by")
+                clauses["group"] = parser.expression_list()
+            elif parser.accept("kw", "order"):
+                parser.expect("kw", "by")
+                clauses["order"] = parser.order_list()
+            elif parser.accept("kw", "limit"):
+                clauses["limit"] = int(parser.expect("lit"))
+            elif parser.accept("kw", "offset"):
+                clauses["offset"] = int(parser.expect("lit"))
+            else:
+                raise SoQLError(f"Unsupported clause at {parser.tokens[parser.pos][1]!r}")
+
+        return cls(**clauses)
+
+    @classmethod
+    def from_params(cls, params: Dict[str, str]) -> "SoQLQuery":
+        if params.get("$query"):
+            return cls.parse(params["$query"])
+
+        def parse_with(text: Optional[str], method: str):
+            if not text:
+                return None
+            parser = _Parser(text)
+            result = getattr(parser, method)()
+            if not parser.done():
+                raise SoQLError(f"Unexpected input in {text!r}")
+            return result
+
+        return cls(
+            select=parse_with(params.get("$select"), "select_list") or [(("star",), None)],
+            where=parse_with(params.get("$where"), "expression"),
+            group=parse_with(params.get("$group"), "expression_list"),
+            order=parse_with(params.get("$order"), "order_list"),
+            limit=int(params.get("$limit", DEFAULT_LIMIT)),
+            offset=int(params.get("$offset", 0)),
+        )
+
+    @property
+    def is_aggregate(self) -> bool:
+        return bool(self.group) or any(_has_aggregate(expr) for expr, _ in self.select)
+
+    def execute(self, rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        if self.where is not None:
+            rows = [row for row in rows if _evaluate(self.where, row) is True]
+
+        if self.is_aggregate:
+            groups: Dict[tuple, List[dict]] = {}
+            for row in rows:
+                key = tuple(_sort_key(_evaluate(expr, row)) for expr in self.group)
+                groups.setdefault(key, []).append(row)
+            if not self.group and not groups:
+                groups[()] = []
+            results = [(self._project(group_rows, _evaluate_group), group_rows) for group_rows in groups.values()]
+            order_value = _evaluate_group
+        else:
+            results = [(self._project(row, _evaluate), row) for row in rows]
+            order_value = _evaluate
+
+        # Stable sorts from the last ORDER BY item to the first
+        for expr, descending in reversed(self.order):
+            def key(result, expr=expr):
+                output, source = result
+                is_source_column = isinstance(source, dict) and expr[0] == "col" and expr[1] in source
+                if expr[0] == "col" and expr[1] in output and not is_source_column:
+                    return _sort_key(output[expr[1]])  # select alias
+                return _sort_key(order_value(expr, source))
+            results.sort(key=key, reverse=descending)
+
+        return [output for output, _ in results[self.offset:self.offset + self.limit]]
+
+    def _project(self, source, evaluate) -> Dict[str, str]:
+        output = {}
+        for expr, alias in self.select:
+            if expr[0] == "star":
+                if isinstance(source, dict):
+                    output.update({k: v for k, v in source.items() if not k.startswith(":")})
+                continue
+            value = evaluate(expr, source)
+            if value is not None:
+                output[alias or _default_alias(expr)] = _format_value(value)
+        return output
+
+
+def _default_alias(expr: tuple) -> str:
+    if expr[0] == "col":
+        return expr[1]
+    if expr[0] == "call":
+        args = [arg[1] if arg[0] == "col" else "" for arg in expr[2]]
+        return "_".join([expr[1]] + [arg for arg in args if arg])
+    return "expr"
+
+
+def _has_aggregate(expr: tuple) -> bool:
+    if expr[0] == "call" and expr[1] in AGGREGATES:
+        return True
+    return any(_has_aggregate(part) for part in expr[1:] if isinstance(part, tuple)) or \
+        any(_has_aggregate(arg) for part in expr[1:] if isinstance(part, list) for arg in part)
+
+
+# Values
+
+def _parse_value(value: Any) -> Any:
+    """Interpret a SODA string as a number or timestamp where it looks like one."""
+    if not isinstance(value, str):
+        return value
+    if _NUMBER_RE.match(value):
+        return float(value) if "." in value else int(value)
+    if _DATETIME_RE.match(value):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S.000")
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.10f}".rstrip("0")
+    return str(value)
+
+
+def _sort_key(value: Any) -> tuple:
+    value = _parse_value(value)
+    if value is None:
+        return (1, 0, "")
+    if isinstance(value, (int, float)):
+        return (0, 0, value)
+    if isinstance(value, datetime):
+        return (0, 1, value.isoformat())
+    return (0, 2, str(value))
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    value = _parse_value(value)
+    return value if isinstance(value, datetime) else None
+
+
+def _to_number(value: Any) -> Optional[float]:
+    value = _parse_value(value)
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _compare(op: str, left: Any, right: Any) -> Optional[bool]:
+    left, right = _parse_value(left), _parse_value(right)
+    if left is None or right is None:
+        return None
+    if isinstance(left, datetime) != isinstance(right, datetime) or \
+            isinstance(left, (int, float)) != isinstance(right, (int, float)):
+        left, right = str(left), str(right)
+    try:
+        return {"=": left == right, "!=": left != right, "<": left < right,
+                "<=": left <= right, ">": left > right, ">=": left >= right}[op]
+    except TypeError:
+        return None
+
+
+def _scalar_function(name: str, args: List[Any]) -> Any:
+    if name.startswith("date_trunc_") or name.startswith("date_extract_"):
+        ts = _to_datetime(args[0])
+        if ts is None:
+            return None
+        part = name.rsplit("_", 1)[1]
+        if name.startswith("date_trunc_"):
+            return {"ymd": ts.replace(hour=0, minute=0, second=0, microsecond=0),
+                    "ym": ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+                    "y": ts.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)}[part]
+        return {"y": ts.year, "m": ts.month, "d": ts.day, "hh": ts.hour, "mm": ts.minute,
+                "ss": ts.second, "dow": (ts.weekday() + 1) % 7, "woy": ts.isocalendar()[1]}[part]
+    if name in ("upper", "lower"):
+        return None if args[0] is None else getattr(str(args[0]), name)()
+    raise SoQLError(f"Unsupported function {name}()")
+
+
+def _evaluate(expr: tuple, row: Dict[str, str]) -> Any:
+    kind = expr[0]
+    if kind == "lit":
+        return expr[1]
+    if kind == "col":
+        return row.get(expr[1])
+    if kind == "and":
+        left, right = _evaluate(expr[1], row), _evaluate(expr[2], row)
+        return False if left is False or right is False else (None if left is None or right is None else True)
+    if kind == "or":
+        left, right = _evaluate(expr[1], row), _evaluate(expr[2], row)
+        return True if left is True or right is True else (None if left is None or right is None else False)
+    if kind == "not":
+        value = _evaluate(expr[1], row)
+        return None if value is None else not value
+    if kind == "cmp":
+        return _compare(expr[1], _evaluate(expr[2], row), _evaluate(expr[3], row))
+    if kind == "between":
+        value = _evaluate(expr[1], row)
+        low, high = _compare(">=", value, _evaluate(expr[2], row)), _compare("<=", value, _evaluate(expr[3], row))
+        return None if low is None or high is None else low and high
+    if kind == "isnull":
+        return (_evaluate(expr[1], row) is None) != expr[2]
+    if kind == "in":
+        value = _evaluate(expr[1], row)
+        return any(_compare("=", value, _evaluate(item, row)) for item in expr[2])
+    if kind == "arith":
+        left, right = _to_number(_evaluate(expr[2], row)), _to_number(_evaluate(expr[3], row))
+        if left is None or right is None or (expr[1] == "/" and right == 0):
+            return None
+        return {"+": left + right, "-": left - right, "*": left * right, "/": left / right if right else None}[expr[1]]
+    if kind == "call":
+        if expr[1] in AGGREGATES:
+            raise SoQLError(f"{expr[1]}() is only allowed in SELECT or ORDER BY")
+        return _scalar_function(expr[1], [_evaluate(arg, row) for arg in expr[2]])
+    raise SoQLError(f"Unsupported expression {kind}")
+
+
+def _evaluate_group(expr: tuple, rows: List[Dict[str, str]]) -> Any:
+    kind = expr[0]
+    if kind == "call" and expr[1] in AGGREGATES:
+        arg = expr[2][0] if expr[2] else ("star",)
+        if expr[1] == "count":
+            return len(rows) if arg[0] == "star" else sum(_evaluate(arg, row) is not None for row in rows)
+
+        values = [_parse_value(_evaluate(arg, row)) for row in rows]
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        if expr[1] in ("min", "max"):
+            return min(values, key=_sort_key) if expr[1] == "min" else max(values, key=_sort_key)
+        numbers = [float(value) for value in values if isinstance(value, (int, float))]
+        total = sum(numbers)
+        return total if expr[1] == "sum" else total / len(numbers) if numbers else None
+
+    if kind in ("arith", "cmp"):
+        left, right = _evaluate_group(expr[2], rows), _evaluate_group(expr[3], rows)
+        return _evaluate((kind, expr[1], ("lit", left), ("lit", right)), {})
+    if kind == "call":
+        return _scalar_function(expr[1], [_evaluate_group(arg, rows) for arg in expr[2]])
+    return _evaluate(expr, rows[0]) if rows else None
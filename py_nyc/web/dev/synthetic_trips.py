@@ -0,0 +1,73 @@
+"""
+Synthetic HVFHV-like trips for benchmarks and the SODA stand-in.
+
+Demand follows a daily profile with morning and evening peaks and a skewed
+zone popularity, so aggregates look roughly like the real data.
+"""
+from datetime import datetime
+from typing import List
+import numpy as np
+from py_nyc.web.data_access.store.trip_columns import TripColumns
+
+# Relative demand by hour of day
+HOURLY_PROFILE = np.array([3, 2, 1.5, 1, 1, 1.5, 3, 5, 6, 5, 4.5, 4.5,
+                           5, 5, 5, 5.5, 6, 6.5, 7, 7, 6.5, 6, 5, 4])
+
+
+def synthetic_trip_columns(start: datetime, days: int, rows_per_day: int, seed: int = 0) -> TripColumns:
+    rng = np.random.default_rng(seed)
+    n = days * rows_per_day
+
+    day = rng.integers(0, days, n)
+    hour = rng.choice(24, n, p=HOURLY_PROFILE / HOURLY_PROFILE.sum())
+    offset_s = day * 86400 + hour * 3600 + rng.integers(0, 3600, n)
+    request = np.datetime64(start, "s") + np.sort(offset_s).astype("timedelta64[s]")
+
+    wait_s = rng.gamma(2.0, 150.0, n).astype(np.int64)
+    trip_s = np.clip(rng.lognormal(7.0, 0.5, n), 60, 4 * 3600).astype(np.int64)
+    speed_mph = np.clip(rng.normal(14, 5, n), 2, 55)
+    miles = (speed_mph * trip_s / 3600).astype(np.float32)
+
+    zone_weights = 1 / np.arange(1, 266) ** 0.8
+    zone_ids = rng.permutation(np.arange(1, 266))
+    pickup_zone = rng.choice(zone_ids, n, p=zone_weights / zone_weights.sum())
+    dropoff_zone = rng.choice(zone_ids, n, p=zone_weights / zone_weights.sum())
+
+    pickup = request + wait_s.astype("timedelta64[s]")
+    fare = (2.5 + 1.75 * miles + 0.5 * trip_s / 60).astype(np.float32)
+    airport = np.isin(pickup_zone, [1, 132, 138])
+
+    return TripColumns({
+        "pickup_datetime": pickup,
+        "dropoff_datetime": pickup + trip_s.astype("timedelta64[s]"),
+        "request_datetime": request,
+        "on_scene_datetime": pickup - rng.integers(0, 120, n).astype("timedelta64[s]"),
+        "pulocationid": pickup_zone.astype(np.uint16),
+        "dolocationid": dropoff_zone.astype(np.uint16),
+        "trip_miles": miles,
+        "trip_time": trip_s.astype(np.float32),
+        "driver_pay": (fare * 0.72).astype(np.float32),
+        "base_passenger_fare": fare,
+        "tips": np.where(rng.random(n) < 0.2, fare * 0.15, 0).astype(np.float32),
+        "shared_request_flag": rng.random(n) < 0.05,
+        "wav_request_flag": rng.random(n) < 0.01,
+        "airport_fee": np.where(airport, 2.5, 0).astype(np.float32),
+    })
+
+
+def to_soda_records(columns: TripColumns) -> List[dict]:
+    """Format trips the way SODA returns them: strings, timestamps with milliseconds, Y/N flags."""
+    formatted = {}
+    for name in columns.names:
+        column = columns[name]
+        if column.dtype.kind == "M":
+            formatted[name] = np.datetime_as_string(column, unit="ms").tolist()
+        elif column.dtype.kind == "b":
+            formatted[name] = np.where(column, "Y", "N").tolist()
+        elif column.dtype.kind == "f":
+            formatted[name] = np.char.mod("%.2f", column).tolist()
+        else:
+            formatted[name] = column.astype(str).tolist()
+
+    names = list(formatted)
+    return [dict(zip(names, values)) for values in zip(*formatted.values())]
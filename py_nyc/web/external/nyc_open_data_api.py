@@ -1,30 +1,53 @@
 from datetime import datetime
-from typing import List
+from typing import Iterator, List, Optional
 from starlette import status
 import json
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from sodapy import Socrata
-from py_nyc.web.core.models import TripEarningSoQL
-from py_nyc.web.data_access.services.trip_service import TripDensity
+from py_nyc.web.core.models import TripDensity, TripEarningSoQL, TripFilters
 from py_nyc.web.core.config import get_settings
+from py_nyc.web.external.tlc_datasets import FLAG_COLUMNS, HVFHV, TlcDataset
 
-# TODO: Exploit @lru_cache(maxsize=20) for caching results
-def get_density_soda(from_date: datetime, to_date: datetime, start_hr: int, end_hr: int) -> List[TripDensity]:
+
+def _socrata_client() -> Socrata:
+    """Socrata client for the configured base URL (plain http is allowed for the local stand-in)."""
     settings = get_settings()  # Cached via @lru_cache
-    client = Socrata("data.cityofnewyork.us", settings.nyc_open_data_app_token, timeout=120)
+    base_url = urlsplit(settings.nyc_open_data_base_url)
+    session_adapter = {"prefix": "http://", "adapter": HTTPAdapter()} if base_url.scheme == "http" else None
+    return Socrata(base_url.netloc, settings.nyc_open_data_app_token, session_adapter=session_adapter, timeout=120)
+
+
+def _filter_clauses(filters: Optional[TripFilters], dataset: TlcDataset) -> str:
+    """SoQL conditions of the trip type filters, each prefixed with 'and'."""
+    clauses = ""
+    for flag, wanted in (filters.selected() if filters else {}).items():
+        column = dataset.column(FLAG_COLUMNS[flag])
+        flagged = f"{column} > 0" if flag == "airport" else f"{column} = 'Y'"
+        clauses += f" and {flagged}" if wanted else f" and ({column} IS NULL or not {flagged})"
+    return clauses
+
+
+def get_density_soda(from_date: datetime, to_date: datetime, start_hr: int, end_hr: int, filters: Optional[TripFilters] = None, dataset: TlcDataset = HVFHV) -> List[TripDensity]:
+    client = _socrata_client()
+    location_col = dataset.column("pulocationid")
+    datetime_col = dataset.density_datetime_column
     query = f"""
-        SELECT COUNT(pulocationid) AS density, pulocationid AS location_id 
-        WHERE request_datetime >= '{from_date.strftime('%Y-%m-%dT%H:%M:%S.000')}' and request_datetime < '{to_date.strftime('%Y-%m-%dT%H:%M:%S.000')}' and date_extract_hh(request_datetime) between {start_hr} and {end_hr} 
-        GROUP BY pulocationid"""
-    res = client.get('u253-aew4', query=query)
+        SELECT COUNT({location_col}) AS density, {location_col} AS location_id
+        WHERE {datetime_col} >= '{from_date.strftime('%Y-%m-%dT%H:%M:%S.000')}' and {datetime_col} < '{to_date.strftime('%Y-%m-%dT%H:%M:%S.000')}' and date_extract_hh({datetime_col}) between {start_hr} and {end_hr}{_filter_clauses(filters, dataset)}
+        GROUP BY {location_col}"""
+    res = client.get(dataset.dataset_id, query=query)
 
     return res
 
 
-def get_earnings_soda(start_date: datetime, end_date: datetime) -> List[TripEarningSoQL]:
+def get_earnings_soda(start_date: datetime, end_date: datetime, dataset: TlcDataset = HVFHV) -> List[TripEarningSoQL]:
     settings = get_settings()  # Cached via @lru_cache
-    baseUrl = "https://data.cityofnewyork.us/resource/u253-aew4.json"
-    query = f"SELECT date_trunc_ymd(pickup_datetime) AS pickup_date, date_extract_hh(pickup_datetime) AS pickup_hour, SUM(driver_pay) AS total_driver_pay, COUNT(*) AS trip_count WHERE pickup_datetime >= '{start_date.isoformat()}' AND pickup_datetime < '{end_date.isoformat()}' GROUP BY pickup_date, pickup_hour"
+    baseUrl = f"{settings.nyc_open_data_base_url}/resource/{dataset.dataset_id}.json"
+    pickup_col = dataset.column("pickup_datetime")
+    pay_col = dataset.column("driver_pay")
+    query = f"SELECT date_trunc_ymd({pickup_col}) AS pickup_date, date_extract_hh({pickup_col}) AS pickup_hour, SUM({pay_col}) AS total_driver_pay, COUNT(*) AS trip_count WHERE {pickup_col} >= '{start_date.isoformat()}' AND {pickup_col} < '{end_date.isoformat()}' GROUP BY pickup_date, pickup_hour"
     url = f"{baseUrl}?$query={query}"
     headers = {"X-App-Token": settings.nyc_open_data_app_token}
 
@@ -36,3 +59,26 @@ def get_earnings_soda(start_date: datetime, end_date: datetime) -> List[TripEarn
             f"Something went wrong. Status Code: {resp.status_code}. {data}")
 
     return json.loads(data)
+
+
+def iter_trip_records(dataset: TlcDataset, start_date: datetime, end_date: datetime, columns: List[str], page_size: int = 50000) -> Iterator[List[dict]]:
+    """
+    Pages through the raw trips picked up in [start_date, end_date), ordered by pickup time.
+    Records use logical column names; logical columns the dataset lacks are not selected.
+    """
+    client = _socrata_client()
+    pickup_col = dataset.column("pickup_datetime")
+    select = ", ".join(
+        dataset.columns[name] if dataset.columns[name] == name else f"{dataset.columns[name]} AS {name}"
+        for name in columns if dataset.has_column(name))
+    where = f"{pickup_col} >= '{start_date.strftime('%Y-%m-%dT%H:%M:%S.000')}' AND {pickup_col} < '{end_date.strftime('%Y-%m-%dT%H:%M:%S.000')}'"
+
+    offset = 0
+    while True:
+        page = client.get(dataset.dataset_id, select=select, where=where,
+                          order=f"{pickup_col}, :id", limit=page_size, offset=offset)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        offset += page_size
@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from py_nyc.web.core.config import get_settings
+
+
+class UnknownDatasetError(Exception):
+    """Raised when a dataset key is not registered or has no dataset id configured."""
+    pass
+
+
+class DatasetColumnError(Exception):
+    """Raised when a query needs a column the dataset does not publish."""
+    pass
+
+
+@dataclass(frozen=True)
+class TlcDataset:
+    """
+    A TLC trip record dataset published on NYC Open Data.
+
+    `columns` maps the logical column names used across the app
+    (see LOGICAL_COLUMNS) to the dataset's own column names. Logical
+    columns the dataset does not carry are left out.
+    """
+    key: str
+    name: str
+    dataset_id: Optional[str]
+    columns: Dict[str, str]
+
+    def column(self, logical_name: str) -> str:
+        """Dataset column for a logical column, raises DatasetColumnError if missing."""
+        try:
+            return self.columns[logical_name]
+        except KeyError:
+            raise DatasetColumnError(
+                f"Dataset '{self.key}' has no '{logical_name}' column")
+
+    def has_column(self, logical_name: str) -> bool:
+        return logical_name in self.columns
+
+    @property
+    def density_datetime_column(self) -> str:
+        """Density is bucketed by request time where the dataset records it."""
+        return self.columns.get("request_datetime", self.columns["pickup_datetime"])
+
+
+# Logical columns shared by every dataset schema below.
+LOGICAL_COLUMNS = [
+    "pickup_datetime",
+    "dropoff_datetime",
+    "request_datetime",
+    "on_scene_datetime",
+    "pulocationid",
+    "dolocationid",
+    "trip_miles",
+    "trip_time",
+    "driver_pay",
+    "base_passenger_fare",
+    "tips",
+    "shared_request_flag",
+    "wav_request_flag",
+    "airport_fee",
+    # Trips recorded before taxi zones carry coordinates instead, mapped to zone ids at ingestion
+    "pickup_longitude",
+    "pickup_latitude",
+    "dropoff_longitude",
+    "dropoff_latitude",
+]
+
+# Logical column each trip type filter (see core.models.TripFilters) is derived from
+FLAG_COLUMNS = {
+    "shared": "shared_request_flag",
+    "wav": "wav_request_flag",
+    "airport": "airport_fee",
+}
+
+HVFHV = TlcDataset(
+    key="hvfhv",
+    name="High Volume For-Hire Vehicle Trip Data",
+    dataset_id="u253-aew4",
+    columns={
+        "pickup_datetime": "pickup_datetime",
+        "dropoff_datetime": "dropoff_datetime",
+        "request_datetime": "request_datetime",
+        "on_scene_datetime": "on_scene_datetime",
+        "pulocationid": "pulocationid",
+        "dolocationid": "dolocationid",
+        "trip_miles": "trip_miles",
+        "trip_time": "trip_time",
+        "driver_pay": "driver_pay",
+        "base_passenger_fare": "base_passenger_fare",
+        "tips": "tips",
+        "shared_request_flag": "shared_request_flag",
+        "wav_request_flag": "wav_request_flag",
+        "airport_fee": "airport_fee",
+    }
+)
+
+YELLOW = TlcDataset(
+    key="yellow",
+    name="Yellow Taxi Trip Data",
+    dataset_id="4b4i-vvec",
+    columns={
+        "pickup_datetime": "tpep_pickup_datetime",
+        "dropoff_datetime": "tpep_dropoff_datetime",
+        "pulocationid": "pulocationid",
+        "dolocationid": "dolocationid",
+        "trip_miles": "trip_distance",
+        "base_passenger_fare": "fare_amount",
+        "tips": "tip_amount",
+        "airport_fee": "airport_fee",
+    }
+)
+
+GREEN = TlcDataset(
+    key="green",
+    name="Green Taxi Trip Data",
+    dataset_id="peba-ruvs",
+    columns={
+        "pickup_datetime": "lpep_pickup_datetime",
+        "dropoff_datetime": "lpep_dropoff_datetime",
+        "pulocationid": "pulocationid",
+        "dolocationid": "dolocationid",
+        "trip_miles": "trip_distance",
+        "base_passenger_fare": "fare_amount",
+        "tips": "tip_amount",
+    }
+)
+
+# The FHV dataset id changes every year, so it has to be configured through
+# NYC_OPEN_DATA_DATASET_IDS (e.g. "fhv=abcd-1234").
+FHV = TlcDataset(
+    key="fhv",
+    name="For-Hire Vehicle Trip Data",
+    dataset_id=None,
+    columns={
+        "pickup_datetime": "pickup_datetime",
+        "dropoff_datetime": "dropoff_datetime",
+        "pulocationid": "pulocationid",
+        "dolocationid": "dolocationid",
+    }
+)
+
+# Yellow taxi trips up to mid 2016 have GPS coordinates instead of zone ids. Each year is a
+# separate dataset, so the id of the year to ingest has to be configured like FHV's.
+YELLOW_LEGACY = TlcDataset(
+    key="yellow_legacy",
+    name="Yellow Taxi Trip Data (2009-2016)",
+    dataset_id=None,
+    columns={
+        "pickup_datetime": "tpep_pickup_datetime",
+        "dropoff_datetime": "tpep_dropoff_datetime",
+        "pickup_longitude": "pickup_longitude",
+        "pickup_latitude": "pickup_latitude",
+        "dropoff_longitude": "dropoff_longitude",
+        "dropoff_latitude": "dropoff_latitude",
+        "trip_miles": "trip_distance",
+        "base_passenger_fare": "fare_amount",
+        "tips": "tip_amount",
+    }
+)
+
+TLC_DATASETS: Dict[str, TlcDataset] = {
+    dataset.key: dataset for dataset in [HVFHV, YELLOW, GREEN, FHV, YELLOW_LEGACY]
+}
+
+DEFAULT_DATASET = HVFHV.key
+
+
+def get_dataset(key: str) -> TlcDataset:
+    """
+    Look up a registered dataset, applying any dataset id override from settings.
+    Raises UnknownDatasetError if the key is unknown or has no dataset id.
+    """
+    dataset = TLC_DATASETS.get(key)
+    if dataset is None:
+        raise UnknownDatasetError(
+            f"Unknown dataset '{key}'. Available: {', '.join(TLC_DATASETS)}")
+
+    override = get_settings().get_dataset_id_overrides().get(key)
+    if override:
+        dataset = TlcDataset(dataset.key, dataset.name, override, dataset.columns)
+
+    if dataset.dataset_id is None:
+        raise UnknownDatasetError(f"No dataset id configured for '{key}'")
+
+    return dataset
+
+
+def get_datasets(keys: List[str]) -> List[TlcDataset]:
+    """Resolve several dataset keys, dropping duplicates but keeping order."""
+    return [get_dataset(key) for key in dict.fromkeys(keys)]
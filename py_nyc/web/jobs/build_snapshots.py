@@ -0,0 +1,35 @@
+"""
+Precompute the preset density, earnings and zone profile responses of a dataset
+from the local trip store and publish them as a new snapshot version.
+Run after every ingestion; the API ignores snapshots built from other data.
+
+Usage:
+    python -m py_nyc.web.jobs.build_snapshots --dataset hvfhv
+"""
+import argparse
+import asyncio
+from py_nyc.web.core.config import load_env_file
+from py_nyc.web.core.earnings_logic import EarningsLogic
+from py_nyc.web.core.snapshot_logic import SnapshotLogic
+from py_nyc.web.core.trips_logic import TripsLogic
+from py_nyc.web.data_access.services.trip_service import TripService
+from py_nyc.web.data_access.store.local_trip_store import get_local_trip_store
+from py_nyc.web.data_access.store.snapshot_store import get_snapshot_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build static snapshots of the preset API responses.")
+    parser.add_argument("--dataset", default="hvfhv", help="Dataset key, e.g. hvfhv, yellow, green, fhv")
+    args = parser.parse_args()
+
+    load_env_file()
+
+    trip_service = TripService(get_local_trip_store())
+    snapshot_logic = SnapshotLogic(TripsLogic(trip_service), EarningsLogic(trip_service),
+                                   get_local_trip_store(), get_snapshot_store())
+    manifest = asyncio.run(snapshot_logic.build(args.dataset))
+    print(f"[Snapshot] Published {manifest['version']} with presets: {', '.join(manifest['presets'])}")
+
+
+if __name__ == "__main__":
+    main()
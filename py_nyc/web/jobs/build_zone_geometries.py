@@ -0,0 +1,35 @@
+"""
+Simplify the taxi zone boundaries at every level of detail served by /zones/geometry
+and write them gzip compressed to ZONE_GEOMETRY_DIR, with the matrix of zones sharing
+a border. Run again when the zone map changes.
+
+Usage:
+    python -m py_nyc.web.jobs.build_zone_geometries
+"""
+import argparse
+from py_nyc.web.core.config import load_env_file
+from py_nyc.web.data_access.store.taxi_zones import TAXI_ZONES_GEOJSON
+from py_nyc.web.data_access.store.zone_adjacency import ZoneAdjacency
+from py_nyc.web.data_access.store.zone_geometry import GEOMETRY_LEVELS, ZoneTopology, get_zone_geometry_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build simplified taxi zone geometries per zoom level.")
+    parser.add_argument("--geojson", default=str(TAXI_ZONES_GEOJSON), help="Full detail taxi zone GeoJSON")
+    args = parser.parse_args()
+
+    load_env_file()
+
+    topology = ZoneTopology.from_geojson(args.geojson)
+    store = get_zone_geometry_store()
+    for level in GEOMETRY_LEVELS:
+        content = store.write(level, topology.simplified(level))
+        print(f"[Zones] {level.name} (zoom <= {level.max_zoom}): {len(content) / 1024:.0f} KiB compressed")
+
+    adjacency = ZoneAdjacency.from_topology(topology)
+    store.write_adjacency(adjacency.to_npz())
+    print(f"[Zones] Adjacency: {len(adjacency.indices) // 2} shared borders")
+
+
+if __name__ == "__main__":
+    main()
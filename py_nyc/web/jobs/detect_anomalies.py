@@ -0,0 +1,37 @@
+"""
+Flag zone hours whose trip requests deviate strongly from the zone's usual demand at that
+hour of week, over every ingested month of a dataset, and publish them as the anomaly index
+served by /trips/anomalies. Run after every ingestion.
+
+Usage:
+    python -m py_nyc.web.jobs.detect_anomalies --dataset hvfhv
+"""
+import argparse
+from py_nyc.web.core.config import load_env_file
+from py_nyc.web.data_access.store.anomalies import ANOMALY_SCORE, AnomalyIndex
+from py_nyc.web.data_access.store.local_trip_store import TripDataNotIngestedError, get_local_trip_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect demand anomalies in the ingested trip aggregates.")
+    parser.add_argument("--dataset", default="hvfhv", help="Dataset key, e.g. hvfhv, yellow, green, fhv")
+    parser.add_argument("--min-score", type=float, default=ANOMALY_SCORE,
+                        help="Modified z-score above which a zone hour is flagged")
+    args = parser.parse_args()
+
+    load_env_file()
+
+    store = get_local_trip_store()
+    months = store.months(args.dataset)
+    if not months:
+        raise TripDataNotIngestedError(f"No trip data has been ingested for dataset '{args.dataset}'")
+
+    index = AnomalyIndex.build(store.load_cubes(args.dataset, months), args.min_score)
+    store.write_anomalies(args.dataset, index)
+    spikes = int((index["score"] > 0).sum())
+    print(f"[Anomalies] {args.dataset} {months[0]:%Y-%m}..{months[-1]:%Y-%m}: "
+          f"{spikes} spikes and {len(index) - spikes} drops flagged")
+
+
+if __name__ == "__main__":
+    main()
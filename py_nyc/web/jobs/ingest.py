@@ -0,0 +1,73 @@
+"""
+Ingest TLC trip data into the local trip store, one month at a time.
+
+Usage:
+    python -m py_nyc.web.jobs.ingest --dataset hvfhv --start 2023-01 --end 2023-03
+    python -m py_nyc.web.jobs.ingest --dataset hvfhv --start 2023-01 --rebuild
+    python -m py_nyc.web.jobs.ingest --dataset hvfhv --start 2023-01 --rebuild --mongo
+"""
+import argparse
+import asyncio
+from datetime import date, datetime
+from typing import List
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from py_nyc.web.core.config import get_settings, load_env_file
+from py_nyc.web.core.ingestion_logic import IngestionLogic
+from py_nyc.web.data_access.models.trip_aggregate import TripAggregateMonth, ZoneHourAggregate
+from py_nyc.web.data_access.services.trip_aggregate_service import TripAggregateService
+from py_nyc.web.data_access.store.local_trip_store import LocalTripStore, get_local_trip_store, months_between, next_month
+from py_nyc.web.external.tlc_datasets import TlcDataset, get_dataset
+
+
+async def load_into_mongo(store: LocalTripStore, dataset: TlcDataset, months: List[date]) -> None:
+    """Copy the hourly cubes of ingested months into the MongoDB aggregates collection."""
+    settings = get_settings()
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    try:
+        db = client.get_database(settings.mongodb_db_name)
+        await init_beanie(database=db, document_models=[ZoneHourAggregate, TripAggregateMonth])
+        service = TripAggregateService(db)
+        for month in months:
+            cube = store.load_cubes(dataset.key, [month])[0]
+            cells = await service.replace_month(dataset.key, month, cube, store.read_meta(dataset.key, month)["rows"])
+            print(f"[Ingest] {dataset.key} {month:%Y-%m}: {cells} zone hours loaded into MongoDB")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest TLC trip data into the local trip store.")
+    parser.add_argument("--dataset", default="hvfhv", help="Dataset key, e.g. hvfhv, yellow, green, fhv")
+    parser.add_argument("--start", required=True, help="First month to ingest (YYYY-MM)")
+    parser.add_argument("--end", help="Last month to ingest (YYYY-MM), defaults to --start")
+    parser.add_argument("--page-size", type=int, default=50000, help="Rows per SODA request")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild aggregates from already ingested columns instead of downloading")
+    parser.add_argument("--mongo", action="store_true",
+                        help="Also load the hourly aggregates into MongoDB for nodes without the local store")
+    args = parser.parse_args()
+
+    load_env_file()
+
+    dataset = get_dataset(args.dataset)
+    first = datetime.strptime(args.start, "%Y-%m")
+    last = next_month(datetime.strptime(args.end or args.start, "%Y-%m").date())
+
+    store = get_local_trip_store()
+    ingestion_logic = IngestionLogic(store)
+    months = months_between(first, datetime(last.year, last.month, 1))
+    for month in months:
+        if args.rebuild:
+            meta = ingestion_logic.rebuild_month(dataset, month)
+        else:
+            meta = ingestion_logic.ingest_month(dataset, month, args.page_size)
+        quarantined = (meta["validation"] or {}).get("rows_quarantined", 0)
+        print(f"[Ingest] {dataset.key} {meta['month']}: {meta['rows']} rows stored, {quarantined} quarantined")
+
+    if args.mongo:
+        asyncio.run(load_into_mongo(store, dataset, months))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Compress the static files served by /static with gzip and brotli at the highest level and
+write them to STATIC_BUILD_DIR. Run on deploy; API processes compress missing files
+themselves at startup, faster but larger.
+
+Usage:
+    python -m py_nyc.web.jobs.precompress_static
+"""
+import argparse
+from py_nyc.web.core.config import load_env_file
+from py_nyc.web.data_access.store.taxi_zones import get_taxi_zones_file
+from py_nyc.web.utils.precompressed import BROTLI_QUALITY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompress the static files.")
+    parser.add_argument("--brotli-quality", type=int, default=BROTLI_QUALITY)
+    args = parser.parse_args()
+
+    load_env_file()
+
+    static_file = get_taxi_zones_file()
+    sizes = static_file.build(args.brotli_quality, rebuild=True)
+    original = static_file.source.stat().st_size
+    for encoding, size in sizes.items():
+        print(f"[Static] {static_file.source.name} {encoding}: {size / 1024:.0f} KiB ({size / original:.0%} of {original / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
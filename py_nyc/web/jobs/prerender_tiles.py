@@ -0,0 +1,42 @@
+"""
+Render the taxi zone vector tiles of a dataset at the zooms the map uses into TILE_DIR, for the
+current data version, and remove the tiles of older versions. Run after every ingestion;
+tiles of other zooms, presets or hours are rendered by the API on request.
+
+Usage:
+    python -m py_nyc.web.jobs.prerender_tiles --dataset hvfhv --preset last-month
+"""
+import argparse
+import asyncio
+from py_nyc.web.core.config import load_env_file
+from py_nyc.web.core.earnings_logic import EarningsLogic
+from py_nyc.web.core.snapshot_logic import SnapshotLogic
+from py_nyc.web.core.tiles_logic import DEFAULT_TILE_PRESET, TILE_ZOOMS, TilesLogic, get_tile_cache, get_zone_values_cache
+from py_nyc.web.core.trips_logic import TripsLogic
+from py_nyc.web.data_access.services.trip_service import TripService
+from py_nyc.web.data_access.store.local_trip_store import get_local_trip_store
+from py_nyc.web.data_access.store.snapshot_store import get_snapshot_store
+from py_nyc.web.data_access.store.vector_tiles import get_tile_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render taxi zone vector tiles.")
+    parser.add_argument("--dataset", default="hvfhv", help="Dataset key, e.g. hvfhv, yellow, green, fhv")
+    parser.add_argument("--preset", action="append", help=f"Preset to render, repeatable (default: {DEFAULT_TILE_PRESET})")
+    parser.add_argument("--min-zoom", type=int, default=TILE_ZOOMS[0])
+    parser.add_argument("--max-zoom", type=int, default=TILE_ZOOMS[-1])
+    args = parser.parse_args()
+
+    load_env_file()
+
+    trip_service = TripService(get_local_trip_store())
+    snapshot_logic = SnapshotLogic(TripsLogic(trip_service), EarningsLogic(trip_service),
+                                   get_local_trip_store(), get_snapshot_store())
+    tiles_logic = TilesLogic(snapshot_logic, get_tile_store(), get_tile_cache(), get_zone_values_cache())
+    for preset in args.preset or [DEFAULT_TILE_PRESET]:
+        written = asyncio.run(tiles_logic.prerender(range(args.min_zoom, args.max_zoom + 1), preset, dataset=args.dataset))
+        print(f"[Tiles] {args.dataset} {preset}: {written} tiles written")
+
+
+if __name__ == "__main__":
+    main()
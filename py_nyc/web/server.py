@@ -1,3 +1,4 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from beanie import init_beanie
@@ -13,6 +14,11 @@ from py_nyc.web.api.cloudinary_router import cloudinary_router
 from py_nyc.web.api.waitlist_router import waitlist_router
 from py_nyc.web.api.feedback_router import feedback_router
 from py_nyc.web.api.payments_router import payments_router
+from py_nyc.web.api.drivers_router import drivers_router
+from py_nyc.web.api.jobs_router import jobs_router
+from py_nyc.web.api.zones_router import zones_router
+from py_nyc.web.api.tiles_router import tiles_router
+from py_nyc.web.api.static_router import static_router
 from py_nyc.web.data_access.models.listing import Listing, Vehicle, Plate
 from py_nyc.web.data_access.models.user import User
 from py_nyc.web.data_access.models.waitlist import Waitlist
@@ -20,7 +26,14 @@ from py_nyc.web.data_access.models.feedback import Feedback
 from py_nyc.web.data_access.models.payment import Payment
 from py_nyc.web.data_access.models.email import Email
 from py_nyc.web.data_access.models.password_reset import PasswordResetToken
-from py_nyc.web.dependencies import get_client, get_db
+from py_nyc.web.data_access.models.driver_trip import DriverTrip, DriverTripKey, DriverHourlyEarnings
+from py_nyc.web.data_access.models.trip_aggregate import ZoneHourAggregate, TripAggregateMonth
+from py_nyc.web.data_access.models.analytics_job import AnalyticsJobRecord
+from py_nyc.web.data_access.store.taxi_zones import get_taxi_zones_file
+from py_nyc.web.data_access.store.zone_adjacency import get_zone_adjacency
+from py_nyc.web.data_access.store.zone_index import get_zone_index
+from py_nyc.web.dependencies import get_analytics_jobs, get_client, get_db
+from py_nyc.web.utils.precompressed import STARTUP_BROTLI_QUALITY
 from py_nyc.web.core.config import get_settings
 
 # Load environment-specific .env file
@@ -57,10 +70,19 @@ async def db_lifespan(app: FastAPI):
         print("Connected to database.")
         
         # Initialize Beanie
-        await init_beanie(database=db, document_models=[Listing, Vehicle, Plate, User, Waitlist, Feedback, Payment, Email, PasswordResetToken])
+        await init_beanie(database=db, document_models=[Listing, Vehicle, Plate, User, Waitlist, Feedback, Payment, Email, PasswordResetToken, DriverTrip, DriverTripKey,
+                                                        DriverHourlyEarnings, ZoneHourAggregate, TripAggregateMonth, AnalyticsJobRecord])
+
+        # Build the point to zone index and the zone adjacency before the first request needs them
+        get_zone_index()
+        get_zone_adjacency()
+        # Compress static files the precompress_static job has not, at a faster brotli quality
+        await asyncio.to_thread(get_taxi_zones_file().build, STARTUP_BROTLI_QUALITY)
+        get_analytics_jobs().start()
         
         yield
     finally:
+        await get_analytics_jobs().stop()
         # Close the client when the app shuts down
         client = get_client()
         client.close()
@@ -83,6 +105,11 @@ server.include_router(cloudinary_router)
 server.include_router(waitlist_router)
 server.include_router(feedback_router)
 server.include_router(payments_router)
+server.include_router(drivers_router)
+server.include_router(jobs_router)
+server.include_router(zones_router)
+server.include_router(tiles_router)
+server.include_router(static_router)
 
 if __name__ == '__main__':
     uvicorn.run(server, host='localhost', port=8000)
@@ -0,0 +1,77 @@
+import io
+from typing import AsyncIterator, Dict, Iterable
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import StreamingResponse
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows per record batch (Arrow) or row group (Parquet), bounds what is encoded at once
+EXPORT_BATCH_ROWS = 65536
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what the writer produced since the last drain, for streaming it out."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet footers hold absolute offsets, so the position keeps counting across drains
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def record_batches(columns: Dict[str, np.ndarray], schema: pa.Schema) -> Iterable[pa.RecordBatch]:
+    """Column arrays as record batches of at most EXPORT_BATCH_ROWS rows. Numeric columns are not copied."""
+    batch = pa.RecordBatch.from_arrays([pa.array(columns[field.name], type=field.type) for field in schema], schema=schema)
+    for offset in range(0, batch.num_rows, EXPORT_BATCH_ROWS):
+        yield batch.slice(offset, EXPORT_BATCH_ROWS)
+
+
+async def _encode(batches: AsyncIterator[Dict[str, np.ndarray]], schema: pa.Schema, format: str) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    if format == "parquet":
+        # One row group per batch
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+
+    async for columns in batches:
+        for batch in record_batches(columns, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def arrow_response(batches: AsyncIterator[Dict[str, np.ndarray]], schema: pa.Schema, format: str, filename: str) -> StreamingResponse:
+    """
+    Stream column batches as an Arrow IPC stream or a Parquet file, encoding and sending each
+    batch before the next one is produced. `format` is "arrow" or "parquet".
+    """
+    extension = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(_encode(batches, schema, format), media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'})
+
+
+async def single_batch(columns: Dict[str, np.ndarray]) -> AsyncIterator[Dict[str, np.ndarray]]:
+    """Columns already in memory, as the batches arrow_response takes."""
+    yield columns